@@ -0,0 +1,74 @@
+"""This file contains the definition of the <ConcurrencyController> class,
+which adapts the number of requests sent simultaneously to TickTick's API
+(additive increase while the API is healthy, multiplicative decrease when it
+is overloaded)"""
+
+import threading
+import time
+
+
+class ConcurrencyController:
+    LATENCY_TARGET = 1.0  # Latency (in seconds) under which the API is healthy
+    DECREASE_FACTOR = 0.5  # Factor applied to the limit when the API is overloaded
+    DECREASE_INTERVAL = 1.0  # Minimal delay (in seconds) between two decreases
+    LATENCY_SMOOTHING = 0.2  # Weight of the last request in the average latency
+
+    def __init__(self, initial_limit, max_limit, min_limit=1):
+        """Allows <initial_limit> requests in flight at first, the limit then
+        moving between <min_limit> and <max_limit>"""
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+
+        # Moving average of the latency of the requests served (<None> until
+        # one has been), from which the duration of the operations is estimated
+        self.average_latency = None
+
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def in_flight(self):
+        """Number of requests currently in flight"""
+        return self._in_flight
+
+    def acquire(self):
+        """Blocks until a request can be sent without exceeding the limit"""
+
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+
+            self._in_flight += 1
+
+    def release(self, latency=None, overloaded=False):
+        """Records the end of a request, <latency> being its duration (<None>
+        if it failed) and <overloaded> whether the API asked us to slow down.
+        A slow request that did not overload the API leaves the limit as is"""
+
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+
+            if latency is not None:
+                self.average_latency = (
+                    latency
+                    if self.average_latency is None
+                    else self.average_latency
+                    + self.LATENCY_SMOOTHING * (latency - self.average_latency)
+                )
+
+            if overloaded:
+                # All the requests in flight are likely to fail as well, so we
+                # only decrease the limit once per interval
+                if now - self._last_decrease >= self.DECREASE_INTERVAL:
+                    self.limit = max(self.min_limit, self.limit * self.DECREASE_FACTOR)
+                    self._last_decrease = now
+
+            elif latency is not None and latency <= self.LATENCY_TARGET:
+                # The limit grows by about one request per round trip
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self._condition.notify_all()
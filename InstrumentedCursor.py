@@ -0,0 +1,79 @@
+"""This file contains the definition of the <InstrumentedCursor> class, a
+wrapper of an SQLite cursor recording the duration of each query in
+<Metrics> (the time spent fetching the rows included)"""
+
+import time
+
+from Metrics import Metrics
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        """Wraps <cursor>, which is used for everything else"""
+
+        self._cursor = cursor
+        self._statement = None  # Statement whose rows are being fetched
+        self._duration = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, statement, parameters=()):
+        return self._run(self._cursor.execute, statement, parameters)
+
+    def executemany(self, statement, parameters):
+        return self._run(self._cursor.executemany, statement, parameters)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchmany(self, size):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        self._duration += time.perf_counter() - start
+
+        # The statement is over once its last rows have been fetched
+        if len(rows) < size:
+            self._record()
+
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _run(self, method, statement, parameters):
+        """Runs a statement, the former one being recorded first"""
+
+        self._record()
+
+        start = time.perf_counter()
+        method(statement, parameters)
+
+        self._statement = statement
+        self._duration = time.perf_counter() - start
+
+        # A statement returning no rows is over already
+        if self._cursor.description is None:
+            self._record()
+
+        return self
+
+    def _fetch(self, method):
+        """Fetches rows of the current statement, which is then recorded"""
+
+        start = time.perf_counter()
+        rows = method()
+        self._duration += time.perf_counter() - start
+
+        self._record()
+        return rows
+
+    def _record(self):
+        """Records the duration of the current statement, if any"""
+
+        if self._statement is not None:
+            Metrics.record_query(self._statement, self._duration)
+            self._statement = None
@@ -0,0 +1,74 @@
+"""This file contains the definition of the <LRUCache> class, a bounded cache
+dropping the least recently used entries first, which counts its hits and
+misses (also recorded in <Metrics>)"""
+
+from collections import OrderedDict
+
+from Metrics import Metrics
+
+
+class LRUCache:
+    def __init__(self, name, max_size):
+        """Creates an empty cache holding at most <max_size> entries (<name>
+        labels its statistics)"""
+
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Returns the value cached under <key> (<None> if there is none)"""
+
+        value = self._entries.get(key)
+
+        if value is None:
+            self.misses += 1
+            Metrics.increment(
+                "storage_cache_requests_total",
+                (("cache", self.name), ("result", "miss")),
+            )
+            return None
+
+        self.hits += 1
+        Metrics.increment(
+            "storage_cache_requests_total", (("cache", self.name), ("result", "hit"))
+        )
+
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Caches <value> under <key>, dropping the least recently used entry
+        if the cache is full"""
+
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        """Drops the entries cached under <keys>, if any"""
+
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drops every entry"""
+        self._entries.clear()
+
+    def statistics(self):
+        """Returns a dictionary describing the use of the cache"""
+
+        requests_count = self.hits + self.misses
+
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests_count if requests_count > 0 else None,
+        }
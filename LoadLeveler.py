@@ -0,0 +1,220 @@
+"""This file contains the definition of the <LoadLeveler> class, which spreads
+the rehearsals of new tasks over the calendar : each rehearsal may be moved by
+a few days so that no day gets more rehearsals than a given capacity"""
+
+from datetime import date, timedelta
+
+
+class LoadLeveler:
+    TOLERANCE = 0.15  # Fraction of its delay by which a rehearsal may be moved
+    MAX_SHIFT = 7  # Maximum number of days by which a rehearsal may be moved
+    INITIAL_HORIZON = 512  # Number of days covered at first (doubled when needed)
+
+    def __init__(self, capacity, loads=None, first_date=None):
+        """Initialises the loads of the days from <first_date> (by default,
+        today), <loads> mapping dates to their number of rehearsals.
+        <capacity> is the number of rehearsals a day can take"""
+
+        self.capacity = capacity
+        self.first_date = first_date if first_date is not None else date.today()
+
+        # The loads are kept in a segment tree (the minimal load of each
+        # range of days), so that the least loaded day of a window is found
+        # without going through every day of it
+        self._size = LoadLeveler.INITIAL_HORIZON
+        self._tree = [0] * (2 * self._size)
+
+        for load_date, load in (loads or {}).items():
+            day = (load_date - self.first_date).days
+
+            if day >= 0:
+                self._add(day, load)
+
+    def level(self, schema, start_date=None):
+        """Returns a copy of <schema> (a list of delays, in days, from
+        <start_date>) where the rehearsals falling on a full day are moved to
+        the closest day under capacity, or else to the least loaded day, within
+        their tolerance window. The chronological order of the rehearsals is
+        kept, and the loads are updated with the rehearsals placed"""
+
+        if start_date is None:
+            start_date = self.first_date
+
+        offset = (start_date - self.first_date).days
+        leveled_schema = [None] * len(schema)
+        previous_delay, previous_day = None, offset - 1
+
+        # A schema may list its days in any order : the rehearsals are placed
+        # chronologically, each one keeping its position in the schema
+        for position in sorted(range(len(schema)), key=lambda i: schema[i]):
+            day_delay = schema[position]
+            target = offset + day_delay
+            shift = min(LoadLeveler.MAX_SHIFT, int(day_delay * LoadLeveler.TOLERANCE))
+
+            # A rehearsal cannot come before the former ones
+            lowest = previous_day if day_delay == previous_delay else previous_day + 1
+            low = max(target - shift, lowest, 0)
+            high = max(target + shift, low)
+            target = min(max(target, low), high)
+
+            day = self.place(target, low, high)
+            self._add(day, 1)
+
+            leveled_schema[position] = day - offset
+            previous_delay, previous_day = day_delay, day
+
+        return leveled_schema
+
+    def place(self, target, low, high):
+        """Returns the day on which a rehearsal due on <target> should fall,
+        between the days <low> and <high>"""
+
+        self._reserve(high)
+        target_load = self.load(target)
+
+        if target_load < self.capacity:
+            return target
+
+        threshold = self.capacity - 1
+
+        # Every day of the window is full : we fall back on the least loaded one
+        if self._min(low, high) > threshold:
+            threshold = self._min(low, high)
+
+            if threshold >= target_load:
+                return target
+
+        before = self._last(low, target - 1, threshold)
+        after = self._first(target + 1, high, threshold)
+
+        # Between two days as close, the earlier one is chosen
+        if after is None or before is not None and target - before <= after - target:
+            return before
+
+        return after
+
+    def load(self, day):
+        """Returns the number of rehearsals on a day (counted from the first one)"""
+        return self._tree[self._size + day] if day < self._size else 0
+
+    def histogram(self, first_date=None, last_date=None):
+        """Returns a list of tuples of the form (date, number of rehearsals), one
+        for each day between <first_date> and <last_date> (both included)"""
+
+        if first_date is None:
+            first_date = self.first_date
+
+        if last_date is None:
+            last_date = first_date + timedelta(days=30)
+
+        return [
+            (
+                first_date + timedelta(days=day),
+                self.load((first_date - self.first_date).days + day),
+            )
+            for day in range((last_date - first_date).days + 1)
+        ]
+
+    def _reserve(self, day):
+        """Makes the tree cover the given day, by doubling its size if needed"""
+
+        if day < self._size:
+            return
+
+        loads = self._tree[self._size :]
+
+        while day >= self._size:
+            self._size *= 2
+
+        self._tree = [0] * (2 * self._size)
+        self._tree[self._size : self._size + len(loads)] = loads
+
+        for node in range(self._size - 1, 0, -1):
+            self._tree[node] = min(self._tree[2 * node], self._tree[2 * node + 1])
+
+    def _add(self, day, count):
+        """Adds <count> rehearsals to a day, and updates the minimums above it"""
+
+        self._reserve(day)
+
+        node = self._size + day
+        self._tree[node] += count
+
+        while node > 1:
+            node //= 2
+            self._tree[node] = min(self._tree[2 * node], self._tree[2 * node + 1])
+
+    def _min(self, low, high):
+        """Returns the minimal load of the days between <low> and <high>"""
+
+        result = float("inf")
+        low += self._size
+        high += self._size + 1
+
+        while low < high:
+            if low % 2 == 1:
+                result = min(result, self._tree[low])
+                low += 1
+
+            if high % 2 == 1:
+                high -= 1
+                result = min(result, self._tree[high])
+
+            low //= 2
+            high //= 2
+
+        return result
+
+    def _first(self, low, high, threshold, node=1, node_low=0, node_high=None):
+        """Returns the first day between <low> and <high> whose load is at most
+        <threshold> (<None> if there is none)"""
+
+        if node_high is None:
+            node_high = self._size - 1
+
+        if (
+            high < low
+            or node_high < low
+            or high < node_low
+            or self._tree[node] > threshold
+        ):
+            return None
+
+        if node_low == node_high:
+            return node_low
+
+        middle = (node_low + node_high) // 2
+
+        day = self._first(low, high, threshold, 2 * node, node_low, middle)
+
+        if day is None:
+            day = self._first(low, high, threshold, 2 * node + 1, middle + 1, node_high)
+
+        return day
+
+    def _last(self, low, high, threshold, node=1, node_low=0, node_high=None):
+        """Returns the last day between <low> and <high> whose load is at most
+        <threshold> (<None> if there is none)"""
+
+        if node_high is None:
+            node_high = self._size - 1
+
+        if (
+            high < low
+            or node_high < low
+            or high < node_low
+            or self._tree[node] > threshold
+        ):
+            return None
+
+        if node_low == node_high:
+            return node_low
+
+        middle = (node_low + node_high) // 2
+
+        day = self._last(low, high, threshold, 2 * node + 1, middle + 1, node_high)
+
+        if day is None:
+            day = self._last(low, high, threshold, 2 * node, node_low, middle)
+
+        return day
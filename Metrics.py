@@ -0,0 +1,221 @@
+"""This file contains the definition of the <Metrics> class, which records
+where the time goes (latency histograms of the API calls and of the queries to
+the local database, counts by endpoint and status, retries and bytes
+transferred) and exports it as JSON or in the text format of Prometheus"""
+
+import json
+import re
+import sys
+import threading
+from urllib.parse import urlparse
+
+
+class Metrics:
+    # Upper bounds (in seconds) of the buckets of the latency histograms
+    HTTP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    STORAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+    # Descriptions of the metrics, exported along with them
+    DESCRIPTIONS = {
+        "http_request_duration_seconds": "Latency of the requests sent to TickTick",
+        "http_responses_total": "Responses received, by endpoint and status",
+        "http_errors_total": "Requests that failed without a response",
+        "http_retries_total": "Requests sent again, by reason",
+        "http_sent_bytes_total": "Bytes sent in request bodies",
+        "http_received_bytes_total": "Bytes received in response bodies",
+        "storage_query_duration_seconds": "Duration of the queries to the local database",
+        "storage_cache_requests_total": "Lookups in the caches of the local database, by result",
+    }
+
+    enabled = False  # Nothing is recorded until the metrics are enabled
+
+    _lock = threading.Lock()
+    _histograms = {}  # (name, labels) -> [count of each bucket, sum, count]
+    _counters = {}  # (name, labels) -> value
+
+    @classmethod
+    def enable(cls):
+        """Starts recording the metrics"""
+        cls.enabled = True
+
+    @classmethod
+    def observe(cls, name, labels, value, buckets):
+        """Records a value in a histogram (<labels> being a tuple of pairs)"""
+
+        if not cls.enabled:
+            return
+
+        with cls._lock:
+            histogram = cls._histograms.setdefault(
+                (name, labels), [0] * len(buckets) + [0.0, 0]
+            )
+
+            # The buckets are cumulative, as in Prometheus
+            for index, upper_bound in enumerate(buckets):
+                if value <= upper_bound:
+                    histogram[index] += 1
+
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @classmethod
+    def increment(cls, name, labels, value=1):
+        """Adds <value> to a counter (<labels> being a tuple of pairs)"""
+
+        if not cls.enabled:
+            return
+
+        with cls._lock:
+            cls._counters[(name, labels)] = cls._counters.get((name, labels), 0) + value
+
+    @staticmethod
+    def endpoint(method, url):
+        """Returns the labels identifying the endpoint of a request (the IDs in
+        its path are replaced, so that all the calls to an endpoint add up)"""
+
+        path = re.sub(r"/(project|task)/[^/]+", r"/\1/{id}", urlparse(url).path)
+        return (("method", method.upper()), ("endpoint", path))
+
+    @classmethod
+    def record_response(cls, response, *args, **kwargs):
+        """Response hook of the HTTP session, recording every response"""
+
+        if not cls.enabled:
+            return
+
+        labels = cls.endpoint(response.request.method, response.request.url)
+        body = response.request.body or b""
+
+        if isinstance(body, str):
+            body = body.encode("utf8")
+
+        cls.observe(
+            "http_request_duration_seconds",
+            labels,
+            response.elapsed.total_seconds(),
+            cls.HTTP_BUCKETS,
+        )
+        cls.increment(
+            "http_responses_total", labels + (("status", str(response.status_code)),)
+        )
+        cls.increment("http_sent_bytes_total", labels, len(body))
+        cls.increment("http_received_bytes_total", labels, len(response.content))
+
+    @classmethod
+    def record_query(cls, statement, duration):
+        """Records the duration of a query to the local database, labelled with
+        its kind and the table it works on"""
+
+        if not cls.enabled:
+            return
+
+        match = re.search(
+            r"^\s*(\w+)(?:.*?\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?|ON)\s+(\w+))?",
+            statement,
+            re.IGNORECASE | re.DOTALL,
+        )
+        labels = (
+            ("statement", match[1].upper() if match else "UNKNOWN"),
+            ("table", match[2] if match and match[2] else ""),
+        )
+
+        cls.observe(
+            "storage_query_duration_seconds", labels, duration, cls.STORAGE_BUCKETS
+        )
+
+    @classmethod
+    def to_dict(cls):
+        """Returns every metric recorded, as a JSON serialisable dictionary"""
+
+        with cls._lock:
+            metrics = {name: [] for name in cls.DESCRIPTIONS}
+
+            for (name, labels), value in sorted(cls._counters.items()):
+                metrics[name].append({"labels": dict(labels), "value": value})
+
+            for (name, labels), histogram in sorted(cls._histograms.items()):
+                buckets = cls.buckets(name)
+                metrics[name].append(
+                    {
+                        "labels": dict(labels),
+                        "count": histogram[-1],
+                        "sum": histogram[-2],
+                        "buckets": dict(zip(map(str, buckets), histogram[:-2])),
+                    }
+                )
+
+        return metrics
+
+    @classmethod
+    def to_prometheus(cls):
+        """Returns every metric recorded, in the text format of Prometheus"""
+
+        lines = []
+        metrics = cls.to_dict()
+
+        for name, samples in metrics.items():
+            if len(samples) == 0:
+                continue
+
+            kind = "histogram" if "count" in samples[0] else "counter"
+            lines.append(f"# HELP {name} {cls.DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for sample in samples:
+                labels = sample["labels"]
+
+                if kind == "counter":
+                    lines.append(f"{name}{cls.format_labels(labels)} {sample['value']}")
+                    continue
+
+                for upper_bound, count in sample["buckets"].items():
+                    bucket_labels = dict(labels, le=upper_bound)
+                    lines.append(
+                        f"{name}_bucket{cls.format_labels(bucket_labels)} {count}"
+                    )
+
+                bucket_labels = dict(labels, le="+Inf")
+                lines.append(
+                    f"{name}_bucket{cls.format_labels(bucket_labels)} {sample['count']}"
+                )
+                lines.append(f"{name}_sum{cls.format_labels(labels)} {sample['sum']}")
+                lines.append(
+                    f"{name}_count{cls.format_labels(labels)} {sample['count']}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def buckets(cls, name):
+        """Returns the buckets of a histogram"""
+        return cls.HTTP_BUCKETS if name.startswith("http_") else cls.STORAGE_BUCKETS
+
+    @staticmethod
+    def format_labels(labels):
+        """Formats labels the way Prometheus expects them"""
+
+        if len(labels) == 0:
+            return ""
+
+        escaped_labels = (
+            (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for key, value in labels.items()
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped_labels) + "}"
+
+    @classmethod
+    def export(cls, output_format="json", path=None):
+        """Writes the metrics in the given format (<json> or <prometheus>) to
+        the file at <path> (by default, to the standard error)"""
+
+        if output_format == "prometheus":
+            content = cls.to_prometheus()
+        else:
+            content = json.dumps(cls.to_dict(), indent=2) + "\n"
+
+        if path is None:
+            sys.stderr.write(content)
+            return
+
+        with open(path, "w", encoding="utf8") as file:
+            file.write(content)
@@ -0,0 +1,250 @@
+"""This file contains the definition of the <OutboxWorker> class, which sends
+the operations journaled in the outbox of the local database to TickTick,
+in the background and with retries"""
+
+import threading
+import time
+from datetime import date, datetime
+
+from colorama import Fore
+
+from StorageManager import StorageManager
+
+
+class OutboxWorker(threading.Thread):
+    BATCH_SIZE = 50  # Number of operations fetched from the outbox at once
+    RETRY_DELAY = 2  # Delay (in seconds) before the first retry, doubled each time
+    MAX_RETRY_DELAY = 300
+    IDLE_POLL_DELAY = 60  # Delay between two checks of the outbox when idle
+    ERRORS_SHOWN = 10  # Number of failed operations listed in the reports
+
+    def __init__(self, api_client):
+        """Initialises the worker, which has to be started to drain the outbox"""
+
+        super().__init__(daemon=True)
+
+        self.api_client = api_client
+
+        self._wake_up = threading.Event()  # Set when new operations are journaled
+        self._idle = threading.Event()  # Set when no operation is ready to be sent
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def notify(self):
+        """Tells the worker that new operations have been journaled"""
+        with self._lock:
+            self._idle.clear()
+            self._wake_up.set()
+
+    def wait_idle(self, timeout=None):
+        """Waits until every operation ready to be sent has been sent (or
+        postponed after a failure). Returns <False> if the timeout expired"""
+        return self._idle.wait(timeout)
+
+    def wait_with_progress(self, storage_manager, progress_delay=1):
+        """Waits until every operation ready to be sent has been sent (or
+        postponed after a failure), printing the progress meanwhile. Returns the
+        number of operations still pending"""
+
+        start = time.perf_counter()
+        initial_pending_count = storage_manager.count_pending_operations()
+
+        while True:
+            idle = self.wait_idle(progress_delay)
+            pending_count = storage_manager.count_pending_operations()
+            sent_count = max(initial_pending_count - pending_count, 0)
+            elapsed = max(time.perf_counter() - start, 1e-6)
+
+            print(
+                Fore.YELLOW
+                + f"\r{sent_count} opération(s) sur {initial_pending_count} envoyée(s) ({sent_count / elapsed:.1f} requêtes/s)",
+                end="",
+                flush=True,
+            )
+
+            if idle or pending_count == 0:
+                break
+
+        print()
+
+        if pending_count > 0:
+            OutboxWorker.report_errors(storage_manager)
+            print(
+                Fore.RED
+                + f"{pending_count} opération(s) en échec, nouvel essai en arrière-plan"
+            )
+
+        return pending_count
+
+    @staticmethod
+    def report_errors(storage_manager):
+        """Prints the errors of the failed operations still journaled (the
+        first ones only, see <ERRORS_SHOWN>)"""
+
+        for error, attempts in storage_manager.fetch_operations_errors(
+            OutboxWorker.ERRORS_SHOWN
+        ):
+            print(Fore.RED + f"Erreur : {error} ({attempts} essai(s))")
+
+    def stop(self):
+        """Stops the worker (the operations left will be sent on next start)"""
+        self._stopping.set()
+        self._wake_up.set()
+
+    def run(self):
+        """Drains the outbox until the worker is stopped. SQLite connections
+        cannot be shared between threads, so the worker has its own one"""
+
+        storage_manager = StorageManager()
+
+        while not self._stopping.is_set():
+            self._wake_up.clear()
+
+            if self.flush(storage_manager) > 0:
+                continue
+
+            # Nothing is ready : we sleep until the next retry or a notification
+            with self._lock:
+                if self._wake_up.is_set():
+                    continue
+
+                self._idle.set()
+
+            next_attempt_at = storage_manager.next_attempt_date()
+
+            if next_attempt_at is None:
+                delay = OutboxWorker.IDLE_POLL_DELAY
+            else:
+                delay = max(next_attempt_at - datetime.now().timestamp(), 0.1)
+
+            self._wake_up.wait(min(delay, OutboxWorker.IDLE_POLL_DELAY))
+
+    def flush(self, storage_manager):
+        """Sends one batch of ready operations and returns its size"""
+
+        operations = storage_manager.fetch_ready_operations(OutboxWorker.BATCH_SIZE)
+
+        if len(operations) == 0:
+            return 0
+
+        storage_manager.start_attempts([operation["id"] for operation in operations])
+
+        creations = [op for op in operations if op["operation"] == "create"]
+        updates = [op for op in operations if op["operation"] == "update"]
+        deletions = [op for op in operations if op["operation"] == "delete"]
+
+        # The creations are sent concurrently...
+        adopted_ids = self.find_created_rehearsals(storage_manager, creations)
+        results = self.api_client.map_concurrently(
+            lambda operation: (
+                (adopted_ids[operation["id"]], False)
+                if operation["id"] in adopted_ids
+                else self.api_client.send_task_creation(operation["payload"])
+            ),
+            creations,
+        )
+
+        for operation, (task_ID, uncertain) in zip(creations, results):
+            if task_ID is None:
+                self.postpone(
+                    storage_manager, operation, "impossible de créer", uncertain
+                )
+
+            elif not storage_manager.complete_operation(operation["id"], task_ID):
+                # The task has been deleted while its rehearsal was being created
+                storage_manager.queue_remote_deletion(
+                    operation["payload"]["projectId"], task_ID
+                )
+
+        # ... and so are the updates (moved rehearsals)...
+        updated = self.api_client.map_concurrently(
+            lambda operation: self.api_client.try_update_task(operation["payload"]),
+            updates,
+        )
+
+        for operation, success in zip(updates, updated):
+            if success:
+                storage_manager.complete_operation(operation["id"])
+            else:
+                self.postpone(storage_manager, operation, "impossible de déplacer")
+
+        # ... and the deletions, grouped by project
+        tasks_ids_by_project = {}
+
+        for operation in deletions:
+            tasks_ids_by_project.setdefault(
+                operation["payload"]["projectId"], []
+            ).append(operation["payload"]["id"])
+
+        failures = set(self.api_client.bulk_delete_tasks(tasks_ids_by_project))
+
+        for operation in deletions:
+            payload = operation["payload"]
+
+            if (payload["projectId"], payload["id"]) in failures:
+                self.postpone(storage_manager, operation, "impossible de supprimer")
+            else:
+                storage_manager.complete_operation(operation["id"])
+
+        return len(operations)
+
+    def find_created_rehearsals(self, storage_manager, creations):
+        """Looks for the rehearsals that a former attempt may have created on
+        TickTick (it ended without a response, or the app stopped meanwhile),
+        so that they are not duplicated. Returns their IDs, by operation ID.
+        Tasks with the same title and day are common, so a task already owned
+        by another rehearsal is never adopted"""
+
+        in_doubt = [operation for operation in creations if operation["in_doubt"]]
+        candidates = self.api_client.map_concurrently(
+            lambda operation: self.api_client.find_tasks(operation["payload"]),
+            in_doubt,
+        )
+        adopted_ids = {}
+
+        for operation, tasks_ids in zip(in_doubt, candidates):
+            for task_ID in tasks_ids:
+                if (
+                    task_ID not in adopted_ids.values()
+                    and storage_manager.fetch_task_by_remote_id(task_ID) is None
+                ):
+                    adopted_ids[operation["id"]] = task_ID
+                    break
+
+        return adopted_ids
+
+    @staticmethod
+    def describe(operation):
+        """Returns the name of the rehearsal an operation is about, from the
+        fields of its payload, for the error messages"""
+
+        payload = operation["payload"]
+        name = "la répétition"
+
+        if payload.get("id") is not None:
+            name += f" {payload['id']}"
+
+        if payload.get("title") is not None:
+            name += f" de « {payload['title']} »"
+
+        if payload.get("startDate") is not None:
+            due_date = date.fromisoformat(payload["startDate"][:10])
+            name += f" du {due_date.strftime('%d/%m/%Y')}"
+
+        return name
+
+    @staticmethod
+    def postpone(storage_manager, operation, error, in_doubt=False):
+        """Schedules the retry of a failed operation, with an exponential
+        backoff (<in_doubt> telling whether it may have been carried out).
+        <error> is completed with the name of the rehearsal, and is reported
+        along with the other ones (see <report_errors>)"""
+
+        error = f"{error} {OutboxWorker.describe(operation)}"
+        delay = min(
+            OutboxWorker.RETRY_DELAY * 2 ** operation["attempts"],
+            OutboxWorker.MAX_RETRY_DELAY,
+        )
+        storage_manager.postpone_operation(
+            operation["id"], int(datetime.now().timestamp() + delay), error, in_doubt
+        )
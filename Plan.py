@@ -0,0 +1,113 @@
+"""This file contains the definition of the <Plan> class, which describes an
+operation on the tasks before it is executed : the requests it will send to
+TickTick, the dates it will write and how long it should take"""
+
+from collections import Counter
+
+from colorama import Fore
+
+
+class Plan:
+    DEFAULT_LATENCY = 0.3  # Latency (in seconds) assumed before any request is sent
+
+    # Names of the kinds of requests, in the reports
+    REQUESTS_NAMES = {
+        "create": "création(s)",
+        "update": "modification(s)",
+        "delete": "suppression(s)",
+    }
+
+    def __init__(self, description, execute):
+        """Creates an empty plan, <execute> being the function carrying the
+        operation out (called without arguments, its result being returned
+        by <execute>)"""
+
+        self.description = description
+        self.requests = {kind: 0 for kind in Plan.REQUESTS_NAMES}
+        self.dates = Counter()  # Number of rehearsals written on each date
+        self.details = {}  # Other facts about the operation, by name
+        self.executed = False
+
+        self._execute = execute
+
+    def add(self, kind, task_date=None, count=1):
+        """Adds <count> requests of the given kind (<create>, <update> or
+        <delete>) to the plan, writing rehearsals on <task_date> if given"""
+
+        self.requests[kind] += count
+
+        if task_date is not None:
+            self.dates[task_date] += count
+
+    @property
+    def requests_count(self):
+        """Total number of requests the operation will send"""
+        return sum(self.requests.values())
+
+    def estimated_duration(self, profile):
+        """Returns the time (in seconds) the requests should take. <profile>
+        gives the pace of the rate limiter (<rate> requests per second after a
+        <burst>), the number of requests sent simultaneously (<concurrency>)
+        and their <latency>"""
+
+        throughput = min(profile["rate"], profile["concurrency"] / profile["latency"])
+        burst_count = min(self.requests_count, profile["burst"])
+
+        return (
+            burst_count * profile["latency"] / profile["concurrency"]
+            + (self.requests_count - burst_count) / throughput
+        )
+
+    def as_dict(self, profile):
+        """Returns the plan as a JSON serialisable dictionary (see
+        <estimated_duration> for <profile>)"""
+
+        return {
+            "description": self.description,
+            "requests": dict(self.requests, total=self.requests_count),
+            "dates": {
+                task_date.isoformat(): count
+                for task_date, count in sorted(self.dates.items())
+            },
+            "estimated_duration_s": round(self.estimated_duration(profile), 1),
+            "profile": profile,
+            **self.details,
+        }
+
+    def report(self, profile):
+        """Prints the plan (see <estimated_duration> for <profile>)"""
+
+        print(Fore.YELLOW + f"{self.description} :")
+        print(
+            Fore.YELLOW
+            + f"  {self.requests_count} requête(s) : "
+            + ", ".join(
+                f"{self.requests[kind]} {name}"
+                for kind, name in Plan.REQUESTS_NAMES.items()
+            )
+        )
+
+        if len(self.dates) > 0:
+            busiest_date, busiest_count = self.dates.most_common(1)[0]
+            print(
+                Fore.YELLOW
+                + f"  {sum(self.dates.values())} répétition(s) du {min(self.dates).strftime('%d/%m/%Y')} "
+                + f"au {max(self.dates).strftime('%d/%m/%Y')} (jusqu'à {busiest_count} "
+                + f"le {busiest_date.strftime('%d/%m/%Y')})"
+            )
+
+        minutes, seconds = divmod(round(self.estimated_duration(profile)), 60)
+        print(
+            Fore.YELLOW
+            + f"  Durée estimée : {f'{minutes} min ' if minutes > 0 else ''}{seconds} s "
+            + f"({profile['rate']:g} requêtes/s au plus, {profile['latency'] * 1000:.0f} ms par requête)"
+        )
+
+    def execute(self):
+        """Carries the operation out (only once) and returns its result"""
+
+        if self.executed:
+            raise RuntimeError("this plan has already been executed")
+
+        self.executed = True
+        return self._execute()
@@ -0,0 +1,56 @@
+"""This file contains the definition of the <RateLimiter> class, a token bucket
+pacing the requests sent to TickTick's API from any number of threads"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        """Allows <rate> requests per second on average, and up to <burst>
+        requests at once after an idle period (by default, <rate>)"""
+
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, delay):
+        """Holds every request back for <delay> seconds (e.g. when the API
+        answered with a <Retry-After> header)"""
+
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def acquire(self):
+        """Blocks until a request can be sent, and consumes a token"""
+
+        while True:
+            with self._lock:
+                self._refill()
+                pause = self._paused_until - time.monotonic()
+
+                if pause > 0:
+                    delay = pause
+
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                else:
+                    # Time needed for the missing fraction of token to be refilled
+                    delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+
+    def _refill(self):
+        """Adds the tokens earned since the last refill"""
+
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
@@ -0,0 +1,29 @@
+"""This file contains the definition of the <RehearsalRecord> class, a compact
+read-only record of a rehearsal of a task read from the local database"""
+
+
+class RehearsalRecord:
+    # Without a dictionary per instance, a record only holds its fields
+    __slots__ = ("remote_id", "due_date", "state", "project_id")
+
+    def __init__(self, remote_id, due_date, state, project_id):
+        """Initialises the fields : <remote_id> is <None> while the rehearsal
+        has not been created on TickTick, and <project_id> is the project it
+        belongs to there (<None> for a new rehearsal, which belongs to the
+        project of its task). The records are shared with the cache, so they
+        must not be changed"""
+
+        self.remote_id = remote_id
+        self.due_date = due_date
+        self.state = state
+        self.project_id = project_id
+
+    def __repr__(self):
+        return (
+            f"RehearsalRecord(remote_id={self.remote_id!r}, due_date={self.due_date!r}, "
+            f"state={self.state!r}, project_id={self.project_id!r})"
+        )
+
+    def moved(self, due_date):
+        """Returns a copy of the rehearsal, due on another date"""
+        return RehearsalRecord(self.remote_id, due_date, self.state, self.project_id)
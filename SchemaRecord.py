@@ -0,0 +1,24 @@
+"""This file contains the definition of the <SchemaRecord> class, a compact
+read-only record of a rehearsal schema read from the local database"""
+
+
+class SchemaRecord:
+    # Without a dictionary per instance, a record only holds its fields
+    __slots__ = ("id", "name", "schema")
+
+    def __init__(self, id, name, schema):
+        """Initialises the fields (<schema> being a tuple of day offsets). The
+        records are shared with the cache, so they must not be changed"""
+
+        self.id = id
+        self.name = name
+        self.schema = schema
+
+    def __repr__(self):
+        return (
+            f"SchemaRecord(id={self.id!r}, name={self.name!r}, schema={self.schema!r})"
+        )
+
+    def as_dict(self):
+        """Returns the fields as a JSON serialisable dictionary"""
+        return {"id": self.id, "name": self.name, "schema": list(self.schema)}
@@ -0,0 +1,51 @@
+"""This file contains the definition of the <SharedSession> class, which holds
+the pooled HTTP session shared by all the clients of TickTick's API"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Metrics import Metrics
+
+
+class SharedSession:
+    POOL_SIZE = 16  # Number of connections kept alive for each host
+    POOL_BLOCK = True  # Whether threads wait for a free connection or open a new one
+
+    _session = None
+
+    @classmethod
+    def get(cls):
+        """Returns the shared session, creating it on first use"""
+
+        if cls._session is None:
+            cls._session = cls.create()
+
+        return cls._session
+
+    @classmethod
+    def create(cls, pool_size=None):
+        """Creates a new session whose connections are kept alive and reused
+        (by default, <requests> opens a new connection for each call)"""
+
+        if pool_size is None:
+            pool_size = cls.POOL_SIZE
+
+        adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=cls.POOL_BLOCK)
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        # Every response is recorded, when the metrics are enabled
+        session.hooks["response"].append(Metrics.record_response)
+
+        return session
+
+    @classmethod
+    def configure(cls, pool_size):
+        """Replaces the shared session by one with a different pool size"""
+
+        if cls._session is not None:
+            cls._session.close()
+
+        cls._session = cls.create(pool_size)
@@ -2,21 +2,167 @@
 which manages the local database"""
 
 import json
+import os
 import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from InstrumentedCursor import InstrumentedCursor
+from LRUCache import LRUCache
+from Metrics import Metrics
+from RehearsalRecord import RehearsalRecord
+from SchemaRecord import SchemaRecord
+from TaskRecord import TaskRecord
 
 
 class StorageManager:
     DATABASE_PATH = "./data.db"
 
+    # Performance profile of the connection : with a write-ahead log, a commit
+    # only appends to the log, which is only synced at checkpoints
+    JOURNAL_MODE = "WAL"
+    SYNCHRONOUS = "NORMAL"
+    CACHE_SIZE_KIB = 16384
+    BUSY_TIMEOUT = 10  # Seconds spent waiting for a lock held by another connection
+
+    # Number of parsed schemas and tasks kept in memory
+    SCHEMAS_CACHE_SIZE = 128
+    TASKS_CACHE_SIZE = 1024
+
+    CHUNK_SIZE = 500  # Number of rows read at once when streaming a table
+
+    # Columns of a task joined with its rehearsals (see <task_records>)
+    TASK_COLUMNS = """tasks.id, tasks.schema_id, tasks.title, tasks.project_id,
+        tasks.priority, tasks.start_date, rehearsals.position, rehearsals.remote_id,
+        rehearsals.due_date, rehearsals.state, COALESCE(rehearsals.project_id, tasks.project_id)"""
+
     def __init__(self):
-        """Creates the connection to the local database and the various tables
-        (those are created only if they are missing)"""
+        """Creates the connection to the local database and brings its tables
+        up to date (see <MIGRATIONS>)"""
 
         # Those lines establish the connection to the database
-        self.db_connection = sqlite3.connect(StorageManager.DATABASE_PATH)
-        self.db_cursor = self.db_connection.cursor()
+        self.db_connection = sqlite3.connect(
+            StorageManager.DATABASE_PATH, timeout=StorageManager.BUSY_TIMEOUT
+        )
+        self.db_cursor = self.new_cursor()
+        self._transaction_depth = 0
+
+        # The data read is cached until this connection changes it, or until
+        # another connection (e.g. the outbox worker) changes the database
+        self.schemas_cache = LRUCache("schemas", StorageManager.SCHEMAS_CACHE_SIZE)
+        self.tasks_cache = LRUCache("tasks", StorageManager.TASKS_CACHE_SIZE)
+        self._data_version = None
+
+        self.db_cursor.execute(f"PRAGMA journal_mode = {StorageManager.JOURNAL_MODE}")
+        self.db_cursor.execute(f"PRAGMA synchronous = {StorageManager.SYNCHRONOUS}")
+        self.db_cursor.execute(f"PRAGMA cache_size = -{StorageManager.CACHE_SIZE_KIB}")
+        self.db_cursor.execute("PRAGMA temp_store = MEMORY")
+
+        self.migrate()
+
+    def new_cursor(self):
+        """Returns a new cursor on the local database (the queries are timed
+        when the metrics are enabled)"""
+
+        cursor = self.db_connection.cursor()
+
+        if Metrics.enabled:
+            cursor = InstrumentedCursor(cursor)
+
+        return cursor
+
+    @contextmanager
+    def transaction(self):
+        """Context manager grouping statements into a single transaction, which
+        is committed when leaving the outermost context (or rolled back if an
+        exception is raised), so that multi-step operations commit only once"""
+
+        self._transaction_depth += 1
+
+        try:
+            yield self.db_cursor
+
+        except BaseException:
+            self._transaction_depth -= 1
+
+            if self._transaction_depth == 0:
+                self.db_connection.rollback()
+
+                # What has been read during the transaction may have been undone
+                self.clear_caches()
+
+            raise
+
+        self._transaction_depth -= 1
+
+        if self._transaction_depth == 0:
+            self.db_connection.commit()
+
+    def migrate(self):
+        """Applies the migrations the database has not gone through yet, its
+        version being stored in <PRAGMA user_version>. Each migration is
+        applied in its own transaction, along with the version change"""
+
+        version = self.db_cursor.execute("PRAGMA user_version").fetchone()[0]
+
+        while version < len(StorageManager.MIGRATIONS):
+            # Another process may be migrating the database as well : the
+            # write lock is taken before the version is read again, so that
+            # a migration is never applied twice
+            self.db_cursor.execute("BEGIN IMMEDIATE")
+
+            with self.transaction():
+                version = self.db_cursor.execute("PRAGMA user_version").fetchone()[0]
+
+                if version < len(StorageManager.MIGRATIONS):
+                    StorageManager.MIGRATIONS[version](self)
+                    version += 1
+                    self.db_cursor.execute(f"PRAGMA user_version = {version}")
+
+    def cached(self, cache, key):
+        """Returns the value cached under <key> in one of the caches (<None> if
+        there is none). They are all cleared first if another connection has
+        changed the database since the last lookup"""
+
+        data_version = self.db_cursor.execute("PRAGMA data_version").fetchone()[0]
+
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self.clear_caches()
+
+        return cache.get(key)
+
+    def clear_caches(self):
+        """Drops everything cached from the local database"""
+
+        self.schemas_cache.clear()
+        self.tasks_cache.clear()
+
+    def cache_statistics(self):
+        """Returns the statistics of each cache, by name"""
+
+        return {
+            cache.name: cache.statistics()
+            for cache in (self.schemas_cache, self.tasks_cache)
+        }
+
+    def tasks_columns(self):
+        """Returns the names of the columns of the <tasks> table"""
+        return [
+            column[1]
+            for column in self.db_cursor.execute("PRAGMA table_info(tasks)").fetchall()
+        ]
+
+    # ---------------------------------------- MIGRATIONS ----------------------------------------
+    # Databases created before the versioning went through some of those
+    # steps already, hence the <IF NOT EXISTS> clauses and the checks
+
+    def create_base_tables(self):
+        """Creates the two tables we need : <tasks> and <schemas>"""
 
-        # Here we create the two tables we need : <tasks> and <schemas>
         self.db_cursor.execute(
             """CREATE TABLE IF NOT EXISTS schemas(
                                id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -40,6 +186,240 @@ class StorageManager:
         )"""
         )
 
+    def add_tasks_start_date(self):
+        """Adds the date their schema is counted from to the tasks"""
+
+        if "start_date" not in self.tasks_columns():
+            self.db_cursor.execute("ALTER TABLE tasks ADD COLUMN start_date TEXT")
+
+    def create_outbox(self):
+        """Creates the outbox, which journals the operations to be sent to
+        TickTick, so that they survive crashes and offline periods
+        (see <OutboxWorker>)"""
+
+        self.db_cursor.execute(
+            """CREATE TABLE IF NOT EXISTS outbox(
+                               id INTEGER PRIMARY KEY AUTOINCREMENT,
+                               idempotency_key TEXT NOT NULL UNIQUE,
+                               operation TEXT NOT NULL,
+                               task_id INTEGER,
+                               position INTEGER,
+                               payload TEXT NOT NULL,
+                               attempts INTEGER NOT NULL DEFAULT 0,
+                               next_attempt_at INTEGER NOT NULL DEFAULT 0,
+                               last_error TEXT
+        )"""
+        )
+
+    def create_projects_cache(self):
+        """Creates the cache of the projects fetched from TickTick, which
+        rarely change"""
+
+        self.db_cursor.execute(
+            """CREATE TABLE IF NOT EXISTS projects(
+                               id TEXT PRIMARY KEY,
+                               name TEXT NOT NULL,
+                               group_id TEXT NOT NULL,
+                               rank INTEGER NOT NULL,
+                               fetched_at INTEGER NOT NULL
+        )"""
+        )
+
+    def create_rehearsals_table(self):
+        """Gives each rehearsal of a task (that is, each task created on
+        TickTick) its own row, so that they can be looked up by date or by
+        remote ID. The remote IDs were formerly stored in the <rehearsals_ids>
+        column of the <tasks> table, as a JSON list"""
+
+        self.db_cursor.execute(
+            """CREATE TABLE IF NOT EXISTS rehearsals(
+                               id INTEGER PRIMARY KEY AUTOINCREMENT,
+                               task_id INTEGER NOT NULL,
+                               position INTEGER NOT NULL,
+                               due_date TEXT,
+                               remote_id TEXT,
+                               state TEXT NOT NULL,
+                               UNIQUE (task_id, position),
+                               FOREIGN KEY (task_id)
+                                    REFERENCES tasks (id)
+                                        ON DELETE CASCADE
+        )"""
+        )
+        self.db_cursor.execute(
+            "CREATE INDEX IF NOT EXISTS rehearsals_task_id ON rehearsals (task_id)"
+        )
+        self.db_cursor.execute(
+            "CREATE INDEX IF NOT EXISTS rehearsals_remote_id ON rehearsals (remote_id)"
+        )
+        self.db_cursor.execute(
+            "CREATE INDEX IF NOT EXISTS rehearsals_due_date ON rehearsals (due_date)"
+        )
+
+        if "rehearsals_ids" not in self.tasks_columns():
+            return
+
+        # The due dates are computed from the schema of each task, when possible
+        tasks = self.db_cursor.execute(
+            """SELECT tasks.id, tasks.rehearsals_ids, tasks.start_date, schemas.schema
+               FROM tasks LEFT JOIN schemas ON schemas.id = tasks.schema_id"""
+        ).fetchall()
+
+        rehearsals = []
+
+        for task_local_id, rehearsal_IDs, start_date, schema in tasks:
+            rehearsal_IDs = json.loads(rehearsal_IDs)
+            due_dates = [None] * len(rehearsal_IDs)
+
+            # The dates are only known if the schema still matches the rehearsals
+            if start_date is not None and schema is not None:
+                schema = json.loads(schema)
+
+                if len(schema) == len(rehearsal_IDs):
+                    due_dates = [
+                        (date.fromisoformat(start_date) + timedelta(days=day_delta))
+                        for day_delta in schema
+                    ]
+
+            rehearsals.extend(
+                self.rehearsals_rows(task_local_id, rehearsal_IDs, due_dates)
+            )
+
+        self.db_cursor.executemany(
+            """INSERT INTO rehearsals (task_id, position, due_date, remote_id, state) VALUES (?, ?, ?, ?, ?)""",
+            rehearsals,
+        )
+        self.db_cursor.execute("ALTER TABLE tasks DROP COLUMN rehearsals_ids")
+
+    def create_imports_table(self):
+        """Creates the table recording the progress of the bulk imports, so
+        that an interrupted import can be resumed (see <TaskImporter>)"""
+
+        self.db_cursor.execute(
+            """CREATE TABLE IF NOT EXISTS imports(
+                               key TEXT PRIMARY KEY,
+                               path TEXT NOT NULL,
+                               last_line INTEGER NOT NULL,
+                               completed INTEGER NOT NULL DEFAULT 0
+        )"""
+        )
+
+    def create_sync_tables(self):
+        """Records where each rehearsal is on TickTick (a rehearsal moved to
+        another project keeps its project, <NULL> meaning the project of its
+        task), and the watermark of each project at the last synchronisation,
+        so that the unchanged projects are skipped (see <TaskSynchronizer>)"""
+
+        self.db_cursor.execute("ALTER TABLE rehearsals ADD COLUMN project_id TEXT")
+        self.db_cursor.execute(
+            """CREATE TABLE IF NOT EXISTS sync_watermarks(
+                               project_id TEXT PRIMARY KEY,
+                               watermark TEXT NOT NULL,
+                               synced_at INTEGER NOT NULL
+        )"""
+        )
+
+    def create_tasks_search_index(self):
+        """Creates the full-text index of the titles of the tasks, which is kept
+        in sync with the <tasks> table by triggers (whichever method writes
+        to it), so that the tasks can be searched without reading them all"""
+
+        self.db_cursor.execute(
+            """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_search USING fts5(
+                               title,
+                               content = 'tasks',
+                               content_rowid = 'id',
+                               tokenize = 'unicode61 remove_diacritics 2'
+        )"""
+        )
+        self.db_cursor.execute(
+            """CREATE TRIGGER IF NOT EXISTS tasks_search_insert AFTER INSERT ON tasks BEGIN
+                   INSERT INTO tasks_search (rowid, title) VALUES (new.id, new.title);
+               END"""
+        )
+        self.db_cursor.execute(
+            """CREATE TRIGGER IF NOT EXISTS tasks_search_delete AFTER DELETE ON tasks BEGIN
+                   INSERT INTO tasks_search (tasks_search, rowid, title) VALUES ('delete', old.id, old.title);
+               END"""
+        )
+        self.db_cursor.execute(
+            """CREATE TRIGGER IF NOT EXISTS tasks_search_update AFTER UPDATE OF title ON tasks BEGIN
+                   INSERT INTO tasks_search (tasks_search, rowid, title) VALUES ('delete', old.id, old.title);
+                   INSERT INTO tasks_search (rowid, title) VALUES (new.id, new.title);
+               END"""
+        )
+
+        # The existing tasks are indexed
+        self.db_cursor.execute(
+            "INSERT INTO tasks_search (tasks_search) VALUES ('rebuild')"
+        )
+
+    def add_outbox_doubt(self):
+        """Records whether the last attempt of each journaled operation ended
+        without a response from TickTick, in which case it may have been
+        carried out anyway. The operations already attempted are in doubt"""
+
+        self.db_cursor.execute(
+            "ALTER TABLE outbox ADD COLUMN in_doubt INTEGER NOT NULL DEFAULT 0"
+        )
+        self.db_cursor.execute("UPDATE outbox SET in_doubt = attempts > 0")
+
+    def key_imports_by_path(self):
+        """Keys the progress of the imports by path instead of by content, so
+        that a file changed after a partial import is resumed rather than
+        imported again : the hash of its content is kept next to it, to warn
+        the user when it has changed"""
+
+        self.db_cursor.execute("ALTER TABLE imports ADD COLUMN content_hash TEXT")
+
+        # The imports were keyed by the hash of the file, and the last one of
+        # each path wins. The paths were recorded as given, from the directory
+        # of the database (see <DATABASE_PATH>), where the app still runs
+        rows = self.db_cursor.execute(
+            "SELECT key, path, last_line, completed FROM imports ORDER BY rowid"
+        ).fetchall()
+
+        self.db_cursor.execute("DELETE FROM imports")
+        self.db_cursor.executemany(
+            """INSERT OR REPLACE INTO imports (key, path, last_line, completed, content_hash) VALUES (?, ?, ?, ?, ?)""",
+            [
+                (os.path.realpath(path), path, last_line, completed, content_hash)
+                for content_hash, path, last_line, completed in rows
+            ],
+        )
+
+    # The migrations, in order : the version of a database is the number of
+    # migrations it has gone through
+    MIGRATIONS = (
+        create_base_tables,
+        add_tasks_start_date,
+        create_outbox,
+        create_projects_cache,
+        create_rehearsals_table,
+        create_imports_table,
+        create_sync_tables,
+        create_tasks_search_index,
+        add_outbox_doubt,
+        key_imports_by_path,
+    )
+
+    @staticmethod
+    def rehearsals_rows(task_local_id, rehearsal_IDs, due_dates):
+        """Returns the rows of the <rehearsals> table describing the rehearsals
+        of a task (a rehearsal without remote ID is still to be created)"""
+
+        return [
+            (
+                task_local_id,
+                position,
+                due_date.isoformat() if due_date is not None else None,
+                task_ID,
+                "created" if task_ID is not None else "pending",
+            )
+            for position, (task_ID, due_date) in enumerate(
+                zip(rehearsal_IDs, due_dates)
+            )
+        ]
+
     def fetch_schemas_descriptors(self):
         """Returns a list of tuples of the form (name, id), each one
         corresponding to an existing rehearsal schema"""
@@ -48,49 +428,80 @@ class StorageManager:
         ).fetchall()
 
     def fetch_schema_data(self, schema_id):
-        """Returns the data associated with a single schema, its ID being given"""
+        """Returns the <SchemaRecord> of a single schema, its ID being given
+        (<None> if there is no such schema)"""
 
-        # We first retrieve the raw data from the local database
-        raw_data = self.db_cursor.execute(
-            "SELECT * FROM schemas WHERE id = ?", (schema_id,)
-        ).fetchone()
+        schema_data = self.cached(self.schemas_cache, schema_id)
 
-        # We return the data under the form of a dictionary
-        return {
-            "id": raw_data[0],
-            "name": raw_data[1],
-            "schema": json.loads(raw_data[2]),
-        }
+        if schema_data is None:
+            raw_data = self.db_cursor.execute(
+                "SELECT id, name, schema FROM schemas WHERE id = ?", (schema_id,)
+            ).fetchone()
+
+            if raw_data is None:
+                return None
+
+            schema_data = StorageManager.schema_record(raw_data)
+            self.schemas_cache.put(schema_id, schema_data)
+
+        return schema_data
+
+    def iter_schemas(self):
+        """Yields the <SchemaRecord> of every schema, in the order of their IDs.
+        They are read in chunks of <CHUNK_SIZE>, each one being read in full
+        before it is yielded : the database may be changed meanwhile"""
+
+        last_id = -1
+
+        while True:
+            rows = self.db_cursor.execute(
+                "SELECT id, name, schema FROM schemas WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, StorageManager.CHUNK_SIZE),
+            ).fetchall()
+
+            if len(rows) == 0:
+                return
+
+            yield from map(StorageManager.schema_record, rows)
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def schema_record(row):
+        """Returns the <SchemaRecord> built from a row of the <schemas> table"""
+        return SchemaRecord(row[0], row[1], tuple(json.loads(row[2])))
 
     def save_schema(self, name, schema):
-        """Inserts a rehearsal schema into the local database"""
+        """Inserts a rehearsal schema into the local database. Returns its ID"""
 
         # We create and commit the appropriate transaction
-        self.db_cursor.execute(
-            """INSERT INTO schemas (name, schema) VALUES (?, ?)""",
-            (name, json.dumps(schema)),
-        )
+        with self.transaction():
+            self.db_cursor.execute(
+                """INSERT INTO schemas (name, schema) VALUES (?, ?)""",
+                (name, json.dumps(schema)),
+            )
 
-        self.db_connection.commit()
+        return self.db_cursor.lastrowid
 
     def edit_schema(self, schema_id, name, schema):
         """Edits an existing rehearsal schema in the local database"""
 
         # We create and commit the appropriate transaction
-        self.db_cursor.execute(
-            """UPDATE schemas SET name = ?, schema = ? WHERE id = ?""",
-            (name, json.dumps(schema), schema_id),
-        )
+        with self.transaction():
+            self.db_cursor.execute(
+                """UPDATE schemas SET name = ?, schema = ? WHERE id = ?""",
+                (name, json.dumps(schema), schema_id),
+            )
 
-        self.db_connection.commit()
+        self.schemas_cache.invalidate([schema_id])
 
     def delete_schema(self, schema_id):
         """Deletes an existing rehearsal schema from the local database"""
 
         # We create and commit the appropriate transaction
-        self.db_cursor.execute("""DELETE FROM schemas WHERE id = ?""", (schema_id,))
+        with self.transaction():
+            self.db_cursor.execute("""DELETE FROM schemas WHERE id = ?""", (schema_id,))
 
-        self.db_connection.commit()
+        self.schemas_cache.invalidate([schema_id])
 
     def fetch_tasks_descriptors(self):
         """Returns a list of tuples of the form (title, id), each one
@@ -99,42 +510,735 @@ class StorageManager:
             "SELECT title, id FROM tasks ORDER BY id DESC"
         ).fetchall()
 
+    def count_tasks(self):
+        """Returns the number of tasks"""
+        return self.db_cursor.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    @staticmethod
+    def search_query(text):
+        """Returns the full-text query matching the titles containing words
+        which start with each of the words of <text>"""
+
+        return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+    def search_tasks(self, text, limit, before_id=None):
+        """Returns a page of at most <limit> tasks whose title matches <text>
+        (see <search_query>, every task matching an empty text), as tuples of
+        the form (title, id), the most recent first. If <before_id> is given,
+        the page starts after the task with this ID"""
+
+        query = StorageManager.search_query(text)
+
+        # Only the rows of the page are read, the tasks being walked by ID
+        if before_id is None:
+            before_id = sys.maxsize
+
+        if query == "":
+            return self.db_cursor.execute(
+                "SELECT title, id FROM tasks WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before_id, limit),
+            ).fetchall()
+
+        return self.db_cursor.execute(
+            """SELECT tasks.title, tasks.id FROM tasks_search
+               JOIN tasks ON tasks.id = tasks_search.rowid
+               WHERE tasks_search MATCH ? AND tasks_search.rowid < ?
+               ORDER BY tasks_search.rowid DESC LIMIT ?""",
+            (query, before_id, limit),
+        ).fetchall()
+
+    def iter_tasks_overview(self):
+        """Yields the data of every task as a dictionary (the rehearsals are
+        only counted, along with those not created yet), the last ones first.
+        They are read in chunks of <CHUNK_SIZE> tasks"""
+
+        last_id = sys.maxsize
+
+        while True:
+            rows = self.db_cursor.execute(
+                """SELECT tasks.id, tasks.title, tasks.project_id, tasks.schema_id,
+                          tasks.priority, tasks.start_date, COUNT(rehearsals.id),
+                          COUNT(rehearsals.id) - COUNT(rehearsals.remote_id)
+                   FROM tasks LEFT JOIN rehearsals ON rehearsals.task_id = tasks.id
+                   WHERE tasks.id IN (
+                       SELECT id FROM tasks WHERE id < ? ORDER BY id DESC LIMIT ?
+                   )
+                   GROUP BY tasks.id ORDER BY tasks.id DESC""",
+                (last_id, StorageManager.CHUNK_SIZE),
+            ).fetchall()
+
+            if len(rows) == 0:
+                return
+
+            for row in rows:
+                yield {
+                    "id": row[0],
+                    "title": row[1],
+                    "project_id": row[2],
+                    "schema_id": row[3],
+                    "priority": row[4],
+                    "start_date": row[5],
+                    "rehearsals": row[6],
+                    "pending_rehearsals": row[7],
+                }
+
+            last_id = rows[-1][0]
+
     def fetch_task_data(self, task_local_id):
-        """Returns the data of a single task, its local ID being given"""
+        """Returns the <TaskRecord> of a single task, its local ID being given
+        (<None> if there is no such task)"""
 
-        # We first retrieve the raw data from the local database
-        raw_data = self.db_cursor.execute(
-            "SELECT * FROM tasks WHERE id = ?", (task_local_id,)
+        task_data = self.cached(self.tasks_cache, task_local_id)
+
+        if task_data is None:
+            rows = self.db_cursor.execute(
+                f"""SELECT {StorageManager.TASK_COLUMNS}
+                    FROM tasks LEFT JOIN rehearsals ON rehearsals.task_id = tasks.id
+                    WHERE tasks.id = ? ORDER BY rehearsals.position""",
+                (task_local_id,),
+            ).fetchall()
+
+            task_data = next(StorageManager.task_records(rows), None)
+
+            if task_data is None:
+                return None
+
+            self.tasks_cache.put(task_local_id, task_data)
+
+        return task_data
+
+    def iter_tasks(self, schema_id=None):
+        """Yields the <TaskRecord> of every task (only those following the given
+        schema, if any), in the order of their IDs. They are read in chunks of
+        <CHUNK_SIZE> tasks, each one being read in full before it is yielded :
+        the database may be changed meanwhile"""
+
+        condition = "" if schema_id is None else "AND schema_id = ?"
+        parameters = () if schema_id is None else (schema_id,)
+        last_id = -1
+
+        while True:
+            rows = self.db_cursor.execute(
+                f"""SELECT {StorageManager.TASK_COLUMNS}
+                    FROM tasks LEFT JOIN rehearsals ON rehearsals.task_id = tasks.id
+                    WHERE tasks.id IN (
+                        SELECT id FROM tasks WHERE id > ? {condition} ORDER BY id LIMIT ?
+                    )
+                    ORDER BY tasks.id, rehearsals.position""",
+                (last_id, *parameters, StorageManager.CHUNK_SIZE),
+            ).fetchall()
+
+            if len(rows) == 0:
+                return
+
+            yield from StorageManager.task_records(rows)
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def task_records(rows):
+        """Yields the <TaskRecord> built from rows of <TASK_COLUMNS>, which are
+        ordered by task and then by position"""
+
+        for _, task_rows in groupby(rows, key=itemgetter(0)):
+            task_rows = list(task_rows)
+            row = task_rows[0]
+
+            yield TaskRecord(
+                row[0],
+                row[1],
+                row[2],
+                row[3],
+                row[4],
+                date.fromisoformat(row[5]) if row[5] is not None else None,
+                # A task without rehearsals still has one row, full of <NULL>
+                tuple(
+                    RehearsalRecord(
+                        rehearsal_row[7],
+                        (
+                            date.fromisoformat(rehearsal_row[8])
+                            if rehearsal_row[8] is not None
+                            else None
+                        ),
+                        rehearsal_row[9],
+                        rehearsal_row[10],
+                    )
+                    for rehearsal_row in task_rows
+                    if rehearsal_row[6] is not None
+                ),
+            )
+
+    def fetch_task_by_remote_id(self, remote_id):
+        """Returns the local ID of the task owning the rehearsal with the given
+        remote ID, along with its position in the schema (<None> if there is
+        no such rehearsal)"""
+        return self.db_cursor.execute(
+            "SELECT task_id, position FROM rehearsals WHERE remote_id = ?",
+            (remote_id,),
         ).fetchone()
 
-        # We return the data under the form of a dictionary
+    def fetch_rehearsals_due(self, due_date):
+        """Returns a list of tuples of the form (task local ID, remote ID), each
+        one corresponding to a rehearsal due on the given date"""
+        return self.db_cursor.execute(
+            "SELECT task_id, remote_id FROM rehearsals WHERE due_date = ? ORDER BY task_id",
+            (due_date.isoformat(),),
+        ).fetchall()
+
+    def fetch_rehearsals_load(self, first_date):
+        """Returns a dictionary mapping each date from <first_date> on to its
+        number of rehearsals (the dates without any are left out)"""
         return {
-            "id": raw_data[0],
-            "schema_id": raw_data[1],
-            "title": raw_data[2],
-            "project_id": raw_data[3],
-            "priority": raw_data[4],
-            "rehearsal_ids": json.loads(raw_data[5]),
+            date.fromisoformat(due_date): count
+            for due_date, count in self.db_cursor.execute(
+                """SELECT due_date, COUNT(*) FROM rehearsals WHERE due_date >= ? GROUP BY due_date""",
+                (first_date.isoformat(),),
+            )
         }
 
-    def save_task(self, schema_id, title, project_ID, priority, rehearsal_IDs):
-        """Inserts a single task into the local database"""
+    def save_task(
+        self,
+        schema_id,
+        title,
+        project_ID,
+        priority,
+        rehearsal_IDs,
+        start_date=None,
+        due_dates=None,
+    ):
+        """Inserts a single task into the local database. <start_date> is the
+        date its schema is counted from (by default, today) and <due_dates>
+        the date of each rehearsal. Returns the local ID of the task"""
+
+        if start_date is None:
+            start_date = date.today()
+
+        if due_dates is None:
+            due_dates = [None] * len(rehearsal_IDs)
 
         # We create and commit the appropriate transaction
-        self.db_cursor.execute(
-            """INSERT INTO tasks (schema_id, title, project_id, priority, rehearsals_ids) VALUES (?, ?, ?, ?, ?)""",
-            (schema_id, title, project_ID, priority, json.dumps(rehearsal_IDs)),
-        )
+        with self.transaction():
+            self.db_cursor.execute(
+                """INSERT INTO tasks (schema_id, title, project_id, priority, start_date) VALUES (?, ?, ?, ?, ?)""",
+                (schema_id, title, project_ID, priority, start_date.isoformat()),
+            )
+            task_local_id = self.db_cursor.lastrowid
+
+            self.db_cursor.executemany(
+                """INSERT INTO rehearsals (task_id, position, due_date, remote_id, state) VALUES (?, ?, ?, ?, ?)""",
+                self.rehearsals_rows(task_local_id, rehearsal_IDs, due_dates),
+            )
 
-        self.db_connection.commit()
+        return task_local_id
+
+    def save_tasks(self, tasks):
+        """Inserts many tasks into the local database in a single transaction.
+        <tasks> is an iterable of dictionaries with the same keys as the
+        arguments of <save_task>. Returns the local IDs of the tasks"""
+
+        tasks_local_ids = []
+        rehearsals = []
+
+        # We create and commit the appropriate transaction
+        with self.transaction():
+            for task in tasks:
+                start_date = task.get("start_date") or date.today()
+                due_dates = task.get("due_dates") or [None] * len(task["rehearsal_IDs"])
+
+                self.db_cursor.execute(
+                    """INSERT INTO tasks (schema_id, title, project_id, priority, start_date) VALUES (?, ?, ?, ?, ?)""",
+                    (
+                        task["schema_id"],
+                        task["title"],
+                        task["project_ID"],
+                        task["priority"],
+                        start_date.isoformat(),
+                    ),
+                )
+                tasks_local_ids.append(self.db_cursor.lastrowid)
+
+                rehearsals.extend(
+                    self.rehearsals_rows(
+                        self.db_cursor.lastrowid, task["rehearsal_IDs"], due_dates
+                    )
+                )
+
+            self.db_cursor.executemany(
+                """INSERT INTO rehearsals (task_id, position, due_date, remote_id, state) VALUES (?, ?, ?, ?, ?)""",
+                rehearsals,
+            )
+
+        return tasks_local_ids
+
+    def edit_task(
+        self,
+        task_local_id,
+        schema_id,
+        title,
+        project_ID,
+        priority,
+        rehearsal_IDs,
+        start_date,
+        due_dates=None,
+        projects_IDs=None,
+    ):
+        """Edits an existing task in the local database (<projects_IDs> gives
+        the project of each rehearsal, <None> meaning the task's one)"""
+
+        if due_dates is None:
+            due_dates = [None] * len(rehearsal_IDs)
+
+        if projects_IDs is None:
+            projects_IDs = [None] * len(rehearsal_IDs)
+
+        # We create and commit the appropriate transaction
+        with self.transaction():
+            self.db_cursor.execute(
+                """UPDATE tasks SET schema_id = ?, title = ?, project_id = ?, priority = ?, start_date = ? WHERE id = ?""",
+                (
+                    schema_id,
+                    title,
+                    project_ID,
+                    priority,
+                    start_date.isoformat(),
+                    task_local_id,
+                ),
+            )
+
+            self.db_cursor.execute(
+                """DELETE FROM rehearsals WHERE task_id = ?""", (task_local_id,)
+            )
+            self.db_cursor.executemany(
+                """INSERT INTO rehearsals (task_id, position, due_date, remote_id, state, project_id) VALUES (?, ?, ?, ?, ?, ?)""",
+                [
+                    row + (rehearsal_project_ID,)
+                    for row, rehearsal_project_ID in zip(
+                        self.rehearsals_rows(task_local_id, rehearsal_IDs, due_dates),
+                        projects_IDs,
+                    )
+                ],
+            )
+
+        self.tasks_cache.invalidate([task_local_id])
 
     def delete_task(self, task_local_id):
-        """Deletes a single task from local database"""
+        """Deletes a single task (and its rehearsals) from local database"""
+
+        # We create and commit the appropriate transaction
+        with self.transaction():
+            self.db_cursor.execute(
+                """DELETE FROM rehearsals WHERE task_id = ?""", (task_local_id,)
+            )
+            self.db_cursor.execute(
+                """DELETE FROM tasks WHERE id = ?""", (task_local_id,)
+            )
+
+        self.tasks_cache.invalidate([task_local_id])
+
+    def queue_task_creation(
+        self, schema_id, title, project_ID, priority, start_date, due_dates, payloads
+    ):
+        """Inserts a task whose rehearsals are still to be created on TickTick,
+        along with the journaled creation of each rehearsal (<payloads> being
+        the data to be sent for each of them). Returns the local ID of the task"""
+
+        # Both the task and its operations are committed in a single transaction
+        with self.transaction():
+            self.db_cursor.execute(
+                """INSERT INTO tasks (schema_id, title, project_id, priority, start_date) VALUES (?, ?, ?, ?, ?)""",
+                (schema_id, title, project_ID, priority, start_date.isoformat()),
+            )
+            task_local_id = self.db_cursor.lastrowid
+
+            self.db_cursor.executemany(
+                """INSERT INTO rehearsals (task_id, position, due_date, remote_id, state) VALUES (?, ?, ?, ?, ?)""",
+                self.rehearsals_rows(task_local_id, [None] * len(due_dates), due_dates),
+            )
+            self.db_cursor.executemany(
+                """INSERT OR IGNORE INTO outbox (idempotency_key, operation, task_id, position, payload) VALUES (?, 'create', ?, ?, ?)""",
+                [
+                    (
+                        f"create:{task_local_id}:{position}",
+                        task_local_id,
+                        position,
+                        json.dumps(payload),
+                    )
+                    for position, payload in enumerate(payloads)
+                ],
+            )
+
+        return task_local_id
+
+    def queue_task_deletion(self, task_local_id):
+        """Deletes a task from the local database and journals the deletion of
+        its rehearsals on TickTick (the ones not created yet are simply cancelled)"""
+
+        with self.transaction():
+            # A rehearsal may have been moved to another project on TickTick.
+            # The title and date are journaled as well, to name it in the errors
+            rehearsals = self.db_cursor.execute(
+                """SELECT rehearsals.remote_id, COALESCE(rehearsals.project_id, tasks.project_id),
+                          tasks.title, rehearsals.due_date
+                   FROM rehearsals JOIN tasks ON tasks.id = rehearsals.task_id
+                   WHERE rehearsals.task_id = ? AND rehearsals.remote_id IS NOT NULL""",
+                (task_local_id,),
+            ).fetchall()
+
+            self.db_cursor.execute(
+                """DELETE FROM outbox WHERE operation = 'create' AND task_id = ?""",
+                (task_local_id,),
+            )
+            self.db_cursor.executemany(
+                """INSERT OR IGNORE INTO outbox (idempotency_key, operation, payload) VALUES (?, 'delete', ?)""",
+                [
+                    (
+                        f"delete:{project_ID}:{task_ID}",
+                        json.dumps(
+                            {
+                                "projectId": project_ID,
+                                "id": task_ID,
+                                "title": title,
+                                "startDate": due_date,
+                            }
+                        ),
+                    )
+                    for task_ID, project_ID, title, due_date in rehearsals
+                ],
+            )
+            self.db_cursor.execute(
+                """DELETE FROM rehearsals WHERE task_id = ?""", (task_local_id,)
+            )
+            self.db_cursor.execute(
+                """DELETE FROM tasks WHERE id = ?""", (task_local_id,)
+            )
+
+        self.tasks_cache.invalidate([task_local_id])
+
+    def count_schema_tasks(self, schema_id):
+        """Returns the number of tasks following a rehearsal schema"""
+        return self.db_cursor.execute(
+            "SELECT COUNT(*) FROM tasks WHERE schema_id = ?", (schema_id,)
+        ).fetchone()[0]
+
+    def queue_task_reschedule(self, task_local_id, rehearsals, operations):
+        """Replaces the rehearsals of a task by <rehearsals> (a list of
+        <RehearsalRecord>, in the order of the new schema) and
+        journals the operations bringing TickTick up to date, as tuples of the
+        form (operation, position, payload). The creations still pending are
+        cancelled beforehand, so they must be journaled again"""
+
+        with self.transaction():
+            self.db_cursor.execute(
+                """DELETE FROM outbox WHERE operation = 'create' AND task_id = ?""",
+                (task_local_id,),
+            )
+            self.db_cursor.execute(
+                """DELETE FROM rehearsals WHERE task_id = ?""", (task_local_id,)
+            )
+            self.db_cursor.executemany(
+                """INSERT INTO rehearsals (task_id, position, due_date, remote_id, state, project_id) VALUES (?, ?, ?, ?, ?, ?)""",
+                [
+                    (
+                        task_local_id,
+                        position,
+                        (
+                            rehearsal.due_date.isoformat()
+                            if rehearsal.due_date is not None
+                            else None
+                        ),
+                        rehearsal.remote_id,
+                        rehearsal.state,
+                        rehearsal.project_id,
+                    )
+                    for position, rehearsal in enumerate(rehearsals)
+                ],
+            )
+
+            # A rehearsal moved again before being sent is only moved once
+            for operation, position, payload in operations:
+                if operation == "create":
+                    key = f"create:{task_local_id}:{position}"
+                elif operation == "update":
+                    key = f"update:{payload['id']}"
+                else:
+                    key = f"delete:{payload['projectId']}:{payload['id']}"
+                    self.db_cursor.execute(
+                        """DELETE FROM outbox WHERE idempotency_key = ?""",
+                        (f"update:{payload['id']}",),
+                    )
+
+                self.db_cursor.execute(
+                    """INSERT OR REPLACE INTO outbox (idempotency_key, operation, task_id, position, payload) VALUES (?, ?, ?, ?, ?)""",
+                    (
+                        key,
+                        operation,
+                        task_local_id if operation == "create" else None,
+                        position if operation == "create" else None,
+                        json.dumps(payload),
+                    ),
+                )
+
+        self.tasks_cache.invalidate([task_local_id])
+
+    def queue_remote_deletion(self, project_ID, task_ID):
+        """Journals the deletion of a single task on TickTick"""
+
+        with self.transaction():
+            self.db_cursor.execute(
+                """INSERT OR IGNORE INTO outbox (idempotency_key, operation, payload) VALUES (?, 'delete', ?)""",
+                (
+                    f"delete:{project_ID}:{task_ID}",
+                    json.dumps({"projectId": project_ID, "id": task_ID}),
+                ),
+            )
+
+    def queue_remote_operations(self, operations):
+        """Journals updates and deletions of tasks on TickTick, given as tuples
+        of the form (operation, payload), replacing those already journaled
+        for the same tasks"""
+
+        with self.transaction():
+            self.db_cursor.executemany(
+                """INSERT OR REPLACE INTO outbox (idempotency_key, operation, payload) VALUES (?, ?, ?)""",
+                [
+                    (
+                        (
+                            f"update:{payload['id']}"
+                            if operation == "update"
+                            else f"delete:{payload['projectId']}:{payload['id']}"
+                        ),
+                        operation,
+                        json.dumps(payload),
+                    )
+                    for operation, payload in operations
+                ],
+            )
+
+    def fetch_ready_operations(self, limit):
+        """Returns (at most <limit>) journaled operations that are due to be
+        sent, in the order they were journaled"""
+
+        raw_data = self.db_cursor.execute(
+            """SELECT id, operation, task_id, position, payload, attempts, in_doubt FROM outbox
+               WHERE next_attempt_at <= ? ORDER BY id LIMIT ?""",
+            (int(datetime.now().timestamp()), limit),
+        ).fetchall()
+
+        return [
+            {
+                "id": row[0],
+                "operation": row[1],
+                "task_id": row[2],
+                "position": row[3],
+                "payload": json.loads(row[4]),
+                "attempts": row[5],
+                "in_doubt": bool(row[6]),
+            }
+            for row in raw_data
+        ]
+
+    def fetch_operations_errors(self, limit):
+        """Returns the errors of (at most <limit>) failed operations still
+        journaled, as tuples of the form (error, number of attempts)"""
+        return self.db_cursor.execute(
+            """SELECT last_error, attempts FROM outbox
+               WHERE last_error IS NOT NULL ORDER BY id LIMIT ?""",
+            (limit,),
+        ).fetchall()
+
+    def count_pending_operations(self):
+        """Returns the number of journaled operations not sent yet"""
+        return self.db_cursor.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def next_attempt_date(self):
+        """Returns the timestamp of the earliest retry (<None> if the outbox is empty)"""
+        return self.db_cursor.execute(
+            "SELECT MIN(next_attempt_at) FROM outbox"
+        ).fetchone()[0]
+
+    def start_attempts(self, operations_ids):
+        """Records that the given operations are about to be sent (if the app
+        crashes before they are completed, we know they may have reached TickTick)"""
+
+        with self.transaction():
+            self.db_cursor.executemany(
+                """UPDATE outbox SET attempts = attempts + 1, in_doubt = 1 WHERE id = ?""",
+                [(operation_id,) for operation_id in operations_ids],
+            )
+
+    def complete_operation(self, operation_id, task_ID=None):
+        """Removes a successful operation from the outbox. For a creation, the
+        ID of the new rehearsal is stored in its task. Returns <False> if the
+        operation had been cancelled in the meantime"""
+
+        with self.transaction():
+            operation = self.db_cursor.execute(
+                """SELECT task_id, position FROM outbox WHERE id = ?""", (operation_id,)
+            ).fetchone()
+
+            if operation is None:
+                return False
+
+            if task_ID is not None:
+                self.db_cursor.execute(
+                    """UPDATE rehearsals SET remote_id = ?, state = 'created'
+                       WHERE task_id = ? AND position = ?""",
+                    (task_ID, operation[0], operation[1]),
+                )
+                self.tasks_cache.invalidate([operation[0]])
+
+            self.db_cursor.execute(
+                """DELETE FROM outbox WHERE id = ?""", (operation_id,)
+            )
+
+        return True
+
+    def postpone_operation(self, operation_id, next_attempt_at, error, in_doubt=False):
+        """Schedules the next attempt of a failed operation, <in_doubt> telling
+        whether the attempt ended without a response from TickTick"""
+
+        with self.transaction():
+            self.db_cursor.execute(
+                """UPDATE outbox SET next_attempt_at = ?, last_error = ?, in_doubt = ? WHERE id = ?""",
+                (next_attempt_at, error, int(in_doubt), operation_id),
+            )
+
+    def fetch_cached_projects(self, group_id):
+        """Returns the cached projects of a group of tasks, as a list of
+        dictionaries, along with the timestamp of their retrieval
+        (<None> if they have never been cached)"""
+
+        raw_data = self.db_cursor.execute(
+            """SELECT id, name, fetched_at FROM projects WHERE group_id = ? ORDER BY rank""",
+            (group_id,),
+        ).fetchall()
+
+        if len(raw_data) == 0:
+            return [], None
+
+        return [
+            {"id": row[0], "name": row[1], "groupId": group_id} for row in raw_data
+        ], min(row[2] for row in raw_data)
+
+    def cache_projects(self, group_id, projects):
+        """Replaces the cached projects of a group of tasks"""
+
+        fetched_at = int(datetime.now().timestamp())
 
         # We create and commit the appropriate transaction
-        self.db_cursor.execute("""DELETE FROM tasks WHERE id = ?""", (task_local_id,))
+        with self.transaction():
+            self.db_cursor.execute(
+                """DELETE FROM projects WHERE group_id = ?""", (group_id,)
+            )
+            self.db_cursor.executemany(
+                """INSERT OR REPLACE INTO projects (id, name, group_id, rank, fetched_at) VALUES (?, ?, ?, ?, ?)""",
+                [
+                    (project["id"], project["name"], group_id, rank, fetched_at)
+                    for rank, project in enumerate(projects)
+                ],
+            )
+
+    def iter_synced_rehearsals(self, project_IDs):
+        """Yields the rehearsals existing on TickTick in the given projects, as
+        dictionaries. They are streamed from a cursor of their own, <CHUNK_SIZE>
+        rows at a time, so the database must not be changed meanwhile"""
+
+        cursor = self.new_cursor()
+        cursor.execute(
+            f"""SELECT rehearsals.id, rehearsals.remote_id, rehearsals.due_date, rehearsals.state,
+                       COALESCE(rehearsals.project_id, tasks.project_id) AS project
+                FROM rehearsals JOIN tasks ON tasks.id = rehearsals.task_id
+                WHERE rehearsals.remote_id IS NOT NULL
+                      AND rehearsals.state IN ('created', 'completed')
+                      AND project IN ({", ".join("?" * len(project_IDs))})""",
+            list(project_IDs),
+        )
+
+        while rows := cursor.fetchmany(StorageManager.CHUNK_SIZE):
+            for row in rows:
+                yield {
+                    "id": row[0],
+                    "remote_id": row[1],
+                    "due_date": (
+                        date.fromisoformat(row[2]) if row[2] is not None else None
+                    ),
+                    "state": row[3],
+                    "project_id": row[4],
+                }
+
+    def fetch_sync_watermarks(self):
+        """Returns a dictionary mapping project IDs to their watermark at the
+        last synchronisation"""
+        return dict(
+            self.db_cursor.execute(
+                "SELECT project_id, watermark FROM sync_watermarks"
+            ).fetchall()
+        )
+
+    def save_sync(self, changed_rehearsals, deleted_rehearsals_ids, watermarks):
+        """Applies the changes found by a synchronisation along with the new
+        watermarks, in a single transaction. <changed_rehearsals> is a list of
+        dictionaries as yielded by <iter_synced_rehearsals>"""
+
+        with self.transaction():
+            self.db_cursor.executemany(
+                """UPDATE rehearsals SET due_date = ?, state = ?, project_id = ? WHERE id = ?""",
+                [
+                    (
+                        (
+                            rehearsal["due_date"].isoformat()
+                            if rehearsal["due_date"] is not None
+                            else None
+                        ),
+                        rehearsal["state"],
+                        rehearsal["project_id"],
+                        rehearsal["id"],
+                    )
+                    for rehearsal in changed_rehearsals
+                ],
+            )
+            self.db_cursor.executemany(
+                """DELETE FROM rehearsals WHERE id = ?""",
+                [(rehearsal_id,) for rehearsal_id in deleted_rehearsals_ids],
+            )
+            self.db_cursor.executemany(
+                """INSERT OR REPLACE INTO sync_watermarks (project_id, watermark, synced_at) VALUES (?, ?, ?)""",
+                [
+                    (project_ID, watermark, int(datetime.now().timestamp()))
+                    for project_ID, watermark in watermarks.items()
+                ],
+            )
+
+        # The rehearsals changed are not looked up by task
+        self.tasks_cache.clear()
+
+    def fetch_import_checkpoint(self, key):
+        """Returns a tuple of the form (last line, completed, content hash)
+        describing the progress of an import, its key being given (<None> if
+        it never started)"""
+
+        raw_data = self.db_cursor.execute(
+            "SELECT last_line, completed, content_hash FROM imports WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        return (
+            (raw_data[0], bool(raw_data[1]), raw_data[2])
+            if raw_data is not None
+            else None
+        )
+
+    def save_import_checkpoint(
+        self, key, path, content_hash, last_line, completed=False
+    ):
+        """Records the progress of an import, along with the hash of the content
+        imported (meant to be called in the same transaction as the insertion
+        of the imported tasks)"""
 
-        self.db_connection.commit()
+        with self.transaction():
+            self.db_cursor.execute(
+                """INSERT OR REPLACE INTO imports (key, path, last_line, completed, content_hash) VALUES (?, ?, ?, ?, ?)""",
+                (key, path, last_line, int(completed), content_hash),
+            )
 
     def __del__(self):
         """Cancels the connection to the local database"""
@@ -0,0 +1,324 @@
+"""This file contains the definition of the <TaskImporter> class, which creates
+tasks in bulk from a CSV or JSONL file (one task per row, with the title, the
+name of the project, the priority and the name of the rehearsal schema)"""
+
+import csv
+import hashlib
+import json
+import os
+import time
+from datetime import date
+
+from colorama import Fore
+
+from LoadLeveler import LoadLeveler
+
+
+class TaskImporter:
+    BATCH_SIZE = 200  # Number of rows inserted in each transaction
+    PROGRESS_DELAY = 1  # Delay (in seconds) between two progress reports
+
+    # Values accepted for the priority, besides TickTick's numerical ones
+    PRIORITIES = {"none": 0, "low": 1, "medium": 3, "high": 5}
+
+    def __init__(self, storage_manager, api_client, outbox_worker, daily_capacity=None):
+        """Initialises the attributes. The tasks are journaled in the outbox,
+        from which <outbox_worker> sends them concurrently (it may be <None>
+        when the import is only planned). If a
+        <daily_capacity> is given, the rehearsals are spread accordingly"""
+
+        self.storage_manager = storage_manager
+        self.api_client = api_client
+        self.outbox_worker = outbox_worker
+        self.daily_capacity = daily_capacity
+        self.leveler = None
+
+        # The projects and schemas are resolved once, by name
+        self.projects = {}
+        self.schemas = {}
+
+    @staticmethod
+    def file_key(path):
+        """Returns the key under which the progress of the import of a file is
+        recorded : its resolved path, so that a file changed after a partial
+        import is resumed rather than imported again"""
+        return os.path.realpath(path)
+
+    @staticmethod
+    def content_hash(path):
+        """Returns the hash of the content of a file, recorded along with the
+        progress of its import to tell whether it has changed since"""
+
+        digest = hashlib.sha256()
+
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def read_rows(path):
+        """Yields the rows of the file one at a time, as tuples of the form
+        (line number, dictionary). Files whose name ends with <.csv> must have
+        a header line, the other ones are read as JSON lines"""
+
+        with open(path, encoding="utf8", newline="") as file:
+            if path.lower().endswith(".csv"):
+                reader = csv.DictReader(file)
+
+                for row in reader:
+                    yield reader.line_num, row
+
+            else:
+                for line_number, line in enumerate(file, start=1):
+                    if line.strip() == "":
+                        continue
+
+                    # An unreadable line is reported as invalid by <resolve>
+                    try:
+                        yield line_number, json.loads(line)
+
+                    except json.JSONDecodeError:
+                        yield line_number, None
+
+    def resolve(self, row):
+        """Returns a tuple of the form (title, project ID, priority, schema ID,
+        schema) from a row of the file. Raises a <ValueError> if it is invalid"""
+
+        if not isinstance(row, dict):
+            raise ValueError("ligne illisible")
+
+        title = str(row.get("title") or "").strip()
+        project_name = str(row.get("project") or "").strip()
+        schema_name = str(row.get("schema") or "").strip()
+        priority = str(row.get("priority") or "none").strip().lower()
+
+        if title == "":
+            raise ValueError("titre manquant")
+
+        if project_name not in self.projects:
+            raise ValueError(f"matière inconnue « {project_name} »")
+
+        if schema_name not in self.schemas:
+            raise ValueError(f"schéma inconnu « {schema_name} »")
+
+        if priority in TaskImporter.PRIORITIES:
+            priority = TaskImporter.PRIORITIES[priority]
+
+        elif priority.isdigit() and int(priority) in TaskImporter.PRIORITIES.values():
+            priority = int(priority)
+
+        else:
+            raise ValueError(f"priorité invalide « {priority} »")
+
+        schema_id, schema = self.schemas[schema_name]
+        return title, self.projects[project_name], priority, schema_id, schema
+
+    def prepare(self, path):
+        """Reads the progress of a former import of the file, and resolves the
+        projects and schemas. Returns a tuple of the form (key of the file,
+        hash of its content, last line imported), or <None> if the file has
+        already been imported"""
+
+        key = TaskImporter.file_key(path)
+        content_hash = TaskImporter.content_hash(path)
+        checkpoint = self.storage_manager.fetch_import_checkpoint(key)
+        last_line = 0
+
+        if checkpoint is not None:
+            last_line, completed, former_content_hash = checkpoint
+
+            if content_hash == former_content_hash and completed:
+                print(Fore.YELLOW + "Ce fichier a déjà été importé")
+                return None
+
+            # The lines already imported are never imported again, even if
+            # they have changed (the lines added are imported, though)
+            if content_hash != former_content_hash:
+                print(
+                    Fore.YELLOW
+                    + f"Ce fichier a changé depuis son dernier import : les lignes 1 à {last_line} ne sont pas relues"
+                )
+
+        if last_line > 0:
+            print(Fore.YELLOW + f"Reprise de l'import après la ligne {last_line}")
+
+        self.projects = {
+            project["name"]: project["id"] for project in self.api_client.projects
+        }
+        self.schemas = {
+            schema_data.name: (schema_data.id, schema_data.schema)
+            for schema_data in self.storage_manager.iter_schemas()
+        }
+
+        # The same leveler is used for the whole file, so that the tasks
+        # imported are spread among themselves as well
+        if self.daily_capacity is not None:
+            self.leveler = LoadLeveler(
+                self.daily_capacity,
+                self.storage_manager.fetch_rehearsals_load(date.today()),
+            )
+
+        return key, content_hash, last_line
+
+    def rehearsals_dates(self, schema, start_date):
+        """Returns the date of each rehearsal of a task following <schema>,
+        spread by the leveler if there is one"""
+
+        if self.leveler is not None:
+            schema = self.leveler.level(schema, start_date)
+
+        return self.api_client.rehearsals_dates(schema, start_date)
+
+    def plan_file(self, path, plan):
+        """Adds the rehearsals the import of a file would create to <plan> (see
+        <Plan>), without importing anything. Returns the summary the import
+        would have (see <import_file>)"""
+
+        summary = {"imported": 0, "skipped": 0, "errors": []}
+        prepared = self.prepare(path)
+
+        if prepared is None:
+            return summary
+
+        _, _, last_line = prepared
+        start_date = date.today()
+
+        for line_number, row in self.read_rows(path):
+            if line_number <= last_line:
+                summary["skipped"] += 1
+                continue
+
+            try:
+                schema = self.resolve(row)[4]
+
+            except ValueError as error:
+                summary["errors"].append((line_number, str(error)))
+                continue
+
+            for task_date in self.rehearsals_dates(schema, start_date):
+                plan.add("create", task_date.date())
+
+            summary["imported"] += 1
+
+        return summary
+
+    def import_file(self, path):
+        """Imports the tasks of a file, resuming after the last row imported if
+        the same file has already been partially imported. The rows are
+        journaled in batched transactions (along with the progress of the
+        import), then we wait for the outbox to be sent. Returns a dictionary
+        summing the import up"""
+
+        prepared = self.prepare(path)
+
+        if prepared is None:
+            return {"imported": 0, "skipped": 0, "errors": []}
+
+        key, content_hash, last_line = prepared
+        summary = {"imported": 0, "skipped": 0, "errors": []}
+        rehearsals_count = 0
+        start = time.perf_counter()
+        batch = []
+        line_number = last_line
+
+        for line_number, row in self.read_rows(path):
+            if line_number <= last_line:
+                summary["skipped"] += 1
+                continue
+
+            try:
+                batch.append((line_number, self.resolve(row)))
+
+            except ValueError as error:
+                summary["errors"].append((line_number, str(error)))
+
+            if len(batch) >= TaskImporter.BATCH_SIZE:
+                rehearsals_count += self.save_batch(
+                    key, path, content_hash, batch, line_number
+                )
+                summary["imported"] += len(batch)
+                batch = []
+
+                self.report_progress(summary["imported"], start)
+
+        # The last batch also marks the import as completed
+        rehearsals_count += self.save_batch(
+            key,
+            path,
+            content_hash,
+            batch,
+            max(line_number, last_line),
+            completed=True,
+        )
+        summary["imported"] += len(batch)
+        self.report_progress(summary["imported"], start)
+        print()
+
+        for line_number, error in summary["errors"]:
+            print(Fore.RED + f"Ligne {line_number} ignorée : {error}")
+
+        self.wait_for_rehearsals(rehearsals_count)
+        return summary
+
+    def save_batch(self, key, path, content_hash, batch, last_line, completed=False):
+        """Journals the creation of a batch of tasks and records the progress of
+        the import (<last_line> being the last line read), in a single
+        transaction. Returns the number of rehearsals"""
+
+        rehearsals_count = 0
+        start_date = date.today()
+
+        with self.storage_manager.transaction():
+            for _, (title, project_id, priority, schema_id, schema) in batch:
+                tasks_dates = self.rehearsals_dates(schema, start_date)
+
+                self.storage_manager.queue_task_creation(
+                    schema_id,
+                    title,
+                    project_id,
+                    priority,
+                    start_date,
+                    [task_date.date() for task_date in tasks_dates],
+                    [
+                        self.api_client.task_payload(
+                            title, project_id, priority, task_date
+                        )
+                        for task_date in tasks_dates
+                    ],
+                )
+                rehearsals_count += len(tasks_dates)
+
+            self.storage_manager.save_import_checkpoint(
+                key, path, content_hash, last_line, completed
+            )
+
+        self.outbox_worker.notify()
+        return rehearsals_count
+
+    @staticmethod
+    def report_progress(imported_count, start):
+        """Prints the number of tasks imported so far, and the throughput"""
+
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        print(
+            Fore.YELLOW
+            + f"\r{imported_count} tâche(s) importée(s) ({imported_count / elapsed:.0f} tâches/s)",
+            end="",
+            flush=True,
+        )
+
+    def wait_for_rehearsals(self, rehearsals_count):
+        """Reports the progress of the creation of the rehearsals on TickTick,
+        until the outbox has been sent (the failed operations being retried in
+        the background)"""
+
+        pending_count = self.outbox_worker.wait_with_progress(
+            self.storage_manager, TaskImporter.PROGRESS_DELAY
+        )
+
+        if pending_count == 0:
+            print(
+                Fore.GREEN + f"{rehearsals_count} répétition(s) créée(s) avec succès\n"
+            )
@@ -0,0 +1,46 @@
+"""This file contains the definition of the <TaskRecord> class, a compact
+read-only record of a task read from the local database"""
+
+
+class TaskRecord:
+    # Without a dictionary per instance, a record only holds its fields
+    __slots__ = (
+        "id",
+        "schema_id",
+        "title",
+        "project_id",
+        "priority",
+        "start_date",
+        "rehearsals",
+    )
+
+    def __init__(
+        self, id, schema_id, title, project_id, priority, start_date, rehearsals
+    ):
+        """Initialises the fields (<rehearsals> being a tuple of
+        <RehearsalRecord>, in the order of the schema). The records are shared
+        with the cache, so they must not be changed"""
+
+        self.id = id
+        self.schema_id = schema_id
+        self.title = title
+        self.project_id = project_id
+        self.priority = priority
+        self.start_date = start_date
+        self.rehearsals = rehearsals
+
+    def __repr__(self):
+        return (
+            f"TaskRecord(id={self.id!r}, title={self.title!r}, "
+            f"rehearsals={len(self.rehearsals)})"
+        )
+
+    @property
+    def rehearsal_ids(self):
+        """Remote IDs of the rehearsals (<None> for those not created yet)"""
+        return tuple(rehearsal.remote_id for rehearsal in self.rehearsals)
+
+    @property
+    def rehearsal_dates(self):
+        """Due dates of the rehearsals (<None> for those whose date is unknown)"""
+        return tuple(rehearsal.due_date for rehearsal in self.rehearsals)
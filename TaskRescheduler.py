@@ -0,0 +1,292 @@
+"""This file contains the definition of the <TaskRescheduler> class, which
+moves the rehearsals of every task following a rehearsal schema when the
+schema is edited : only the rehearsals whose day has changed are touched"""
+
+from datetime import date, datetime, time, timedelta
+
+from colorama import Fore
+
+from LoadLeveler import LoadLeveler
+from RehearsalRecord import RehearsalRecord
+
+
+class TaskRescheduler:
+    PROGRESS_DELAY = 1  # Delay (in seconds) between two progress reports
+
+    def __init__(self, storage_manager, api_client, outbox_worker, daily_capacity=None):
+        """Initialises the attributes. The changes are journaled in the outbox,
+        from which <outbox_worker> sends them concurrently (it may be <None>
+        when the changes are only planned). If a <daily_capacity> is given,
+        the rehearsals moved or created are spread accordingly"""
+
+        self.storage_manager = storage_manager
+        self.api_client = api_client
+        self.outbox_worker = outbox_worker
+        self.daily_capacity = daily_capacity
+        self.leveler = None
+
+    @staticmethod
+    def diff(former_schema, new_schema):
+        """Compares two schemas (lists of day offsets). Returns a tuple of the
+        form (kept positions, former positions left) : the former has, for
+        each position of the new schema, the position of the former schema
+        with the same offset (<None> if there is none), and the latter the
+        former positions whose offset has disappeared"""
+
+        former_positions = {}
+
+        for position, day_delta in enumerate(former_schema):
+            former_positions.setdefault(day_delta, []).append(position)
+
+        kept_positions = [
+            (
+                former_positions[day_delta].pop(0)
+                if former_positions.get(day_delta)
+                else None
+            )
+            for day_delta in new_schema
+        ]
+        left_positions = sorted(
+            position
+            for positions in former_positions.values()
+            for position in positions
+        )
+
+        return kept_positions, left_positions
+
+    @staticmethod
+    def empty_summary():
+        """Returns a summary of a rescheduling where nothing has changed yet"""
+        return {
+            "tasks": 0,
+            "skipped": 0,
+            "kept": 0,
+            "moved": 0,
+            "created": 0,
+            "deleted": 0,
+            "completed": 0,
+            "postponed": 0,
+        }
+
+    def edit_schema(self, schema_id, name, new_schema):
+        """Edits a schema and reschedules the tasks following it : the
+        rehearsals whose offset is still in the schema are kept as they are,
+        the other ones are moved to the new offsets, and only the extra ones
+        are created or deleted. Everything is journaled in a single
+        transaction, along with the edition of the schema. Returns a
+        dictionary summing the changes up"""
+
+        former_schema = self.storage_manager.fetch_schema_data(schema_id).schema
+        summary = TaskRescheduler.empty_summary()
+
+        with self.storage_manager.transaction():
+            self.storage_manager.edit_schema(schema_id, name, new_schema)
+
+            for task, rehearsals, operations in self.reschedulings(
+                schema_id, former_schema, new_schema, summary
+            ):
+                self.storage_manager.queue_task_reschedule(
+                    task.id, rehearsals, operations
+                )
+
+        self.outbox_worker.notify()
+        return summary
+
+    def plan_edition(self, schema_id, new_schema, plan):
+        """Adds the requests the edition of a schema would send to <plan> (see
+        <Plan>), without changing anything. Returns the summary the edition
+        would have (see <edit_schema>)"""
+
+        former_schema = self.storage_manager.fetch_schema_data(schema_id).schema
+        summary = TaskRescheduler.empty_summary()
+
+        for _, rehearsals, operations in self.reschedulings(
+            schema_id, former_schema, new_schema, summary
+        ):
+            for operation, position, _ in operations:
+                plan.add(
+                    operation,
+                    rehearsals[position].due_date if position is not None else None,
+                )
+
+        return summary
+
+    def reschedulings(self, schema_id, former_schema, new_schema, summary):
+        """Yields the tasks following a schema one at a time, along with their
+        new rehearsals and the operations to be journaled (see <plan>), and
+        counts the changes in <summary>"""
+
+        kept_positions, left_positions = TaskRescheduler.diff(former_schema, new_schema)
+
+        # The same leveler is used for every task, so that the rehearsals
+        # moved are spread among themselves as well
+        if self.daily_capacity is not None:
+            self.leveler = LoadLeveler(
+                self.daily_capacity,
+                self.storage_manager.fetch_rehearsals_load(date.today()),
+            )
+
+        for task in self.storage_manager.iter_tasks(schema_id):
+            # The rehearsals can only be matched if they follow the schema
+            if task.start_date is None or len(task.rehearsals) != len(former_schema):
+                summary["skipped"] += 1
+                continue
+
+            rehearsals, operations = self.plan(
+                task, new_schema, kept_positions, left_positions, summary
+            )
+            summary["tasks"] += 1
+
+            yield task, rehearsals, operations
+
+    def plan(self, task, new_schema, kept_positions, left_positions, summary):
+        """Returns the new rehearsals of a task, along with the operations to be
+        journaled (see <StorageManager.queue_task_reschedule>), and counts the
+        changes in <summary>. The rehearsals already completed are never
+        moved nor deleted : when their offset has disappeared, they are only
+        left out of the task, and new ones are created if needed"""
+
+        former_rehearsals = task.rehearsals
+        left_rehearsals = []
+
+        for position in left_positions:
+            if former_rehearsals[position].state == "completed":
+                summary["completed"] += 1
+            else:
+                left_rehearsals.append(former_rehearsals[position])
+
+        left_rehearsals = iter(left_rehearsals)
+        new_dates = iter(
+            self.new_dates(
+                task,
+                [
+                    day_delta
+                    for day_delta, kept_position in zip(new_schema, kept_positions)
+                    if kept_position is None
+                ],
+                summary,
+            )
+        )
+        rehearsals = []
+        operations = []
+
+        for position, kept_position in enumerate(kept_positions):
+            if kept_position is not None:
+                rehearsal = former_rehearsals[kept_position]
+                summary["kept"] += 1
+
+            else:
+                # A rehearsal whose offset has disappeared is moved here if
+                # there is one left, and a new one is created otherwise
+                rehearsal = next(left_rehearsals, None)
+
+                if rehearsal is not None:
+                    summary["moved"] += 1
+                else:
+                    rehearsal = RehearsalRecord(None, None, "pending", None)
+                    summary["created"] += 1
+
+                rehearsal = rehearsal.moved(next(new_dates))
+
+            # The creations still pending are journaled again, at their new position
+            if rehearsal.remote_id is None:
+                operations.append(("create", position, self.payload(task, rehearsal)))
+
+            elif kept_position is None:
+                payload = self.payload(task, rehearsal)
+                payload["id"] = rehearsal.remote_id
+                operations.append(("update", position, payload))
+
+            rehearsals.append(rehearsal)
+
+        # The rehearsals left are deleted
+        for rehearsal in left_rehearsals:
+            summary["deleted"] += 1
+
+            if rehearsal.remote_id is not None:
+                operations.append(
+                    (
+                        "delete",
+                        None,
+                        {
+                            "projectId": rehearsal.project_id,
+                            "id": rehearsal.remote_id,
+                            "title": task.title,
+                            "startDate": (
+                                rehearsal.due_date.isoformat()
+                                if rehearsal.due_date is not None
+                                else None
+                            ),
+                        },
+                    )
+                )
+
+        return rehearsals, operations
+
+    def new_dates(self, task, day_deltas, summary):
+        """Returns the dates of the rehearsals of a task falling <day_deltas>
+        days after its start, spread by the leveler if there is one. Those
+        which would fall in the past are brought to today or later (and
+        counted in <summary>), so that no overdue rehearsal is sent to TickTick"""
+
+        # The rehearsals which would be overdue are leveled from today
+        elapsed_days = (date.today() - task.start_date).days
+        summary["postponed"] += sum(
+            1 for day_delta in day_deltas if day_delta < elapsed_days
+        )
+        day_deltas = [max(day_delta, elapsed_days) for day_delta in day_deltas]
+
+        if self.leveler is not None:
+            day_deltas = self.leveler.level(day_deltas, task.start_date)
+
+        return [task.start_date + timedelta(days=day_delta) for day_delta in day_deltas]
+
+    def payload(self, task, rehearsal):
+        """Returns the data to be sent to TickTick for a rehearsal of a task"""
+
+        return self.api_client.task_payload(
+            task.title,
+            rehearsal.project_id or task.project_id,
+            task.priority,
+            datetime.combine(rehearsal.due_date, time()),
+        )
+
+    def wait_for_operations(self):
+        """Reports the progress of the changes on TickTick, until the outbox has
+        been sent (the failed operations being retried in the background)"""
+
+        pending_count = self.outbox_worker.wait_with_progress(
+            self.storage_manager, TaskRescheduler.PROGRESS_DELAY
+        )
+
+        if pending_count == 0:
+            print(Fore.GREEN + "Tâches replanifiées avec succès\n")
+
+    @staticmethod
+    def report(summary):
+        """Prints the summary of a rescheduling"""
+
+        if summary["skipped"] > 0:
+            print(
+                Fore.RED
+                + f"{summary['skipped']} tâche(s) ignorée(s) : leurs répétitions ne suivent pas le schéma"
+            )
+
+        print(
+            Fore.YELLOW
+            + f"{summary['tasks']} tâche(s) replanifiée(s) : "
+            + f"{summary['kept']} répétition(s) conservée(s), {summary['moved']} déplacée(s), "
+            + f"{summary['created']} créée(s), {summary['deleted']} supprimée(s)"
+        )
+
+        if summary["completed"] > 0:
+            print(
+                Fore.YELLOW
+                + f"{summary['completed']} répétition(s) déjà faite(s) laissée(s) telle(s) quelle(s)"
+            )
+
+        if summary["postponed"] > 0:
+            print(
+                Fore.YELLOW
+                + f"{summary['postponed']} répétition(s) déjà passée(s) reportée(s) à aujourd'hui ou plus tard"
+            )
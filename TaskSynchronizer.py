@@ -0,0 +1,169 @@
+"""This file contains the definition of the <TaskSynchronizer> class, which
+brings the local rehearsals up to date with TickTick : the rehearsals that have
+been completed, deleted or moved there are updated locally"""
+
+import hashlib
+import json
+from datetime import date
+
+import requests
+from colorama import Fore
+
+
+class TaskSynchronizer:
+    def __init__(self, storage_manager, api_client):
+        """Initialises the attributes"""
+
+        self.storage_manager = storage_manager
+        self.api_client = api_client
+
+    @staticmethod
+    def watermark(tasks):
+        """Returns a digest of the tasks of a project : it changes whenever one
+        of them is created, edited, completed, moved or deleted"""
+
+        digest = hashlib.sha256()
+
+        for task in sorted(tasks, key=lambda task: task["id"]):
+            digest.update(json.dumps(task, sort_keys=True).encode("utf8"))
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def remote_date(task):
+        """Returns the day of a task on TickTick (<None> if it has none)"""
+
+        start_date = task.get("startDate")
+        return date.fromisoformat(start_date[:10]) if start_date else None
+
+    def synchronize(self):
+        """Fetches the tasks of every project concurrently, and compares the
+        rehearsals of the projects that changed since the last synchronisation
+        with them. Returns a dictionary summing the synchronisation up"""
+
+        projects_IDs = [project["id"] for project in self.api_client.projects]
+        projects_tasks = self.api_client.map_concurrently(
+            self.api_client.fetch_project_tasks, projects_IDs
+        )
+
+        # Only the projects whose tasks changed since the last time are compared
+        former_watermarks = self.storage_manager.fetch_sync_watermarks()
+        watermarks = {}
+        remote_tasks = {}
+        summary = {
+            "projects": len(projects_IDs),
+            "changed_projects": 0,
+            "failed_projects": 0,
+            "completed": 0,
+            "reopened": 0,
+            "deleted": 0,
+            "moved": 0,
+        }
+
+        for project_ID, tasks in zip(projects_IDs, projects_tasks):
+            if tasks is None:
+                summary["failed_projects"] += 1
+                continue
+
+            watermark = TaskSynchronizer.watermark(tasks)
+
+            if former_watermarks.get(project_ID) != watermark:
+                watermarks[project_ID] = watermark
+                remote_tasks.update({task["id"]: task for task in tasks})
+
+        summary["changed_projects"] = len(watermarks)
+
+        if len(watermarks) == 0:
+            return summary
+
+        changed_rehearsals = []
+        missing_rehearsals = []
+
+        for rehearsal in self.storage_manager.iter_synced_rehearsals(list(watermarks)):
+            task = remote_tasks.get(rehearsal["remote_id"])
+
+            if task is None:
+                # Completed tasks are not listed : we already know about this one
+                if rehearsal["state"] != "completed":
+                    missing_rehearsals.append(rehearsal)
+
+            elif self.compare(rehearsal, task, summary):
+                changed_rehearsals.append(rehearsal)
+
+        # The tasks which disappeared have either been completed or deleted
+        missing_tasks = self.api_client.map_concurrently(
+            self.fetch_missing_task, missing_rehearsals
+        )
+        deleted_rehearsals_ids = []
+
+        for rehearsal, task in zip(missing_rehearsals, missing_tasks):
+            if task is False:
+                # We do not know, so the project will be compared again next time
+                watermarks.pop(rehearsal["project_id"], None)
+
+            elif task is None:
+                deleted_rehearsals_ids.append(rehearsal["id"])
+                summary["deleted"] += 1
+
+            elif self.compare(rehearsal, task, summary):
+                changed_rehearsals.append(rehearsal)
+
+        self.storage_manager.save_sync(
+            changed_rehearsals, deleted_rehearsals_ids, watermarks
+        )
+
+        return summary
+
+    def fetch_missing_task(self, rehearsal):
+        """Returns the data of the task of a rehearsal which is not listed in its
+        project anymore (<None> if it has been deleted, <False> on failure)"""
+
+        try:
+            return self.api_client.fetch_task(
+                rehearsal["project_id"], rehearsal["remote_id"]
+            )
+
+        except requests.RequestException:
+            return False
+
+    @staticmethod
+    def compare(rehearsal, task, summary):
+        """Updates a rehearsal from the data of its task on TickTick, and counts
+        the changes in <summary>. Returns whether it changed"""
+
+        changed = False
+        state = "completed" if task.get("status") == 2 else "created"
+
+        if state != rehearsal["state"]:
+            summary["completed" if state == "completed" else "reopened"] += 1
+            rehearsal["state"] = state
+            changed = True
+
+        task_date = TaskSynchronizer.remote_date(task)
+        project_ID = task.get("projectId", rehearsal["project_id"])
+
+        if (task_date, project_ID) != (rehearsal["due_date"], rehearsal["project_id"]):
+            summary["moved"] += 1
+            rehearsal["due_date"] = task_date
+            rehearsal["project_id"] = project_ID
+            changed = True
+
+        return changed
+
+    @staticmethod
+    def report(summary):
+        """Prints the summary of a synchronisation"""
+
+        if summary["failed_projects"] > 0:
+            print(
+                Fore.RED
+                + f"{summary['failed_projects']} matière(s) n'ont pas pu être récupérée(s)"
+            )
+
+        print(
+            Fore.GREEN
+            + f"{summary['changed_projects']} matière(s) modifiée(s) sur {summary['projects']} : "
+            + f"{summary['completed']} répétition(s) terminée(s), "
+            + f"{summary['reopened']} rouverte(s), {summary['deleted']} supprimée(s), "
+            + f"{summary['moved']} déplacée(s)\n"
+        )
@@ -1,9 +1,8 @@
 """This file contains the definition of the <TickTickOAuth2> class, which
 manages the authentication process with the TickTick API"""
 
-import json
-import os.path
 import sys
+import threading
 import webbrowser
 from datetime import datetime
 from urllib.parse import parse_qsl, urlencode, urlparse
@@ -11,41 +10,91 @@ from urllib.parse import parse_qsl, urlencode, urlparse
 import requests
 from colorama import Fore
 
-# The two urls involved in the authentication process
-OAUTH_AUTHORIZE_URL = "https://ticktick.com/oauth/authorize"
-OAUTH_TOKEN_URL = "https://ticktick.com/oauth/token"
+from SharedSession import SharedSession
+from TokenStore import TokenStore
+
+# The two urls involved in the authentication process (built from a base URL,
+# which can be changed for benchmarks)
+OAUTH_BASE_URL = "https://ticktick.com"
+OAUTH_AUTHORIZE_URL = lambda baseUrl: f"{baseUrl}/oauth/authorize"
+OAUTH_TOKEN_URL = lambda baseUrl: f"{baseUrl}/oauth/token"
+
+
+class AuthenticationError(Exception):
+    """Raised when there is no valid token and the user cannot be asked for
+    a new one (see <TickTickOAuth2>)"""
 
 
 class TickTickOAuth2:
     TOKEN_FILE_PATH = "./token.json"  # Path of the file containing token info
+    REFRESH_MARGIN = 24 * 3600  # Delay (in seconds) before expiry to refresh a token
+    REFRESH_RETRY_DELAY = 60  # Delay (in seconds) before retrying a failed refresh
 
     # Values used for the authentication parameters
     SCOPE = "tasks:write tasks:read"
     GRANT_TYPE = "authorization_code"
+    REFRESH_GRANT_TYPE = "refresh_token"
     RESPONSE_TYPE = "code"
 
-    def __init__(self, client_id, client_secret, redirect_uri):
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        redirect_uri,
+        session=None,
+        base_url=OAUTH_BASE_URL,
+        interactive=True,
+    ):
         """Stores the client credentials and makes sure
-        there is a valid token for authentication"""
+        there is a valid token for authentication. The token is attached
+        to the given HTTP session (by default, the shared one). If it cannot
+        be refreshed and <interactive> is <False>, an <AuthenticationError> is
+        raised instead of asking the user to authenticate"""
 
         # Initialisation of the attributes
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
+        self.base_url = base_url
+        self.session = session if session is not None else SharedSession.get()
+
+        self.token = None
+        self.token_expire_date = 0
+        self.refresh_token = None
+        self._refresh_retry_date = 0
+        self._lock = threading.Lock()  # Only one thread refreshes the token
+
+        # The token file is only read once, and kept in memory afterwards (it
+        # is only read again when the token has to be refreshed)
+        self.token_store = TokenStore(TickTickOAuth2.TOKEN_FILE_PATH)
+        self._token_file_data = self.token_store.read()
+        stored_token_info = self.retrieve_local_client_token()
+
+        if stored_token_info is not None:
+            self.token, self.token_expire_date, self.refresh_token = stored_token_info
 
         # We check whether the stored token is valid and change it if necessary
         if self.validate_stored_token():
-            stored_token_info = self.retrieve_local_client_token()
-
-            self.token = stored_token_info[0]
-            self.token_expire_date = stored_token_info[1]
+            self.session.headers.update(self.auth_header)
 
             print(Fore.GREEN + "Données de connexion valides\n")
 
-        else:
-            # If the token is incorrect for some reason, we refresh it
+            # A token about to expire is refreshed right away
+            self.refresh_if_expiring()
+
+        # If the token is incorrect for some reason, we refresh it, without
+        # asking the user if we can
+        elif self.refresh_access_token():
+            print(Fore.GREEN + "Token renouvelé avec succès\n")
+
+        elif interactive:
             self.get_new_token()
 
+        else:
+            raise AuthenticationError(
+                "aucun token valide, lancez l'application sans commande pour vous authentifier"
+            )
+
     @property
     def auth_header(self):
         """Returns the appropriate auth header to be sent
@@ -66,7 +115,7 @@ class TickTickOAuth2:
         }
 
         webbrowser.open(
-            f"{OAUTH_AUTHORIZE_URL}?{urlencode(authorize_payload)}"
+            f"{OAUTH_AUTHORIZE_URL(self.base_url)}?{urlencode(authorize_payload)}"
         )  # Opens the tab in the browser
 
         # We get the code from the URL where the user has been redirected
@@ -83,13 +132,72 @@ class TickTickOAuth2:
             "redirect_uri": self.redirect_uri,
         }
 
-        response = requests.post(OAUTH_TOKEN_URL, data=access_token_request_data)
-
         # We check if the request failed
-        if response.status_code != requests.codes.ok:
+        if not self.request_token(access_token_request_data):
             print(Fore.RED + "Erreur fatale : impossible de s'authentifier")
             sys.exit(1)
 
+        print(Fore.GREEN + "Token récupéré avec succès\n")
+
+    def refresh_access_token(self):
+        """Asks TickTick API for a new access token with the refresh token,
+        without any action from the user. Other processes wait meanwhile, and
+        if one of them has already refreshed the token, we use its token
+        instead. Returns <False> if it failed"""
+
+        with self.token_store.lock():
+            if self.adopt_stored_token():
+                return True
+
+            if self.refresh_token is None:
+                return False
+
+            refresh_token_request_data = {
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "refresh_token": self.refresh_token,
+                "grant_type": TickTickOAuth2.REFRESH_GRANT_TYPE,
+                "scope": TickTickOAuth2.SCOPE,
+            }
+
+            return self.request_token(refresh_token_request_data)
+
+    def adopt_stored_token(self):
+        """Uses the token stored by another process, if it differs from ours
+        and has not expired. Returns <True> if so"""
+
+        self._token_file_data = self.token_store.read()
+        stored_token_info = self.retrieve_local_client_token()
+
+        if (
+            stored_token_info is None
+            or stored_token_info[0] == self.token
+            or stored_token_info[1] <= datetime.now().timestamp()
+        ):
+            return False
+
+        self.token, self.token_expire_date, self.refresh_token = stored_token_info
+        self.session.headers.update(self.auth_header)
+        return True
+
+    def request_token(self, token_request_data):
+        """Sends a request to the token endpoint, and uses the token received.
+        Returns <False> if the request failed"""
+
+        # The header of a former token must not be sent to the OAuth server
+        try:
+            response = self.session.post(
+                OAUTH_TOKEN_URL(self.base_url),
+                data=token_request_data,
+                headers={"Authorization": None},
+            )
+
+        except requests.RequestException:
+            return False
+
+        if response.status_code != requests.codes.ok:
+            return False
+
         # If everything went good, we can update the token
         token_info = response.json()
 
@@ -98,36 +206,78 @@ class TickTickOAuth2:
             int(datetime.now().timestamp()) + token_info["expires_in"]
         )
 
+        # TickTick may keep the same refresh token, and thus not send it again
+        self.refresh_token = token_info.get("refresh_token", self.refresh_token)
+        self.session.headers.update(self.auth_header)
+
         self.refresh_stored_token()
-        print(Fore.GREEN + "Token récupéré avec succès\n")
+        return True
+
+    def refresh_if_expiring(self):
+        """Refreshes the token if it expires soon, when it can be done without
+        the user. Called before each request, so it must stay cheap"""
+
+        now = datetime.now().timestamp()
+
+        if (
+            self.refresh_token is None
+            or self.token_expire_date - now > TickTickOAuth2.REFRESH_MARGIN
+            or now < self._refresh_retry_date
+        ):
+            return
+
+        with self._lock:
+            # Another thread may have refreshed it in the meantime
+            if (
+                self.token_expire_date - now <= TickTickOAuth2.REFRESH_MARGIN
+                and now >= self._refresh_retry_date
+                and not self.refresh_access_token()
+            ):
+                # The current token may still be valid, so we wait a bit
+                self._refresh_retry_date = now + TickTickOAuth2.REFRESH_RETRY_DELAY
+
+    def handle_unauthorized(self, rejected_token):
+        """Refreshes the token after <rejected_token> has been rejected by the
+        API. Returns <True> if the request can be sent again with a new token
+        (the user is never asked, so that long jobs do not stall)"""
+
+        with self._lock:
+            # Another thread may have refreshed it in the meantime
+            if self.token != rejected_token:
+                return True
+
+            return self.refresh_access_token()
 
     def refresh_stored_token(self):
-        """Saves the current access token into the local storage file"""
-        token_file_data = self.retrieve_token_file_data()
+        """Saves the current access token into the local storage file. The file
+        is read again beforehand, as other processes may have changed the
+        tokens of other clients"""
 
-        # If the file did not exist, we start from an empty dict
-        if token_file_data is None:
-            token_file_data = {}
+        with self.token_store.lock():
+            token_file_data = self.token_store.read()
 
-        token_file_data[self.client_id] = {
-            "access_token": self.token,
-            "expire_date": self.token_expire_date,
-        }
+            # If the file did not exist, we start from an empty dict
+            if token_file_data is None:
+                token_file_data = {}
 
-        # Here we effectively change the file (it is created if it was missing)
-        with open(TickTickOAuth2.TOKEN_FILE_PATH, "w", encoding="utf8") as file:
-            json.dump(token_file_data, file, ensure_ascii=False)
+            token_file_data[self.client_id] = {
+                "access_token": self.token,
+                "expire_date": self.token_expire_date,
+            }
+
+            if self.refresh_token is not None:
+                token_file_data[self.client_id]["refresh_token"] = self.refresh_token
+
+            # Here we effectively change the file (it is created if it was missing)
+            self.token_store.write(token_file_data)
+            self._token_file_data = token_file_data
 
     def validate_stored_token(self):
         """Checks wether there exists a valid access token or not"""
 
-        stored_token_info = self.retrieve_token_file_data()
-
         # Checks wether the token exists
-        if stored_token_info is not None:
-            expire_date = datetime.fromtimestamp(
-                stored_token_info[self.client_id]["expire_date"]
-            )
+        if self.token is not None:
+            expire_date = datetime.fromtimestamp(self.token_expire_date)
 
             # Checks whether the token is expired
             if datetime.today() < expire_date:
@@ -142,10 +292,11 @@ class TickTickOAuth2:
             return False
 
     def retrieve_local_client_token(self):
-        """Retrieves the token associated with the
-        client from the local storage file"""
+        """Retrieves the token associated with the client from the content of
+        the local storage file, as a tuple of the form (access token, expire
+        date, refresh token)"""
 
-        token_file_info = self.retrieve_token_file_data()
+        token_file_info = self._token_file_data
 
         if (
             (token_file_info is not None)
@@ -158,23 +309,8 @@ class TickTickOAuth2:
             return (
                 token_file_info[self.client_id]["access_token"],
                 token_file_info[self.client_id]["expire_date"],
+                token_file_info[self.client_id].get("refresh_token"),
             )
 
         else:
             return None
-
-    @staticmethod
-    def retrieve_token_file_data():
-        """Retrieves the content of the token file"""
-
-        # We check wether the file exists
-        if os.path.isfile(TickTickOAuth2.TOKEN_FILE_PATH):
-            with open(TickTickOAuth2.TOKEN_FILE_PATH, encoding="utf8") as file:
-                try:
-                    return json.load(file)
-
-                except json.JSONDecodeError:
-                    return None
-
-        else:
-            return None
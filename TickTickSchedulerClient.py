@@ -3,98 +3,615 @@ which allows the script to properly interact with TickTick's API for task
 creation, edition and deletion"""
 
 import json
+import random
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import *
+from email.utils import parsedate_to_datetime
+from time import perf_counter, sleep
 
 import requests
 from colorama import Fore
 
-from TickTickOAuth2 import TickTickOAuth2
+from ConcurrencyController import ConcurrencyController
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+from StorageManager import StorageManager
+from TickTickOAuth2 import OAUTH_BASE_URL, TickTickOAuth2
 
-# TickTick's API URLs
+# TickTick's API URLs (built from a base URL, which can be changed for benchmarks)
 BASE_URL = "https://api.ticktick.com"
-CREATE_TASK_URL = f"{BASE_URL}/open/v1/task"
+CREATE_TASK_URL = lambda baseUrl: f"{baseUrl}/open/v1/task"
 DELETE_TASK_URL = (
-    lambda projectId, taskId: f"{BASE_URL}/open/v1/project/{projectId}/task/{taskId}"
+    lambda baseUrl, projectId, taskId: f"{baseUrl}/open/v1/project/{projectId}/task/{taskId}"
 )
-GET_PROJECTS_URL = f"{BASE_URL}/open/v1/project"
+UPDATE_TASK_URL = lambda baseUrl, taskId: f"{baseUrl}/open/v1/task/{taskId}"
+GET_TASK_URL = DELETE_TASK_URL
+GET_PROJECTS_URL = lambda baseUrl: f"{baseUrl}/open/v1/project"
+GET_PROJECT_DATA_URL = (
+    lambda baseUrl, projectId: f"{baseUrl}/open/v1/project/{projectId}/data"
+)
+
+
+class BatchCreationError(Exception):
+    """Raised when a batch of rehearsals could not be created. The rehearsals
+    created before the failure have been deleted again, except the ones
+    listed in <orphans> as (project ID, task ID) pairs, whose deletion failed"""
+
+    def __init__(self, orphans):
+        super().__init__(f"{len(orphans)} rehearsal(s) left on TickTick")
+        self.orphans = orphans
 
 
 class TickTickSchedulerClient:
-    def __init__(self, client_id, client_secret, redirect_uri, task_group_id, tasks_tag="révision"):
-        """Initialises the attributes, the OAuth2 client and fetches the projects
-        associated with the specified group of tasks"""
+    MAX_WORKERS = 8  # Maximum number of requests sent simultaneously
+    INITIAL_CONCURRENCY = 4  # Number of requests sent simultaneously at first
+    MAX_REQUESTS_PER_SECOND = 10  # Average pace of the requests sent to the API
+    MAX_REQUESTS_BURST = 20  # Number of requests that can be sent at once when idle
+    PROJECTS_CACHE_TTL = 24 * 3600  # Lifetime (in seconds) of the cached projects
+    MAX_ATTEMPTS = 5  # Number of attempts for a request the API failed to serve
+    RETRY_DELAY = 0.5  # Delay (in seconds) before the first retry, doubled each time
+    MAX_RETRY_DELAY = 30
+
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        redirect_uri,
+        task_group_id,
+        tasks_tag="révision",
+        base_url=BASE_URL,
+        session=None,
+        storage_manager=None,
+        oauth_base_url=OAUTH_BASE_URL,
+        interactive=True,
+    ):
+        """Initialises the attributes, the OAuth2 client and retrieves the projects
+        associated with the specified group of tasks (from the cache kept by
+        <storage_manager>, if given). All the requests go through the HTTP
+        session of the OAuth2 client, which carries the auth header (see
+        <TickTickOAuth2> for <interactive>)"""
 
         self.tasks_tag = tasks_tag
+        self.base_url = base_url
 
         # Initialisation of the OAuth client
-        self.oauth_client = TickTickOAuth2(client_id, client_secret, redirect_uri)
+        self.oauth_client = TickTickOAuth2(
+            client_id, client_secret, redirect_uri, session, oauth_base_url, interactive
+        )
+        self.session = self.oauth_client.session
+        self.rate_limiter = RateLimiter(
+            TickTickSchedulerClient.MAX_REQUESTS_PER_SECOND,
+            TickTickSchedulerClient.MAX_REQUESTS_BURST,
+        )
+        self.concurrency = ConcurrencyController(
+            TickTickSchedulerClient.INITIAL_CONCURRENCY,
+            TickTickSchedulerClient.MAX_WORKERS,
+        )
+
+        # The projects are served from the local cache when there is one (it is
+        # refreshed in the background if it is stale), and fetched otherwise
+        self.task_group_id = task_group_id
+        self._client_projects = []
+        cached_projects, fetched_at = None, None
+
+        if storage_manager is not None:
+            cached_projects, fetched_at = storage_manager.fetch_cached_projects(
+                task_group_id
+            )
+
+        if cached_projects:
+            self._client_projects = cached_projects
+
+            if (
+                datetime.now().timestamp() - fetched_at
+                > TickTickSchedulerClient.PROJECTS_CACHE_TTL
+            ):
+                threading.Thread(
+                    target=self.refresh_projects_in_background, daemon=True
+                ).start()
+
+        else:
+            print(Fore.YELLOW + "Récupération des projets...")
+
+            if not self.refresh_projects(storage_manager):
+                print(Fore.RED + "Impossible de récupérer les projets")
+                sys.exit(1)
+
+            print(Fore.GREEN + "Projets récupérés avec succès\n")
+
+    def request(self, method, url, **kwargs):
+        """Sends a request to TickTick's API through the shared session, once
+        the rate limiter and the concurrency controller allow it. The requests
+        throttled (429) or failed (5xx, network error) are retried, following
+        the <Retry-After> header when there is one. A creation may have
+        reached TickTick before failing, so it is only retried when throttled
+        (the outbox looks for it before sending it again). A request refused
+        because of the token (401) is sent again once the token has been
+        refreshed. The last response is returned as is, and the last network
+        error is raised"""
+
+        idempotent = method.upper() != "POST" or url != CREATE_TASK_URL(self.base_url)
+        reauthenticated = False
+
+        for attempt in range(TickTickSchedulerClient.MAX_ATTEMPTS):
+            last_attempt = attempt == TickTickSchedulerClient.MAX_ATTEMPTS - 1
+            response, latency = None, None
+
+            self.oauth_client.refresh_if_expiring()
+            token = self.oauth_client.token
+            self.concurrency.acquire()
+
+            try:
+                self.rate_limiter.acquire()
+                start = perf_counter()
+                response = self.session.request(method, url, **kwargs)
+                latency = perf_counter() - start
+
+            except requests.exceptions.RequestException:
+                Metrics.increment("http_errors_total", Metrics.endpoint(method, url))
+
+                if last_attempt or not idempotent:
+                    raise
+
+            finally:
+                self.concurrency.release(
+                    latency,
+                    overloaded=response is None
+                    or response.status_code == 429
+                    or response.status_code >= 500,
+                )
+
+            if response is not None:
+                # The token may have expired or been revoked since it was checked
+                if (
+                    response.status_code == 401
+                    and not (last_attempt or reauthenticated)
+                    and self.oauth_client.handle_unauthorized(token)
+                ):
+                    reauthenticated = True
+                    Metrics.increment(
+                        "http_retries_total",
+                        Metrics.endpoint(method, url) + (("reason", "unauthorized"),),
+                    )
+                    continue
+
+                throttled = response.status_code == 429
+                failed = response.status_code >= 500
+
+                if last_attempt or not (throttled or failed and idempotent):
+                    return response
+
+            if response is None:
+                reason = "network_error"
+            elif response.status_code == 429:
+                reason = "throttled"
+            else:
+                reason = "server_error"
+
+            Metrics.increment(
+                "http_retries_total",
+                Metrics.endpoint(method, url) + (("reason", reason),),
+            )
+            delay = TickTickSchedulerClient.retry_delay(response, attempt)
+
+            # A throttling applies to the whole client, not only to this request
+            if response is not None and response.status_code == 429:
+                self.rate_limiter.pause(delay)
+            else:
+                sleep(delay)
+
+    @staticmethod
+    def retry_delay(response, attempt):
+        """Returns the delay (in seconds) before retrying a request, from the
+        <Retry-After> header of <response> (a number of seconds or an HTTP
+        date) if there is one, and with an exponential backoff otherwise"""
 
-        # We retrieve the projects of the user
-        print(Fore.YELLOW + "Récupération des projets...")
+        retry_after = None if response is None else response.headers.get("Retry-After")
 
-        projects_response = requests.get(
-            GET_PROJECTS_URL, headers=self.oauth_client.auth_header
+        if retry_after is not None:
+            try:
+                delay = float(retry_after)
+
+            except ValueError:
+                try:
+                    delay = (
+                        parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)
+                    ).total_seconds()
+
+                except (TypeError, ValueError):
+                    delay = None
+
+            if delay is not None:
+                return min(max(delay, 0), TickTickSchedulerClient.MAX_RETRY_DELAY)
+
+        # The jitter keeps concurrent requests from being retried all at once
+        delay = TickTickSchedulerClient.RETRY_DELAY * 2**attempt
+        return min(delay, TickTickSchedulerClient.MAX_RETRY_DELAY) * random.uniform(
+            0.5, 1
         )
 
+    @property
+    def projects(self):
+        """Accessor method for the client projects"""
+        return self._client_projects
+
+    def refresh_projects(self, storage_manager=None):
+        """Fetches the projects associated with the group of tasks, and stores
+        them in the local cache if a <StorageManager> is given. Returns whether
+        the projects could be fetched (if not, the former ones are kept)"""
+
+        try:
+            projects_response = self.request("GET", GET_PROJECTS_URL(self.base_url))
+
+        except requests.RequestException:
+            return False
+
         if projects_response.status_code != requests.codes.ok:
-            print(Fore.RED + "Impossible de récupérer les projets")
-            sys.exit(1)
+            return False
 
         # We only keep the projects belonging to the specified group
         self._client_projects = list(
             filter(
                 lambda project: "groupId" in project
-                and project["groupId"] == task_group_id,
+                and project["groupId"] == self.task_group_id,
                 projects_response.json(),
             )
         )
-        print(Fore.GREEN + "Projets récupérés avec succès\n")
 
-    @property
-    def projects(self):
-        """Accessor method for the client projects"""
-        return self._client_projects
+        if storage_manager is not None:
+            storage_manager.cache_projects(self.task_group_id, self._client_projects)
 
-    def batch_create_tasks(self, title, project_ID, priority, schema):
-        """Creates multiple tasks according to a rehearsal schema"""
+        return True
 
-        # We need to save the IDs of the tasks we create here for later modifications
-        tasks_ids = []
+    def refresh_projects_in_background(self):
+        """Refreshes the projects from another thread (which needs its own
+        connection to the local database)"""
+        self.refresh_projects(StorageManager())
 
-        # We iterate through the schema and create a task for each rehearsal
-        for day_delta in schema:
-            task_date = datetime.combine(date.today(), time()) + timedelta(days=day_delta)
+    def task_payload(self, title, project_ID, priority, task_date):
+        """Returns the data describing a single all-day rehearsal"""
 
-            # Payload to be sent with the request
-            task_data = {
-                "title": title,
-                "projectId": project_ID,
-                "startDate": f"{task_date.strftime("%Y-%m-%dT%H:%M:%S")}+0000",
-                "priority": priority,
-                "isAllDay": True,
-                "tags": [self.tasks_tag],
-            }
+        return {
+            "title": title,
+            "projectId": project_ID,
+            "startDate": f"{task_date.strftime('%Y-%m-%dT%H:%M:%S')}+0000",
+            "priority": priority,
+            "isAllDay": True,
+            "tags": [self.tasks_tag],
+        }
 
-            response = requests.post(CREATE_TASK_URL, data=json.dumps(task_data), headers=self.oauth_client.auth_header)
+    @staticmethod
+    def rehearsals_dates(schema, start_date=None):
+        """Returns the date of each rehearsal of a schema, counted from <start_date>
+        (by default, today)"""
 
-            if response.status_code != requests.codes.ok:
-                print(Fore.RED + "Impossible de créer les tâches")
-                sys.exit(1)
-            
-            tasks_ids.append(response.json()['id'])
-
-        return tasks_ids
-            
-    def batch_delete_tasks(self, project_ID, tasks_ids):
-        """Deletes the tasks associated with the given IDs"""
-
-        for id in tasks_ids:
-            response = requests.delete(
-                DELETE_TASK_URL(project_ID, id),
-                headers=self.oauth_client.auth_header,
+        if start_date is None:
+            start_date = date.today()
+
+        start = datetime.combine(start_date, time())
+        return [start + timedelta(days=day_delta) for day_delta in schema]
+
+    def send_task_creation(self, task_data):
+        """Tries to create a single task on TickTick from its payload. Returns a
+        tuple of the form (ID, uncertain) : the ID is <None> if the request
+        failed, in which case <uncertain> tells whether the task may have been
+        created anyway (the request failed without a response)"""
+
+        try:
+            response = self.request(
+                "POST", CREATE_TASK_URL(self.base_url), data=json.dumps(task_data)
             )
 
-            if response.status_code != requests.codes.ok:
-                print(Fore.RED + "Erreur : impossible de supprimer la tâche")
-                sys.exit(1)
+        except requests.RequestException:
+            return None, True
+
+        if response.status_code != requests.codes.ok:
+            return None, False
+
+        return response.json()["id"], False
+
+    def fetch_project_tasks(self, project_ID):
+        """Returns the uncompleted tasks of a project, as a list of dictionaries
+        (<None> if the project could not be fetched)"""
+
+        try:
+            response = self.request(
+                "GET", GET_PROJECT_DATA_URL(self.base_url, project_ID)
+            )
+
+        except requests.RequestException:
+            return None
+
+        if response.status_code != requests.codes.ok:
+            return None
+
+        return response.json().get("tasks", [])
+
+    def fetch_task(self, project_ID, task_ID):
+        """Returns the data of a single task, completed or not (<None> if it does
+        not exist anymore). Raises a <requests.RequestException> if it could
+        not be fetched"""
+
+        response = self.request("GET", GET_TASK_URL(self.base_url, project_ID, task_ID))
+
+        if response.status_code == requests.codes.not_found:
+            return None
+
+        response.raise_for_status()
+        return response.json()
+
+    def find_task(self, task_data):
+        """Looks for a task matching the given payload (see <find_tasks>).
+        Returns its ID, or <None> if there is no such task or if the project
+        could not be fetched"""
+        return next(iter(self.find_tasks(task_data)), None)
+
+    def find_tasks(self, task_data):
+        """Returns the IDs of the tasks matching the given payload (same title,
+        tags and day) among the tasks of its project, as a list (empty if the
+        project could not be fetched)"""
+
+        return [
+            task["id"]
+            for task in self.fetch_project_tasks(task_data["projectId"]) or []
+            if (
+                task.get("title") == task_data["title"]
+                and task.get("tags") == task_data["tags"]
+                and task.get("startDate", "")[:10] == task_data["startDate"][:10]
+            )
+        ]
+
+    def try_update_task(self, task_data):
+        """Tries to update an existing task in place from its payload (which
+        holds its ID) and returns whether it succeeded (a task that does not
+        exist anymore counts as updated : there is nothing left to update)"""
+
+        try:
+            response = self.request(
+                "POST",
+                UPDATE_TASK_URL(self.base_url, task_data["id"]),
+                data=json.dumps(task_data),
+            )
+
+        except requests.RequestException:
+            return False
+
+        return response.status_code in (requests.codes.ok, requests.codes.not_found)
+
+    def try_delete_task(self, project_ID, task_ID):
+        """Tries to delete a single task from TickTick and returns whether it
+        succeeded (a task that does not exist anymore counts as deleted)"""
+
+        try:
+            response = self.request(
+                "DELETE", DELETE_TASK_URL(self.base_url, project_ID, task_ID)
+            )
+
+        except requests.RequestException:
+            return False
+
+        return response.status_code in (requests.codes.ok, requests.codes.not_found)
+
+    @staticmethod
+    def map_concurrently(function, arguments, max_workers=None):
+        """Calls <function> on each element of <arguments>, at most <max_workers>
+        calls running at the same time (1 meaning sequentially). The results
+        are returned in the order of the arguments"""
+
+        if max_workers is None:
+            max_workers = TickTickSchedulerClient.MAX_WORKERS
+
+        arguments = list(arguments)
+
+        if max_workers <= 1 or len(arguments) <= 1:
+            return [function(argument) for argument in arguments]
+
+        # <map> yields the results in the order of the inputs, whatever the order
+        # in which the requests complete
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(arguments))
+        ) as executor:
+            return list(executor.map(function, arguments))
+
+    def create_all(self, payloads, max_workers=None):
+        """Creates a task for each payload, concurrently, and returns their IDs
+        in the same order. If a creation fails, the tasks already created are
+        deleted concurrently (along with the one a failed request may have
+        created anyway) and a <BatchCreationError> is raised, so that no
+        rehearsal is left on TickTick without a local record"""
+
+        results = self.map_concurrently(self.send_task_creation, payloads, max_workers)
+        tasks_ids = [task_ID for task_ID, _ in results]
+
+        if None not in tasks_ids:
+            return tasks_ids
+
+        # A request that failed without a response may have reached TickTick
+        ghost_ids = iter(
+            self.map_concurrently(
+                self.find_task,
+                [
+                    payload
+                    for payload, (task_ID, uncertain) in zip(payloads, results)
+                    if uncertain
+                ],
+                max_workers,
+            )
+        )
+        tasks_ids_by_project = {}
+
+        for payload, (task_ID, uncertain) in zip(payloads, results):
+            if uncertain:
+                task_ID = next(ghost_ids)
+
+            if task_ID is not None:
+                tasks_ids_by_project.setdefault(payload["projectId"], []).append(
+                    task_ID
+                )
+
+        raise BatchCreationError(
+            self.bulk_delete_tasks(tasks_ids_by_project, max_workers)
+        )
+
+    @staticmethod
+    def plan_edit_tasks(
+        former_task, former_dates, title, project_ID, priority, new_dates
+    ):
+        """Returns the requests turning the rehearsals of <former_task> (a
+        <TaskRecord>, whose dates are given by <former_dates>, or <None> if
+        they are unknown) into those falling on <new_dates>, without sending
+        anything : rehearsals falling on an unchanged date are kept (and only
+        updated if the title or the priority has changed), the other ones are
+        moved in place, and only the extra ones are created or deleted.
+        The result is a dictionary holding the new <dates>, the <ids> in their
+        order (<None> for the rehearsals to be created), the <projects> of the
+        kept rehearsals which are not in <project_ID> (<None> otherwise), the
+        <creations> (as positions), the <updates> (as (task ID, date, project
+        ID) triples) and the <deletions> (as (project ID, task ID) pairs)"""
+
+        # A rehearsal may have been moved to another project on TickTick, so
+        # we always address it in the project it was recorded in
+        former_rehearsals = former_task.rehearsals
+        edition = {
+            "dates": new_dates,
+            "ids": [None] * len(new_dates),
+            "projects": [None] * len(new_dates),
+            "creations": [],
+            "updates": [],
+            "deletions": [],
+        }
+
+        # TickTick does not allow to move a task to another project, so we
+        # have no choice but to recreate everything
+        if project_ID != former_task.project_id:
+            edition["creations"] = list(range(len(new_dates)))
+            edition["deletions"] = [
+                (rehearsal.project_id, rehearsal.remote_id)
+                for rehearsal in former_rehearsals
+            ]
+            return edition
+
+        if former_dates is None:
+            former_dates = [None] * len(former_rehearsals)
+
+        fields_changed = (title, priority) != (former_task.title, former_task.priority)
+
+        def keep(rehearsal, position):
+            edition["ids"][position] = rehearsal.remote_id
+
+            if rehearsal.project_id != project_ID:
+                edition["projects"][position] = rehearsal.project_id
+
+        # First, we keep the rehearsals that already fall on a date of the new schema
+        unmatched_positions = list(range(len(new_dates)))
+        unmatched_rehearsals = []
+
+        for rehearsal, task_date in zip(former_rehearsals, former_dates):
+            position = next(
+                (i for i in unmatched_positions if new_dates[i] == task_date), None
+            )
+
+            if position is None:
+                unmatched_rehearsals.append(rehearsal)
+                continue
+
+            unmatched_positions.remove(position)
+            keep(rehearsal, position)
+
+            if fields_changed:
+                edition["updates"].append(
+                    (rehearsal.remote_id, task_date, rehearsal.project_id)
+                )
+
+        # The remaining rehearsals are moved to the remaining dates
+        for rehearsal, position in zip(unmatched_rehearsals, unmatched_positions):
+            keep(rehearsal, position)
+            edition["updates"].append(
+                (rehearsal.remote_id, new_dates[position], rehearsal.project_id)
+            )
+
+        # Finally, we create or delete the rehearsals that are missing or superfluous
+        edition["creations"] = unmatched_positions[len(unmatched_rehearsals) :]
+        edition["deletions"] = [
+            (rehearsal.project_id, rehearsal.remote_id)
+            for rehearsal in unmatched_rehearsals[len(unmatched_positions) :]
+        ]
+
+        return edition
+
+    def apply_edit_plan(self, edition, title, project_ID, priority, max_workers=None):
+        """Sends the requests of an edition (see <plan_edit_tasks>). Returns a
+        tuple of the form (IDs of the rehearsals in the order of the new
+        dates, failures) : the updates and deletions that failed are listed
+        as (operation, payload) pairs, to be journaled in the outbox.
+        The creations are sent first : if one of them fails, a
+        <BatchCreationError> is raised before anything else has changed"""
+
+        new_ids = list(edition["ids"])
+
+        # The creations can be undone, so they are sent before everything else
+        created_ids = self.create_all(
+            [
+                self.task_payload(
+                    title, project_ID, priority, edition["dates"][position]
+                )
+                for position in edition["creations"]
+            ],
+            max_workers,
+        )
+
+        for position, task_ID in zip(edition["creations"], created_ids):
+            new_ids[position] = task_ID
+
+        # The updates and deletions cannot be undone, so a failure does not
+        # stop the other ones : it is returned, to be retried later
+        operations = []
+
+        for task_ID, task_date, task_project_ID in edition["updates"]:
+            payload = self.task_payload(title, task_project_ID, priority, task_date)
+            payload["id"] = task_ID
+            operations.append(("update", payload))
+
+        for deleted_project_ID, task_ID in edition["deletions"]:
+            operations.append(
+                (
+                    "delete",
+                    {"projectId": deleted_project_ID, "id": task_ID, "title": title},
+                )
+            )
+
+        succeeded = self.map_concurrently(
+            lambda operation: (
+                self.try_update_task(operation[1])
+                if operation[0] == "update"
+                else self.try_delete_task(operation[1]["projectId"], operation[1]["id"])
+            ),
+            operations,
+            max_workers,
+        )
+
+        return new_ids, [
+            operation
+            for operation, success in zip(operations, succeeded)
+            if not success
+        ]
+
+    def bulk_delete_tasks(self, tasks_ids_by_project, max_workers=None):
+        """Deletes many tasks at once, given as a dictionary mapping project IDs
+        to lists of task IDs. The requests are sent concurrently and a failure
+        does not stop the other deletions : the (project ID, task ID) pairs of
+        the tasks that could not be deleted are returned"""
+
+        tasks = [
+            (project_ID, task_ID)
+            for project_ID, tasks_ids in tasks_ids_by_project.items()
+            for task_ID in tasks_ids
+        ]
+
+        deleted = self.map_concurrently(
+            lambda task: self.try_delete_task(*task), tasks, max_workers
+        )
+
+        return [task for task, success in zip(tasks, deleted) if not success]
@@ -0,0 +1,116 @@
+"""This file contains the definition of the <TokenStore> class, which reads
+and writes the token file safely when several processes of the app use it at
+the same time (the file is locked, and replaced atomically when written)"""
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+
+except ImportError:  # Windows
+    import msvcrt
+
+    fcntl = None
+
+
+class TokenStore:
+    def __init__(self, path):
+        """Initialises the store of the token file at <path>. The lock is taken
+        on a separate file, which is never replaced"""
+
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+        # The lock is reentrant within a process (the file lock is not)
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+
+    @contextmanager
+    def lock(self):
+        """Holds the lock of the store, shared by every process using it, for
+        the duration of a read-modify-write sequence"""
+
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                self._lock_file = open(self.lock_path, "a+b")
+                TokenStore._lock(self._lock_file)
+
+            self._lock_depth += 1
+
+            try:
+                yield
+
+            finally:
+                self._lock_depth -= 1
+
+                if self._lock_depth == 0:
+                    TokenStore._unlock(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def read(self):
+        """Returns the content of the token file (<None> if there is none)"""
+
+        # The file is never partially written, so it can be read without lock
+        try:
+            with open(self.path, encoding="utf8") as file:
+                return json.load(file)
+
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def write(self, data):
+        """Replaces the content of the token file. It is written to a temporary
+        file first, so that no process ever reads a partial file"""
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=directory, prefix=".token-", suffix=".tmp"
+        )
+
+        try:
+            with os.fdopen(file_descriptor, "w", encoding="utf8") as file:
+                json.dump(data, file, ensure_ascii=False)
+                file.flush()
+                os.fsync(file.fileno())
+
+            os.replace(temporary_path, self.path)
+
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    @staticmethod
+    def _lock(file):
+        """Blocks until the lock of the file is acquired"""
+
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            return
+
+        # <msvcrt> only waits for 10 seconds at a time
+        file.seek(0)
+
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+
+            except OSError:
+                continue
+
+    @staticmethod
+    def _unlock(file):
+        """Releases the lock of the file"""
+
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
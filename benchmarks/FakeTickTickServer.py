@@ -0,0 +1,255 @@
+"""This file contains the definition of the <FakeTickTickServer> class, a local
+stand-in of TickTick's API (and of its OAuth token endpoint) with injected
+latency, errors and throttling, used by the benchmarks"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+# Routes of TickTick's API handled by the server
+OAUTH_TOKEN_ROUTE = re.compile(r"^/oauth/token$")
+PROJECTS_ROUTE = re.compile(r"^/open/v1/project$")
+PROJECT_DATA_ROUTE = re.compile(r"^/open/v1/project/([^/]+)/data$")
+CREATE_TASK_ROUTE = re.compile(r"^/open/v1/task$")
+UPDATE_TASK_ROUTE = re.compile(r"^/open/v1/task/([^/]+)$")
+DELETE_TASK_ROUTE = re.compile(r"^/open/v1/project/([^/]+)/task/([^/]+)$")
+TASK_ROUTE = DELETE_TASK_ROUTE
+
+
+class FakeTickTickServer:
+    TOKEN_LIFETIME = 180 * 24 * 3600  # Lifetime (in seconds) of the tokens issued
+
+    def __init__(
+        self,
+        latency=0.05,
+        projects=None,
+        port=0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=1,
+        seed=None,
+    ):
+        """Creates the server (on a random free port by default). <latency> is
+        the delay, in seconds, added before answering each request. A fraction
+        <error_rate> of the API requests fail with a 500 error, and a fraction
+        <throttle_rate> is refused with a 429 error asking to retry after
+        <retry_after> seconds (the OAuth endpoint never fails)"""
+
+        self.latency = latency
+        self.projects = projects if projects is not None else []
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.tasks = {}  # Tasks created on the server, indexed by ID
+        self.revoked_tokens = set()  # Access tokens refused with a 401 error
+        self.used_refresh_tokens = set()  # Refresh tokens can only be used once
+        self.requests_count = 0
+        self.status_counts = {}  # Number of responses sent, indexed by status code
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """URL to be given to the clients instead of TickTick's one"""
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        """Serves the requests in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Shuts the server down"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        """Builds the request handler class, bound to this server instance"""
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Allows keep-alive connections
+            disable_nagle_algorithm = True  # Avoids delayed ACKs on kept-alive sockets
+
+            def do_GET(self):
+                fake_server._count_request()
+
+                if self._reject_token() or self._inject_failure():
+                    return
+
+                if PROJECTS_ROUTE.match(self.path):
+                    self._reply(200, fake_server.projects)
+
+                # Like TickTick, the completed tasks are not listed
+                elif match := PROJECT_DATA_ROUTE.match(self.path):
+                    with fake_server._lock:
+                        tasks = [
+                            task
+                            for task in fake_server.tasks.values()
+                            if task.get("projectId") == match[1]
+                            and task.get("status", 0) != 2
+                        ]
+
+                    self._reply(200, {"tasks": tasks})
+
+                elif match := TASK_ROUTE.match(self.path):
+                    with fake_server._lock:
+                        task = fake_server.tasks.get(match[2])
+
+                    self._reply(200 if task is not None else 404, task or {})
+
+                else:
+                    self._reply(404, {})
+
+            def do_POST(self):
+                fake_server._count_request()
+
+                # The OAuth endpoint receives a form, not JSON (both the
+                # authorization code and the refresh token grants are accepted)
+                if OAUTH_TOKEN_ROUTE.match(self.path):
+                    form = self._read_form()
+
+                    with fake_server._lock:
+                        refresh_token = form.get("refresh_token")
+                        reused = refresh_token in fake_server.used_refresh_tokens
+                        fake_server.used_refresh_tokens.add(refresh_token)
+
+                    if form.get("grant_type") == "refresh_token" and reused:
+                        self._reply(400, {"error": "invalid_grant"})
+                        return
+
+                    self._reply(
+                        200,
+                        {
+                            "access_token": uuid.uuid4().hex,
+                            "refresh_token": uuid.uuid4().hex,
+                            "token_type": "bearer",
+                            "expires_in": FakeTickTickServer.TOKEN_LIFETIME,
+                            "scope": "tasks:write tasks:read",
+                        },
+                    )
+                    return
+
+                body = self._read_body()
+
+                if self._reject_token() or self._inject_failure():
+                    return
+
+                if CREATE_TASK_ROUTE.match(self.path):
+                    task = dict(body, id=uuid.uuid4().hex)
+
+                    with fake_server._lock:
+                        fake_server.tasks[task["id"]] = task
+
+                    self._reply(200, task)
+
+                elif match := UPDATE_TASK_ROUTE.match(self.path):
+                    with fake_server._lock:
+                        task = fake_server.tasks.get(match[1])
+
+                        if task is not None:
+                            task.update(body)
+
+                    self._reply(200 if task is not None else 404, task or {})
+
+                else:
+                    self._reply(404, {})
+
+            def do_DELETE(self):
+                fake_server._count_request()
+
+                if self._reject_token() or self._inject_failure():
+                    return
+
+                match = DELETE_TASK_ROUTE.match(self.path)
+
+                with fake_server._lock:
+                    deleted = match is not None and fake_server.tasks.pop(
+                        match[2], None
+                    )
+
+                self._reply(200 if deleted else 404, {})
+
+            def _read_body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or "{}")
+
+            def _read_form(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return dict(parse_qsl(self.rfile.read(length).decode("utf8")))
+
+            def _reject_token(self):
+                """Answers with a 401 error if the token has been revoked.
+                Returns <True> if so"""
+
+                token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+
+                if token in fake_server.revoked_tokens:
+                    self._reply(401, {"errorMessage": "Unauthorized"})
+                    return True
+
+                return False
+
+            def _inject_failure(self):
+                """Answers with an injected error, if drawn. Returns <True> if so"""
+
+                with fake_server._lock:
+                    draw = fake_server._random.random()
+
+                if draw < fake_server.throttle_rate:
+                    self._reply(
+                        429,
+                        {"errorMessage": "Too many requests"},
+                        {"Retry-After": str(fake_server.retry_after)},
+                    )
+                    return True
+
+                if draw < fake_server.throttle_rate + fake_server.error_rate:
+                    self._reply(500, {"errorMessage": "Internal error"})
+                    return True
+
+                return False
+
+            def _reply(self, status, payload, headers=None):
+                time.sleep(fake_server.latency)  # Injected latency
+
+                with fake_server._lock:
+                    fake_server.status_counts[status] = (
+                        fake_server.status_counts.get(status, 0) + 1
+                    )
+
+                body = json.dumps(payload).encode("utf8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # We do not want the benchmarks' output to be cluttered
+
+        return Handler
+
+    def _count_request(self):
+        with self._lock:
+            self.requests_count += 1
@@ -0,0 +1,97 @@
+"""This file contains the definition of the <SyntheticDatabase> class, which
+fills a local database with realistic synthetic data (schemas, tasks and
+their rehearsals), so that <StorageManager> can be measured at scale"""
+
+import random
+from datetime import date, timedelta
+
+# Words the titles are made of, so that the full-text search has work to do
+WORDS = (
+    "algèbre linéaire intégrales séries suites probabilités matrices espaces "
+    "vectoriels thermodynamique mécanique optique électrocinétique ondes "
+    "chimie organique cinétique oxydoréduction chapitre exercices cours "
+    "démonstrations formules théorèmes colle devoir révision fiche"
+).split()
+
+
+class SyntheticDatabase:
+    PROJECTS_COUNT = 12
+    BATCH_SIZE = 5000  # Number of tasks inserted per transaction
+    HISTORY_DAYS = 730  # The tasks start within this number of days before today
+    COMPLETED_RATE = 0.8  # Fraction of the past rehearsals already completed
+    PENDING_RATE = 0.01  # Fraction of the rehearsals not created on TickTick yet
+
+    def __init__(self, seed=0):
+        """Initialises the generator, the same seed giving the same data"""
+        self.random = random.Random(seed)
+
+    def remote_id(self):
+        """Returns a random ID, shaped like those of TickTick"""
+        return f"{self.random.getrandbits(96):024x}"
+
+    def schema(self):
+        """Returns a random rehearsal schema, with increasing delays"""
+
+        schema = [0]
+
+        for _ in range(self.random.randint(2, 11)):
+            schema.append(schema[-1] + self.random.randint(1, 2 * len(schema) + 1))
+
+        return schema
+
+    def task(self, schema_id, schema):
+        """Returns a random task following the given schema, as expected by
+        <StorageManager.save_tasks>"""
+
+        start_date = date.today() - timedelta(
+            days=self.random.randrange(SyntheticDatabase.HISTORY_DAYS)
+        )
+
+        return {
+            "schema_id": schema_id,
+            "title": " ".join(self.random.sample(WORDS, self.random.randint(2, 5))),
+            "project_ID": f"project-{self.random.randrange(SyntheticDatabase.PROJECTS_COUNT)}",
+            "priority": self.random.choice((0, 1, 3, 5)),
+            "rehearsal_IDs": [
+                (
+                    None
+                    if self.random.random() < SyntheticDatabase.PENDING_RATE
+                    else self.remote_id()
+                )
+                for _ in schema
+            ],
+            "start_date": start_date,
+            "due_dates": [
+                start_date + timedelta(days=day_delta) for day_delta in schema
+            ],
+        }
+
+    def fill(self, storage_manager, tasks_count, schemas_count=20):
+        """Inserts <schemas_count> schemas and <tasks_count> tasks following
+        them into the database of <storage_manager>, in batches. Returns the
+        IDs of the schemas"""
+
+        schemas = [
+            (storage_manager.save_schema(f"Schéma {index}", schema), schema)
+            for index, schema in enumerate(self.schema() for _ in range(schemas_count))
+        ]
+
+        for first_task in range(0, tasks_count, SyntheticDatabase.BATCH_SIZE):
+            batch_size = min(SyntheticDatabase.BATCH_SIZE, tasks_count - first_task)
+            storage_manager.save_tasks(
+                self.task(*self.random.choice(schemas)) for _ in range(batch_size)
+            )
+
+        # Most of the past rehearsals have been completed (the choice only
+        # depends on the ID, so that it is reproducible as well)
+        with storage_manager.transaction():
+            storage_manager.db_cursor.execute(
+                """UPDATE rehearsals SET state = 'completed'
+                   WHERE remote_id IS NOT NULL AND due_date < ? AND id % 100 < ?""",
+                (
+                    date.today().isoformat(),
+                    int(SyntheticDatabase.COMPLETED_RATE * 100),
+                ),
+            )
+
+        return [schema_id for schema_id, _ in schemas]
@@ -0,0 +1,2 @@
+"""Benchmarks of the app, run against a local stand-in of TickTick's API
+(e.g. <python -m benchmarks.create_benchmark> from the root of the repository)"""
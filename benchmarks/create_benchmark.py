@@ -0,0 +1,90 @@
+"""Benchmark of <TickTickSchedulerClient.create_all> (which creates the
+rehearsals of an edited task): wall-clock time against schema length,
+sequentially and with concurrent requests"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.FakeTickTickServer import FakeTickTickServer
+from TickTickOAuth2 import TickTickOAuth2
+from TickTickSchedulerClient import TickTickSchedulerClient
+
+CLIENT_ID = "benchmark-client"
+GROUP_ID = "benchmark-group"
+
+
+def build_client(base_url, token_file_path):
+    """Creates a client bound to the fake server, with a valid token stored
+    beforehand so that no authentication is needed"""
+
+    with open(token_file_path, "w", encoding="utf8") as file:
+        json.dump(
+            {
+                CLIENT_ID: {
+                    "access_token": "benchmark-token",
+                    "expire_date": int(datetime.now().timestamp()) + 3600,
+                }
+            },
+            file,
+        )
+
+    TickTickOAuth2.TOKEN_FILE_PATH = token_file_path
+
+    # The fake server has no rate limit, so the client's pace must not be measured
+    TickTickSchedulerClient.MAX_REQUESTS_PER_SECOND = 10000
+    TickTickSchedulerClient.MAX_REQUESTS_BURST = 10000
+
+    return TickTickSchedulerClient(
+        CLIENT_ID, "secret", "http://127.0.0.1", GROUP_ID, base_url=base_url
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 4, 8, 12, 24])
+    parser.add_argument(
+        "--workers", type=int, default=TickTickSchedulerClient.MAX_WORKERS
+    )
+    args = parser.parse_args()
+
+    projects = [{"id": "project", "name": "Benchmark", "groupId": GROUP_ID}]
+
+    with FakeTickTickServer(
+        args.latency, projects
+    ) as server, tempfile.TemporaryDirectory() as tmp:
+        client = build_client(server.base_url, os.path.join(tmp, "token.json"))
+
+        print(f"Latency: {args.latency * 1000:.0f} ms, workers: {args.workers}\n")
+        print(
+            f"{'length':>8} {'sequential (s)':>16} {'concurrent (s)':>16} {'speedup':>9}"
+        )
+
+        for length in args.lengths:
+            schema = list(range(length))
+            timings = []
+
+            for max_workers in (1, args.workers):
+                start = time.perf_counter()
+                ids = client.create_all(
+                    [
+                        client.task_payload("Benchmark", "project", 0, task_date)
+                        for task_date in client.rehearsals_dates(schema)
+                    ],
+                    max_workers,
+                )
+                timings.append(time.perf_counter() - start)
+
+                assert len(ids) == length
+
+            print(
+                f"{length:>8} {timings[0]:>16.3f} {timings[1]:>16.3f} {timings[0] / timings[1]:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""End-to-end benchmark of the app against the fake TickTick server: the
+authentication, then the creation (<batch_create>), edition (<batch_edit>)
+and deletion (<batch_delete>) of tasks, as the menus run them. Each phase is
+reported with its throughput and the p50/p99 latency of its requests, with
+optional latency, errors and throttling injected by the server"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import webbrowser
+
+import main as app
+from benchmarks.FakeTickTickServer import FakeTickTickServer
+from OutboxWorker import OutboxWorker
+from SharedSession import SharedSession
+from StorageManager import StorageManager
+from TickTickOAuth2 import TickTickOAuth2
+from TickTickSchedulerClient import TickTickSchedulerClient
+
+GROUP_ID = "benchmark-group"
+PROJECTS = [
+    {"id": "project-1", "name": "Benchmark 1", "groupId": GROUP_ID},
+    {"id": "project-2", "name": "Benchmark 2", "groupId": GROUP_ID},
+]
+
+
+class Phase:
+    def __init__(self, name, server, session):
+        """Measures a phase of the benchmark : its duration, and the requests
+        sent to <server> through <session> meanwhile"""
+
+        self.name = name
+        self.server = server
+        self.session = session
+        self.latencies = []
+
+    def record(self, response, *args, **kwargs):
+        """Response hook of the HTTP session, recording the request latency"""
+        self.latencies.append(response.elapsed.total_seconds())
+
+    def __enter__(self):
+        self.session.hooks["response"].append(self.record)
+        self._requests_count = self.server.requests_count
+        self._status_counts = dict(self.server.status_counts)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self._start
+        self.session.hooks["response"].remove(self.record)
+        self.requests_count = self.server.requests_count - self._requests_count
+        self.status_counts = {
+            status: count - self._status_counts.get(status, 0)
+            for status, count in self.server.status_counts.items()
+        }
+
+    def results(self, tasks_count):
+        """Returns the measures of the phase, <tasks_count> tasks being handled"""
+
+        latencies = sorted(self.latencies)
+        percentiles = (
+            statistics.quantiles(latencies, n=100, method="inclusive")
+            if len(latencies) > 1
+            else latencies * 99
+        )
+
+        return {
+            "phase": self.name,
+            "duration_s": self.duration,
+            "tasks_per_s": tasks_count / self.duration,
+            "requests": self.requests_count,
+            "requests_per_s": self.requests_count / self.duration,
+            "p50_ms": percentiles[49] * 1000 if percentiles else None,
+            "p99_ms": percentiles[98] * 1000 if percentiles else None,
+            "throttled": self.status_counts.get(429, 0),
+            "errors": sum(
+                count for status, count in self.status_counts.items() if status >= 500
+            ),
+        }
+
+
+def authenticate(base_url):
+    """Creates the API client through the OAuth flow of the fake server, the
+    user being simulated (no browser is opened)"""
+
+    original_input, original_open = builtins.input, webbrowser.open
+    builtins.input = lambda prompt="": f"{app.APP_URI}/?code=benchmark&state="
+    webbrowser.open = lambda url: True
+
+    try:
+        client = TickTickSchedulerClient(
+            app.APP_ID,
+            app.APP_SECRET,
+            app.APP_URI,
+            GROUP_ID,
+            base_url=base_url,
+            storage_manager=app.storage_manager,
+            oauth_base_url=base_url,
+        )
+
+    finally:
+        builtins.input, webbrowser.open = original_input, original_open
+
+    return client
+
+
+def drain_outbox(timeout):
+    """Waits until every journaled operation has been sent (the failed ones
+    being retried by the worker)"""
+
+    deadline = time.perf_counter() + timeout
+
+    while app.storage_manager.count_pending_operations() > 0:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("the outbox could not be drained")
+
+        time.sleep(0.01)
+
+
+def run(args, tmp):
+    """Runs every phase of the benchmark and returns their results"""
+
+    # The app runs on its own database and token file
+    StorageManager.DATABASE_PATH = os.path.join(tmp, "data.db")
+    TickTickOAuth2.TOKEN_FILE_PATH = os.path.join(tmp, "token.json")
+
+    # The client's own pace is only measured if asked
+    if args.rate is not None:
+        TickTickSchedulerClient.MAX_REQUESTS_PER_SECOND = args.rate
+        TickTickSchedulerClient.MAX_REQUESTS_BURST = args.rate
+    else:
+        TickTickSchedulerClient.MAX_REQUESTS_PER_SECOND = 10000
+        TickTickSchedulerClient.MAX_REQUESTS_BURST = 10000
+
+    app.storage_manager = StorageManager()
+    app.storage_manager.save_schema("Benchmark", args.schema)
+    app.storage_manager.save_schema("Benchmark (edited)", args.edited_schema)
+    schema_id, edited_schema_id = [
+        schema_id for _, schema_id in app.storage_manager.fetch_schemas_descriptors()
+    ]
+
+    with FakeTickTickServer(
+        args.latency,
+        PROJECTS,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    ) as server:
+        session = SharedSession.get()
+        phases = []
+
+        with Phase("authentication", server, session) as phase:
+            app._api_client = authenticate(server.base_url)
+            app._outbox_worker = OutboxWorker(app._api_client)
+            app._outbox_worker.start()
+
+        phases.append((phase, 1))
+
+        with Phase("create", server, session) as phase:
+            for index in range(args.tasks):
+                app.batch_create(f"Task {index}", "project-1", 0, schema_id)
+
+            drain_outbox(args.timeout)
+
+        phases.append((phase, args.tasks))
+        tasks_ids = [
+            task_id for _, task_id in app.storage_manager.fetch_tasks_descriptors()
+        ]
+
+        with Phase("edit", server, session) as phase:
+            for task_id in tasks_ids:
+                app.batch_edit(task_id, "Edited task", "project-1", 3, edited_schema_id)
+
+        phases.append((phase, args.tasks))
+
+        with Phase("delete", server, session) as phase:
+            app.batch_delete(tasks_ids)
+            drain_outbox(args.timeout)
+
+        phases.append((phase, args.tasks))
+
+        app._outbox_worker.stop()
+
+        assert len(server.tasks) == 0, "some rehearsals were not deleted"
+
+    return [phase.results(tasks_count) for phase, tasks_count in phases]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--schema", type=int, nargs="+", default=[1, 3, 7, 14, 30])
+    parser.add_argument(
+        "--edited-schema", type=int, nargs="+", default=[1, 4, 7, 21, 30, 60]
+    )
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1, help="seconds")
+    parser.add_argument("--rate", type=float, help="client pace (requests/s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="seconds")
+    parser.add_argument("--output", help="JSON file where the results are saved")
+    args = parser.parse_args()
+
+    # The messages of the app would clutter the report, they are only shown if
+    # the app gives up (e.g. a creation failing during an edition)
+    messages = io.StringIO()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(messages):
+            results = run(args, tmp)
+
+    except SystemExit:
+        print(messages.getvalue().rstrip().splitlines()[-1])
+        print("The app stopped before the end of the benchmark")
+        sys.exit(1)
+
+    print(
+        f"Latency: {args.latency * 1000:.0f} ms, errors: {args.error_rate:.0%}, "
+        f"throttling: {args.throttle_rate:.0%}, tasks: {args.tasks}\n"
+    )
+    print(
+        f"{'phase':<16} {'time (s)':>9} {'tasks/s':>9} {'requests':>9} {'req/s':>8}"
+        f" {'p50 (ms)':>9} {'p99 (ms)':>9} {'429':>5} {'5xx':>5}"
+    )
+
+    for result in results:
+        print(
+            f"{result['phase']:<16} {result['duration_s']:>9.3f} {result['tasks_per_s']:>9.1f}"
+            f" {result['requests']:>9} {result['requests_per_s']:>8.1f}"
+            f" {result['p50_ms'] or 0:>9.1f} {result['p99_ms'] or 0:>9.1f}"
+            f" {result['throttled']:>5} {result['errors']:>5}"
+        )
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark of the startup of the app: time needed to import <main> and to
+display the first menu, measured in fresh processes. The run fails if the
+medians exceed the given budgets, or if the network stack gets imported
+before the first menu, so that startup regressions are caught"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code run in each fresh process : the first menu is answered with "quit"
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+import inquirer
+
+def first_menu(*args, **kwargs):
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "first_menu_ms": (time.perf_counter() - start) * 1000,
+        "requests_imported": "requests" in sys.modules,
+    }))
+    return main.MainMenuChoices.QUIT
+
+inquirer.list_input = first_menu
+main.main()
+"""
+
+
+def measure(working_directory):
+    """Runs the app once in a fresh process and returns its timings"""
+
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=working_directory,
+        env=dict(os.environ, PYTHONPATH=ROOT_PATH),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    process_ms = (time.perf_counter() - start) * 1000
+
+    # Only the last line is ours, colorama may have printed before
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = process_ms
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--import-budget", type=float, default=50, help="ms")
+    parser.add_argument("--menu-budget", type=float, default=400, help="ms")
+    parser.add_argument("--output", help="JSON file where the results are saved")
+    args = parser.parse_args()
+
+    # The app runs on copies of the configuration and of the database
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_name in ("config.json", "data.db"):
+            shutil.copy(os.path.join(ROOT_PATH, file_name), tmp)
+
+        runs = [measure(tmp) for _ in range(args.runs)]
+
+    results = {
+        key: statistics.median(run[key] for run in runs)
+        for key in ("import_ms", "first_menu_ms", "process_ms")
+    }
+    results["requests_imported"] = any(run["requests_imported"] for run in runs)
+
+    print(f"Median over {args.runs} runs")
+    print(f"  import of main     : {results['import_ms']:8.1f} ms")
+    print(f"  first menu         : {results['first_menu_ms']:8.1f} ms")
+    print(f"  whole process      : {results['process_ms']:8.1f} ms")
+    print(f"  requests imported  : {results['requests_imported']}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(results, file, indent=2)
+
+    failures = []
+
+    if results["import_ms"] > args.import_budget:
+        failures.append(f"import of main over {args.import_budget} ms")
+
+    if results["first_menu_ms"] > args.menu_budget:
+        failures.append(f"first menu over {args.menu_budget} ms")
+
+    if results["requests_imported"]:
+        failures.append("requests imported before the first menu")
+
+    for failure in failures:
+        print(f"Budget exceeded : {failure}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
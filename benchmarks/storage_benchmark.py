@@ -0,0 +1,281 @@
+"""Benchmark of <StorageManager> on synthetic databases of several sizes (see
+<SyntheticDatabase>): latency of the reads of schemas and tasks, of their
+writes, and of the scans of whole tables. The results can be saved as JSON
+and compared with those of a former run"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.SyntheticDatabase import SyntheticDatabase
+from StorageManager import StorageManager
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(durations):
+    """Returns the statistics of a list of durations (in seconds), in ms"""
+
+    durations = sorted(durations)
+    percentiles = (
+        statistics.quantiles(durations, n=100, method="inclusive")
+        if len(durations) > 1
+        else durations * 99
+    )
+
+    return {
+        "samples": len(durations),
+        "median_ms": statistics.median(durations) * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "max_ms": durations[-1] * 1000,
+    }
+
+
+def timed(function, *args):
+    """Calls <function> and returns the time it took, along with its result"""
+
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def database_path(args, directory, tasks_count):
+    """Returns the path of a database holding <tasks_count> synthetic tasks,
+    generated unless a former run has kept it in <args.database_dir>, along
+    with the time spent generating it (<None> if it was kept)"""
+
+    path = os.path.join(directory, f"storage-{tasks_count}-{args.seed}.db")
+
+    if os.path.exists(path):
+        return path, None
+
+    StorageManager.DATABASE_PATH = path
+    storage_manager = StorageManager()
+
+    start = time.perf_counter()
+    SyntheticDatabase(args.seed).fill(storage_manager, tasks_count, args.schemas)
+    generation_duration = time.perf_counter() - start
+
+    # The write-ahead log is merged, so that the file can be copied alone
+    storage_manager.db_cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    storage_manager.db_connection.close()
+
+    return path, generation_duration
+
+
+def measure(storage_manager, args):
+    """Times each operation on the database of <storage_manager> and returns
+    the statistics of each one, by name"""
+
+    generator = SyntheticDatabase(args.seed + 1)
+    tasks_ids = [task_id for _, task_id in storage_manager.fetch_tasks_descriptors()]
+    schemas_ids = [
+        schema_id for _, schema_id in storage_manager.fetch_schemas_descriptors()
+    ]
+    durations = {}
+
+    def sample(name, function, *args):
+        duration, result = timed(function, *args)
+        durations.setdefault(name, []).append(duration)
+        return result
+
+    # Scans of whole tables
+    for _ in range(args.scans):
+        sample("fetch_schemas_descriptors", storage_manager.fetch_schemas_descriptors)
+        sample("fetch_tasks_descriptors", storage_manager.fetch_tasks_descriptors)
+        sample(
+            "iter_tasks_overview",
+            lambda: sum(1 for _ in storage_manager.iter_tasks_overview()),
+        )
+        sample("iter_tasks", lambda: sum(1 for _ in storage_manager.iter_tasks()))
+
+    # Reads of a single item, from the database and then from the cache
+    for task_id in generator.random.choices(tasks_ids, k=args.repeat):
+        storage_manager.clear_caches()
+        sample("fetch_task_data", storage_manager.fetch_task_data, task_id)
+        sample("fetch_task_data (cached)", storage_manager.fetch_task_data, task_id)
+
+    for schema_id in generator.random.choices(schemas_ids, k=args.repeat):
+        storage_manager.clear_caches()
+        sample("fetch_schema_data", storage_manager.fetch_schema_data, schema_id)
+        sample(
+            "fetch_schema_data (cached)", storage_manager.fetch_schema_data, schema_id
+        )
+
+    for _ in range(args.repeat):
+        sample(
+            "search_tasks",
+            storage_manager.search_tasks,
+            generator.random.choice(
+                ("algèbre", "chimie org", "série", "exercices cours")
+            ),
+            20,
+        )
+
+    # Writes of tasks and schemas
+    for index in range(args.repeat):
+        task = generator.task(generator.random.choice(schemas_ids), generator.schema())
+        sample(
+            "save_task",
+            storage_manager.save_task,
+            task["schema_id"],
+            task["title"],
+            task["project_ID"],
+            task["priority"],
+            task["rehearsal_IDs"],
+            task["start_date"],
+            task["due_dates"],
+        )
+
+        schema_id = sample(
+            "save_schema", storage_manager.save_schema, f"Benchmark {index}", [0, 1, 3]
+        )
+        sample(
+            "edit_schema",
+            storage_manager.edit_schema,
+            schema_id,
+            f"Benchmark {index}",
+            generator.schema(),
+        )
+        sample("delete_schema", storage_manager.delete_schema, schema_id)
+
+    for task_id in generator.random.sample(tasks_ids, min(args.repeat, len(tasks_ids))):
+        sample("delete_task", storage_manager.delete_task, task_id)
+
+    return {name: summarize(samples) for name, samples in durations.items()}
+
+
+def git_commit():
+    """Returns the commit the repository is at (<None> if it is unknown)"""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_PATH,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Prints the ratio of each median to the one of a former run"""
+
+    former_operations = {
+        result["tasks"]: result["operations"] for result in baseline["results"]
+    }
+
+    print(
+        f"\nCompared with {baseline['commit']} ({baseline['date']}) : new / former median"
+    )
+
+    for result in results:
+        for name, statistics_ in result["operations"].items():
+            former = former_operations.get(result["tasks"], {}).get(name)
+
+            if former is not None and former["median_ms"] > 0:
+                print(
+                    f"{result['tasks']:>8} {name:<28} "
+                    f"{statistics_['median_ms'] / former['median_ms']:>6.2f}x"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=[1000, 10000, 100000], help="tasks"
+    )
+    parser.add_argument("--schemas", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200, help="samples per operation")
+    parser.add_argument("--scans", type=int, default=5, help="samples per table scan")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--database-dir", help="directory where the generated databases are kept"
+    )
+    parser.add_argument("--output", help="JSON file where the results are saved")
+    parser.add_argument("--baseline", help="JSON file of a former run to compare with")
+    args = parser.parse_args()
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        databases_directory = args.database_dir or tmp
+        os.makedirs(databases_directory, exist_ok=True)
+
+        for tasks_count in args.scales:
+            path, generation_duration = database_path(
+                args, databases_directory, tasks_count
+            )
+
+            # The measures run on a copy, so that a kept database is left intact
+            StorageManager.DATABASE_PATH = os.path.join(tmp, "measured.db")
+            shutil.copyfile(path, StorageManager.DATABASE_PATH)
+            storage_manager = StorageManager()
+
+            rehearsals_count = storage_manager.db_cursor.execute(
+                "SELECT COUNT(*) FROM rehearsals"
+            ).fetchone()[0]
+            results.append(
+                {
+                    "tasks": tasks_count,
+                    "rehearsals": rehearsals_count,
+                    "database_mib": os.path.getsize(path) / 2**20,
+                    "generation_s": generation_duration,
+                    "operations": measure(storage_manager, args),
+                }
+            )
+
+            storage_manager.db_connection.close()
+
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(StorageManager.DATABASE_PATH + suffix):
+                    os.remove(StorageManager.DATABASE_PATH + suffix)
+
+            print(
+                f"{tasks_count} tasks, {rehearsals_count} rehearsals "
+                f"({results[-1]['database_mib']:.1f} MiB)"
+            )
+            print(
+                f"  {'operation':<28} {'median (ms)':>12} {'p95 (ms)':>10} {'max (ms)':>10}"
+            )
+
+            for name, statistics_ in results[-1]["operations"].items():
+                print(
+                    f"  {name:<28} {statistics_['median_ms']:>12.3f}"
+                    f" {statistics_['p95_ms']:>10.3f} {statistics_['max_ms']:>10.3f}"
+                )
+
+            print()
+
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf8") as file:
+            compare(results, json.load(file))
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
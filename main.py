@@ -1,18 +1,26 @@
 """Main file of the app. This file contains the authentication process
-and the main features."""
+and the main features. Nothing heavy happens at import time : the menus
+library is imported when they are first displayed, and the API client (with
+its authentication process and network calls) is only created when an
+action needs it, so that local-only actions never touch the network."""
 
+import contextlib
 import json
+import os.path
 import re
+import shlex
+import sqlite3
+import sys
+from collections.abc import Iterator
 from datetime import *
 from enum import Enum
 
-import inquirer
 from colorama import Fore, init
 
+from LoadLeveler import LoadLeveler
+from Metrics import Metrics
+from Plan import Plan
 from StorageManager import StorageManager
-from TickTickSchedulerClient import TickTickSchedulerClient
-
-init(autoreset=True)  # Initialization for colorama
 
 # -------------------------------------------------- CONSTANTS --------------------------------------------------
 
@@ -24,62 +32,558 @@ APP_URI = "http://127.0.0.1:8080"
 # ID of the group gathering all the interesting task lists
 GINETTE_GROUP_ID = "62b4b7cdaa2a9e4c9aa9fdf5"
 
+# Maximum time (in seconds) spent sending the pending operations when quitting
+OUTBOX_EXIT_TIMEOUT = 30
+
+# Number of rehearsals a day can take : beyond it, the rehearsals of new tasks
+# are moved by a few days (see <LoadLeveler>)
+DAILY_REHEARSALS_CAPACITY = 15
+
+# Number of days covered by the histogram of the rehearsals load
+LOAD_HISTOGRAM_DAYS = 30
+
+# Number of requests beyond which an operation is described and confirmed
+# before being executed from the menus (see <Plan>)
+PLAN_CONFIRMATION_THRESHOLD = 100
+
+# Number of tasks displayed at once when selecting tasks
+TASKS_PAGE_SIZE = 20
+
 # Path to the configuration file (prompts displayed in the various menus)
 CONFIG_FILE_PATH = "./config.json"
 
-# Parsing configuration
-with open(CONFIG_FILE_PATH, encoding="utf8") as file:
-    config = json.load(file)
-
 # ------------------------------------------------------ INITIALISATION -----------------------------------------
 
-# We create a <TickTickSchedulerClient> instance and a <StorageManager> instance
-api_client = TickTickSchedulerClient(APP_ID, APP_SECRET, APP_URI, GINETTE_GROUP_ID)
-storage_manager = StorageManager()
+# Those are set when the app starts (see <main>)
+config = None
+storage_manager = None
+interactive = True  # Whether the user can be asked to authenticate
+
+# Those are only created when first needed (see <get_api_client> and
+# <get_outbox_worker>)
+_api_client = None
+_outbox_worker = None
+
+
+def load_config():
+    """This function parses the configuration file"""
+
+    with open(CONFIG_FILE_PATH, encoding="utf8") as file:
+        return json.load(file)
+
+
+def get_api_client():
+    """This function returns the <TickTickSchedulerClient> instance, creating it
+    on first call (the projects are served from the cache kept in the local
+    database). It never sends the journaled operations, so that planning an
+    operation does not write anything on TickTick"""
+
+    global _api_client
+
+    if _api_client is None:
+        # This module pulls in <requests>, which is slow to import
+        from TickTickSchedulerClient import TickTickSchedulerClient
+
+        _api_client = TickTickSchedulerClient(
+            APP_ID,
+            APP_SECRET,
+            APP_URI,
+            GINETTE_GROUP_ID,
+            storage_manager=storage_manager,
+            interactive=interactive,
+        )
+
+    return _api_client
+
+
+def get_outbox_worker():
+    """This function returns the worker sending the journaled operations,
+    starting it on first call : only the execution of an operation may call it"""
+
+    global _outbox_worker
+
+    if _outbox_worker is None:
+        # This module pulls in <requests>, which is slow to import
+        from OutboxWorker import OutboxWorker
+
+        _outbox_worker = OutboxWorker(get_api_client())
+        _outbox_worker.start()
+
+    return _outbox_worker
+
 
 # -------------------------------------------------- UTILITY FUNCTIONS --------------------------------------
 
 
-def batch_create(title, project_id, priority, schema_id):
-    """This function creates multiple tasks according to a rehearsal schema, and
-    stores them both online and locally."""
+def throughput_profile():
+    """This function returns the figures the duration of a plan is estimated
+    from (see <Plan.estimated_duration>) : those of the API client if it has
+    already sent requests, and its defaults otherwise"""
 
-    print(Fore.YELLOW + "Création de la tâche...")
+    # This module pulls in <requests>, which is slow to import
+    from TickTickSchedulerClient import TickTickSchedulerClient
+
+    profile = {
+        "rate": TickTickSchedulerClient.MAX_REQUESTS_PER_SECOND,
+        "burst": TickTickSchedulerClient.MAX_REQUESTS_BURST,
+        "concurrency": TickTickSchedulerClient.INITIAL_CONCURRENCY,
+        "latency": Plan.DEFAULT_LATENCY,
+    }
+
+    if _api_client is not None:
+        profile["rate"] = _api_client.rate_limiter.rate
+        profile["burst"] = _api_client.rate_limiter.burst
+        profile["concurrency"] = int(_api_client.concurrency.limit)
+
+        if _api_client.concurrency.average_latency is not None:
+            # A latency rounded to zero would make the throughput infinite
+            profile["latency"] = max(
+                round(_api_client.concurrency.average_latency, 3), 1e-3
+            )
+
+    return profile
+
+
+def confirm_plan(plan):
+    """This function describes a plan and asks the user to confirm it, if it
+    sends too many requests (see <PLAN_CONFIRMATION_THRESHOLD>). Returns
+    whether it should be executed"""
+
+    import inquirer
+
+    if plan.requests_count < PLAN_CONFIRMATION_THRESHOLD:
+        return True
+
+    plan.report(throughput_profile())
+
+    return inquirer.confirm(config["plan_confirmation_message"], default=False)
+
+
+def plan_create(title, project_id, priority, schema_id):
+    """This function plans the creation of a task according to a rehearsal
+    schema (see <batch_create>) : the dates of the rehearsals are computed
+    right away, without touching the network"""
+
+    # This module pulls in <requests>, which is slow to import
+    from TickTickSchedulerClient import TickTickSchedulerClient
 
     # First we retrieve the schema corresponding to the given ID
     schema_data = storage_manager.fetch_schema_data(schema_id)
 
-    # We create the different tasks, first online and then we store the data locally
-    tasks_ids = api_client.batch_create_tasks(
-        title, project_id, priority, schema_data["schema"]
+    # The rehearsals are moved away from the days that are already full
+    start_date = date.today()
+    leveler = LoadLeveler(
+        DAILY_REHEARSALS_CAPACITY,
+        storage_manager.fetch_rehearsals_load(start_date),
+        start_date,
+    )
+    tasks_dates = TickTickSchedulerClient.rehearsals_dates(
+        leveler.level(schema_data.schema, start_date), start_date
+    )
+
+    def execute():
+        # We journal the creation of each rehearsal along with the task itself
+        payloads = [
+            get_api_client().task_payload(title, project_id, priority, task_date)
+            for task_date in tasks_dates
+        ]
+        task_local_id = storage_manager.queue_task_creation(
+            schema_data.id,
+            title,
+            project_id,
+            priority,
+            start_date,
+            [task_date.date() for task_date in tasks_dates],
+            payloads,
+        )
+        get_outbox_worker().notify()
+
+        print(Fore.GREEN + "Tâche créée, envoi à TickTick en arrière-plan\n")
+
+        return task_local_id
+
+    plan = Plan(f"Création de la tâche « {title} »", execute)
+
+    for task_date in tasks_dates:
+        plan.add("create", task_date.date())
+
+    return plan
+
+
+def batch_create(title, project_id, priority, schema_id):
+    """This function creates multiple tasks according to a rehearsal schema. The
+    task is stored locally right away, and its rehearsals are journaled in the
+    outbox, from which they are sent to TickTick in the background. Returns the
+    local ID of the task."""
+    return plan_create(title, project_id, priority, schema_id).execute()
+
+
+def plan_delete(tasks_local_ids):
+    """This function plans the deletion of tasks (see <batch_delete>) : one
+    request per rehearsal already created on TickTick"""
+
+    plan = Plan(
+        f"Suppression de {len(tasks_local_ids)} tâche(s)",
+        lambda: batch_delete(tasks_local_ids),
+    )
+
+    for task_local_id in tasks_local_ids:
+        task_data = storage_manager.fetch_task_data(task_local_id)
+        plan.add(
+            "delete",
+            count=sum(
+                rehearsal_id is not None for rehearsal_id in task_data.rehearsal_ids
+            ),
+        )
+
+    return plan
+
+
+def batch_delete(tasks_local_ids):
+    """This function deletes tasks that have been repeated following a
+    rehearsal schema. The tasks are removed locally right away, and the
+    deletion of their rehearsals is journaled in the outbox, from which it is
+    sent to TickTick in the background (failures are reported and retried)."""
+
+    # All the deletions are committed at once
+    with storage_manager.transaction():
+        for task_local_id in tasks_local_ids:
+            storage_manager.queue_task_deletion(task_local_id)
+
+    get_outbox_worker().notify()
+
+    print(
+        Fore.GREEN
+        + f"{len(tasks_local_ids)} tâche(s) supprimée(s), envoi à TickTick en arrière-plan\n"
+    )
+
+
+def wait_for_outbox(timeout=None):
+    """This function waits until the operations journaled in the outbox have
+    been sent, and returns the number of operations still pending"""
+
+    if storage_manager.count_pending_operations() > 0:
+        print(Fore.YELLOW + "Envoi des opérations en attente...")
+        get_outbox_worker().wait_idle(timeout)
+
+    return storage_manager.count_pending_operations()
+
+
+def plan_import(path):
+    """This function plans the import of a CSV or JSONL file (see
+    <batch_import>) : the file is read and its rows are resolved, without
+    importing anything"""
+
+    from TaskImporter import TaskImporter
+
+    plan = Plan(f"Import du fichier {path}", lambda: batch_import(path))
+    # Nothing is sent while planning, so no worker is needed
+    plan.details["import"] = TaskImporter(
+        storage_manager, get_api_client(), None, DAILY_REHEARSALS_CAPACITY
+    ).plan_file(path, plan)
+
+    return plan
+
+
+def batch_import(path):
+    """This function creates the tasks listed in a CSV or JSONL file (see
+    <TaskImporter>), resuming a former import of the same file if needed.
+    Returns a dictionary summing the import up"""
+
+    from TaskImporter import TaskImporter
+
+    print(Fore.YELLOW + "Import des tâches...")
+
+    return TaskImporter(
+        storage_manager,
+        get_api_client(),
+        get_outbox_worker(),
+        DAILY_REHEARSALS_CAPACITY,
+    ).import_file(path)
+
+
+def plan_reschedule(schema_id, name, schema):
+    """This function plans the edition of a rehearsal schema along with the
+    rescheduling of the tasks following it (see <reschedule_schema>)"""
+
+    from TaskRescheduler import TaskRescheduler
+
+    plan = Plan(
+        f"Modification du schéma « {name} »",
+        lambda: reschedule_schema(schema_id, name, schema),
+    )
+    # Nothing is sent while planning, so no worker is needed
+    plan.details["rescheduling"] = TaskRescheduler(
+        storage_manager, get_api_client(), None, DAILY_REHEARSALS_CAPACITY
+    ).plan_edition(schema_id, schema, plan)
+
+    return plan
+
+
+def reschedule_schema(schema_id, name, schema):
+    """This function edits a rehearsal schema and moves the rehearsals of the
+    tasks following it accordingly (see <TaskRescheduler>), the changes being
+    sent to TickTick concurrently in the background. Returns a dictionary
+    summing the changes up"""
+
+    from TaskRescheduler import TaskRescheduler
+
+    print(Fore.YELLOW + "Replanification des tâches...")
+
+    rescheduler = TaskRescheduler(
+        storage_manager,
+        get_api_client(),
+        get_outbox_worker(),
+        DAILY_REHEARSALS_CAPACITY,
+    )
+    summary = rescheduler.edit_schema(schema_id, name, schema)
+
+    TaskRescheduler.report(summary)
+    rescheduler.wait_for_operations()
+
+    return summary
+
+
+def synchronize():
+    """This function brings the local rehearsals up to date with TickTick : the
+    ones completed, deleted or moved there are updated (see <TaskSynchronizer>)"""
+
+    from TaskSynchronizer import TaskSynchronizer
+
+    # The journaled operations are sent first, so that TickTick is up to date
+    wait_for_outbox()
+    print(Fore.YELLOW + "Synchronisation avec TickTick...")
+
+    TaskSynchronizer.report(
+        TaskSynchronizer(storage_manager, get_api_client()).synchronize()
+    )
+
+
+def display_rehearsals_load():
+    """This function displays the number of rehearsals of each of the next
+    days, the days over capacity being highlighted"""
+
+    first_date = date.today()
+    histogram = LoadLeveler(
+        DAILY_REHEARSALS_CAPACITY,
+        storage_manager.fetch_rehearsals_load(first_date),
+        first_date,
+    ).histogram(first_date, first_date + timedelta(days=LOAD_HISTOGRAM_DAYS - 1))
+
+    # The bars are shortened if needed to fit in the terminal
+    scale = min(1, 50 / max(max(load for _, load in histogram), 1))
+
+    for load_date, load in histogram:
+        color = Fore.RED if load > DAILY_REHEARSALS_CAPACITY else Fore.GREEN
+        print(
+            color + f"{load_date.strftime('%d/%m')} {'█' * round(load * scale)} {load}"
+        )
+
+    print()
+
+
+def edited_dates(former_task_data, former_dates, start_date, schema):
+    """This function returns the dates of the rehearsals of an edited task,
+    following <schema> from <start_date>. The rehearsals whose offset was
+    already in the former schema keep their former date (which the leveler
+    may have moved), and only the other ones are leveled (see <LoadLeveler>)"""
+
+    from TaskRescheduler import TaskRescheduler
+    from TickTickSchedulerClient import TickTickSchedulerClient
+
+    kept_positions = [None] * len(schema)
+    former_schema_data = storage_manager.fetch_schema_data(former_task_data.schema_id)
+
+    # The former dates can only be matched if they follow the former schema
+    if (
+        former_dates is not None
+        and former_schema_data is not None
+        and len(former_schema_data.schema) == len(former_dates)
+    ):
+        kept_positions, _ = TaskRescheduler.diff(former_schema_data.schema, schema)
+
+    leveled_positions = [
+        position
+        for position, kept_position in enumerate(kept_positions)
+        if kept_position is None
+    ]
+    leveled_dates = iter(
+        TickTickSchedulerClient.rehearsals_dates(
+            LoadLeveler(
+                DAILY_REHEARSALS_CAPACITY,
+                storage_manager.fetch_rehearsals_load(start_date),
+                start_date,
+            ).level([schema[position] for position in leveled_positions]),
+            start_date,
+        )
+    )
+
+    return [
+        (
+            former_dates[kept_position]
+            if kept_position is not None
+            else next(leveled_dates)
+        )
+        for kept_position in kept_positions
+    ]
+
+
+def plan_edit(task_local_id, title, project_id, priority, schema_id):
+    """This function plans the edition of a task that has been repeated
+    following a rehearsal schema, only sending the requests needed to go from
+    the former version of the task to the new one. Returns <None> if the task
+    cannot be edited yet"""
+
+    # The rehearsals of the task must all exist on TickTick to be edited : the
+    # missing ones can only come from the journaled operations, which are
+    # sent when the plan is executed
+    former_task_data = storage_manager.fetch_task_data(task_local_id)
+
+    if (
+        None in former_task_data.rehearsal_ids
+        and storage_manager.count_pending_operations() == 0
+    ):
+        print(Fore.RED + "Tâche pas encore envoyée à TickTick, réessayez plus tard\n")
+        return None
+
+    # This module pulls in <requests>, which is slow to import
+    from TickTickSchedulerClient import TickTickSchedulerClient
+
+    # We retrieve the new schema
+    schema_data = storage_manager.fetch_schema_data(schema_id)
+
+    # The former dates are unknown for tasks created before they were dated
+    start_date = former_task_data.start_date
+    former_dates = None
+
+    if start_date is not None and None not in former_task_data.rehearsal_dates:
+        former_dates = [
+            datetime.combine(task_date, time())
+            for task_date in former_task_data.rehearsal_dates
+        ]
+
+    # Undated tasks are rescheduled from today, as if they were recreated
+    else:
+        start_date = date.today()
+
+    new_dates = edited_dates(
+        former_task_data, former_dates, start_date, schema_data.schema
+    )
+    edition = TickTickSchedulerClient.plan_edit_tasks(
+        former_task_data, former_dates, title, project_id, priority, new_dates
     )
-    storage_manager.save_task(schema_data["id"], title, project_id, priority, tasks_ids)
 
-    print(Fore.GREEN + "Tâche créée avec succès\n")
+    def execute():
+        from TickTickSchedulerClient import BatchCreationError
+
+        # The journaled operations may create or edit the rehearsals of the
+        # task, so they are sent first and the edition is planned again
+        wait_for_outbox()
+        current_task_data = storage_manager.fetch_task_data(task_local_id)
+
+        if None in current_task_data.rehearsal_ids:
+            print(
+                Fore.RED + "Tâche pas encore envoyée à TickTick, réessayez plus tard\n"
+            )
+            return False
+
+        edition = TickTickSchedulerClient.plan_edit_tasks(
+            current_task_data, former_dates, title, project_id, priority, new_dates
+        )
+
+        print(Fore.YELLOW + "Modification de la tâche...")
+
+        # We edit the rehearsals on TickTick and then the task locally
+        try:
+            tasks_ids, failures = get_api_client().apply_edit_plan(
+                edition, title, project_id, priority
+            )
+
+        except BatchCreationError as error:
+            # The rehearsals that could not be deleted again are left to the outbox
+            with storage_manager.transaction():
+                for project_ID, task_ID in error.orphans:
+                    storage_manager.queue_remote_deletion(project_ID, task_ID)
+
+            get_outbox_worker().notify()
+
+            print(
+                Fore.RED
+                + "Impossible de créer les répétitions, la tâche n'a pas été modifiée\n"
+            )
+            return False
+
+        # The requests that failed are left to the outbox, along with the task
+        with storage_manager.transaction():
+            storage_manager.edit_task(
+                task_local_id,
+                schema_data.id,
+                title,
+                project_id,
+                priority,
+                tasks_ids,
+                start_date,
+                [task_date.date() for task_date in edition["dates"]],
+                edition["projects"],
+            )
+            storage_manager.queue_remote_operations(failures)
+
+        if len(failures) > 0:
+            get_outbox_worker().notify()
+
+            print(
+                Fore.RED
+                + f"Tâche modifiée, {len(failures)} répétition(s) seront mises à jour en arrière-plan\n"
+            )
+
+        else:
+            print(Fore.GREEN + "Tâche modifiée avec succès\n")
 
+        return True
 
-def batch_delete(task_local_id):
-    """This function deletes a task that has been repeated
-    following a rehearsal schema"""
+    plan = Plan(f"Modification de la tâche « {title} »", execute)
 
-    print(Fore.YELLOW + "Suppression de la tâche...")
+    for position in edition["creations"]:
+        plan.add("create", edition["dates"][position].date())
 
-    # First we retrieve the task corresponding to this local id
-    task_data = storage_manager.fetch_task_data(task_local_id)
+    for _, task_date, _ in edition["updates"]:
+        plan.add("update", task_date.date())
 
-    # We delete the task on TickTick and then locally
-    api_client.batch_delete_tasks(task_data["project_id"], task_data["rehearsal_ids"])
-    storage_manager.delete_task(task_data["id"])
+    plan.add("delete", count=len(edition["deletions"]))
 
-    print(Fore.GREEN + "Tâche supprimée avec succès\n")
+    return plan
+
+
+def batch_edit(task_local_id, title, project_id, priority, schema_id):
+    """This function edits a task that has been repeated following a rehearsal
+    schema (see <plan_edit>). Returns whether the task has been edited"""
+
+    plan = plan_edit(task_local_id, title, project_id, priority, schema_id)
+
+    return plan is not None and plan.execute()
 
 
 # -------------------------------------------------- MENUS --------------------------------------------------
 
 # Enumerations for the menus
 MainMenuChoices = Enum("MainMenuChoices", ["TASK", "SCHEMA", "QUIT"])
-TaskMenuChoices = Enum("TaskMenuChoices", ["CREATE", "EDIT", "DELETE", "QUIT"])
+TaskMenuChoices = Enum(
+    "TaskMenuChoices",
+    [
+        "CREATE",
+        "EDIT",
+        "DELETE",
+        "IMPORT",
+        "SYNC",
+        "SHOW_LOAD",
+        "REFRESH_PROJECTS",
+        "QUIT",
+    ],
+)
 SchemaMenuChoices = Enum("SchemaMenuChoices", ["CREATE", "EDIT", "DELETE", "QUIT"])
+BrowsingChoices = Enum(
+    "BrowsingChoices", ["SEARCH", "NEXT_PAGE", "PREVIOUS_PAGE", "VALIDATE"]
+)
 Priority = Enum(
     "Priority", [("NO_PRIORITY", 0), ("LOW", 1), ("MEDIUM", 3), ("HIGH", 5)]
 )
@@ -89,6 +593,8 @@ def prompt_task_data(title=None, project_id=None, schema_id=None, priority=None)
     """This function displays a menu prompting the user for all the information needed
     to create or edit a task. The arguments define default values."""
 
+    import inquirer
+
     return inquirer.prompt(
         [
             inquirer.Text(
@@ -100,7 +606,7 @@ def prompt_task_data(title=None, project_id=None, schema_id=None, priority=None)
                 list(
                     map(
                         lambda project: (project["name"], project["id"]),
-                        api_client.projects,
+                        get_api_client().projects,
                     )
                 ),
                 project_id,
@@ -138,21 +644,128 @@ def prompt_task_data(title=None, project_id=None, schema_id=None, priority=None)
     )
 
 
+def browse_tasks(message, multiple=False):
+    """This function lets the user browse the tasks page by page, and search
+    them by title : only the page displayed is read from the local database.
+    Returns the ID of the selected task, or the list of the IDs of the selected
+    tasks if <multiple> is set (<None> if the user has skipped the prompt)"""
+
+    import inquirer
+
+    menu_config = config["task_browsing_menu"]
+    search_text = ""
+    pages_starts = [None]  # Task each page starts after, for the pages displayed
+    selected_tasks_ids = []
+
+    while True:
+        # One more task is read, to know whether there is a next page
+        tasks = storage_manager.search_tasks(
+            search_text, TASKS_PAGE_SIZE + 1, pages_starts[-1]
+        )
+        has_next_page = len(tasks) > TASKS_PAGE_SIZE
+        tasks = tasks[:TASKS_PAGE_SIZE]
+
+        # The title tells which page of which search is displayed
+        details = [menu_config["page_message"].format(page=len(pages_starts))]
+
+        if search_text:
+            details.append(menu_config["search_label"].format(text=search_text))
+
+        title = f"{message} ({', '.join(details)})"
+
+        navigation_choices = [(menu_config["search_message"], BrowsingChoices.SEARCH)]
+
+        if has_next_page:
+            navigation_choices.append(
+                (menu_config["next_page_message"], BrowsingChoices.NEXT_PAGE)
+            )
+
+        if len(pages_starts) > 1:
+            navigation_choices.append(
+                (menu_config["previous_page_message"], BrowsingChoices.PREVIOUS_PAGE)
+            )
+
+        if len(tasks) == 0:
+            print(Fore.RED + menu_config["no_match_message"])
+
+        if multiple:
+            # The tasks checked on this page replace those formerly checked on it
+            if len(tasks) > 0:
+                page_tasks_ids = {task_id for _, task_id in tasks}
+                answer = inquirer.prompt(
+                    [
+                        inquirer.Checkbox(
+                            "selection",
+                            title,
+                            choices=tasks,
+                            default=[
+                                task_id
+                                for task_id in selected_tasks_ids
+                                if task_id in page_tasks_ids
+                            ],
+                        )
+                    ]
+                )
+
+                if answer is None:
+                    return None
+
+                selected_tasks_ids = [
+                    task_id
+                    for task_id in selected_tasks_ids
+                    if task_id not in page_tasks_ids
+                ] + answer["selection"]
+
+            navigation_choices.append(
+                (
+                    menu_config["validation_message"].format(
+                        count=len(selected_tasks_ids)
+                    ),
+                    BrowsingChoices.VALIDATE,
+                )
+            )
+            title = menu_config["navigation_message"]
+
+        answer = inquirer.prompt(
+            [
+                inquirer.List(
+                    "selection",
+                    title,
+                    choices=(tasks if not multiple else []) + navigation_choices,
+                )
+            ]
+        )
+
+        if answer is None:
+            return None
+
+        if answer["selection"] == BrowsingChoices.SEARCH:
+            search_text = inquirer.text(menu_config["search_prompt"]).strip()
+            pages_starts = [None]
+
+        elif answer["selection"] == BrowsingChoices.NEXT_PAGE:
+            pages_starts.append(tasks[-1][1])
+
+        elif answer["selection"] == BrowsingChoices.PREVIOUS_PAGE:
+            pages_starts.pop()
+
+        elif answer["selection"] == BrowsingChoices.VALIDATE:
+            return selected_tasks_ids
+
+        else:
+            return answer["selection"]
+
+
 def prompt_task_selection():
     """This function displays a menu prompting the user
     to select an existing task."""
+    return browse_tasks(config["task_selection_menu"]["message"])
 
-    answer = inquirer.prompt(
-        [
-            inquirer.List(
-                "selection",
-                config["task_selection_menu"]["message"],
-                choices=storage_manager.fetch_tasks_descriptors(),
-            )
-        ]
-    )
 
-    return answer["selection"] if answer is not None else None
+def prompt_tasks_multiselection():
+    """This function displays a menu prompting the user
+    to select any number of existing tasks."""
+    return browse_tasks(config["tasks_multiselection_menu"]["message"], multiple=True)
 
 
 def prompt_schema_data(name=None, schema_text=None):
@@ -160,6 +773,8 @@ def prompt_schema_data(name=None, schema_text=None):
     enter the needed data to create a new rehearsal schema.
     The arguments correspond to default values for each field."""
 
+    import inquirer
+
     # We prompt the raw data first
     data = inquirer.prompt(
         [
@@ -185,6 +800,8 @@ def prompt_schema_selection():
     """This function displays a menu prompting the user
     to select an existing rehearsal schema."""
 
+    import inquirer
+
     answer = inquirer.prompt(
         [
             inquirer.List(
@@ -198,163 +815,761 @@ def prompt_schema_selection():
     return answer["selection"] if answer is not None else None
 
 
-# -------------------------------------------------- MAIN APP -----------------------------------------------
+# -------------------------------------------------- HEADLESS MODE --------------------------------------------------
 
-continue_app = True  # Variable indicating whether we should stop the app or not
+# Priorities accepted on the command line
+PRIORITIES = {
+    "none": Priority.NO_PRIORITY.value,
+    "low": Priority.LOW.value,
+    "medium": Priority.MEDIUM.value,
+    "high": Priority.HIGH.value,
+}
 
-while continue_app:
-    # Main menu
-    main_menu_answer = inquirer.list_input(
-        config["main_menu"]["message"],
-        choices=[
-            (config["main_menu"]["task_message"], MainMenuChoices.TASK),
-            (config["main_menu"]["schema_message"], MainMenuChoices.SCHEMA),
-            (config["main_menu"]["quit_message"], MainMenuChoices.QUIT),
-        ],
+
+def resolve_project(project):
+    """This function returns the ID of a project, given its ID or its name.
+    Raises a <ValueError> if there is no such project"""
+
+    for candidate in get_api_client().projects:
+        if project in (candidate["id"], candidate["name"]):
+            return candidate["id"]
+
+    raise ValueError(f"matière inconnue « {project} »")
+
+
+def resolve_schema(schema):
+    """This function returns the ID of a rehearsal schema, given its ID or its
+    name. Raises a <ValueError> if there is no such schema"""
+
+    for name, schema_id in storage_manager.fetch_schemas_descriptors():
+        if schema in (str(schema_id), name):
+            return schema_id
+
+    raise ValueError(f"schéma inconnu « {schema} »")
+
+
+def should_execute(plan, options):
+    """This function tells whether a command should execute its plan (not if
+    <--dry-run> is given). Raises a <ValueError> if the plan sends more
+    requests than <--max-requests> allows"""
+
+    if options.dry_run:
+        return False
+
+    if options.max_requests is not None and plan.requests_count > options.max_requests:
+        raise ValueError(
+            f"{plan.requests_count} requête(s) prévue(s), plus que les {options.max_requests} autorisée(s)"
+        )
+
+    return True
+
+
+def command_task_create(options):
+    """This function creates a task from the command line"""
+
+    plan = plan_create(
+        options.title,
+        resolve_project(options.project),
+        PRIORITIES[options.priority],
+        resolve_schema(options.schema),
     )
 
-    # Task menu
-    if main_menu_answer == MainMenuChoices.TASK:
-        task_menu_answer = inquirer.list_input(
-            config["task_menu"]["message"],
-            choices=[
-                (config["task_menu"]["creation_message"], TaskMenuChoices.CREATE),
-                (config["task_menu"]["edition_message"], TaskMenuChoices.EDIT),
-                (config["task_menu"]["deletion_message"], TaskMenuChoices.DELETE),
-                (config["task_menu"]["quit_message"], TaskMenuChoices.QUIT),
-            ],
+    if not should_execute(plan, options):
+        return {"plan": plan.as_dict(throughput_profile())}
+
+    return {"id": plan.execute()}
+
+
+def command_task_edit(options):
+    """This function edits a task from the command line (the fields which are
+    not given are left unchanged)"""
+
+    task_data = storage_manager.fetch_task_data(options.id)
+
+    if task_data is None:
+        raise ValueError(f"tâche inconnue : {options.id}")
+
+    plan = plan_edit(
+        task_data.id,
+        options.title or task_data.title,
+        (
+            resolve_project(options.project)
+            if options.project is not None
+            else task_data.project_id
+        ),
+        (
+            PRIORITIES[options.priority]
+            if options.priority is not None
+            else task_data.priority
+        ),
+        (
+            resolve_schema(options.schema)
+            if options.schema is not None
+            else task_data.schema_id
+        ),
+    )
+
+    if plan is None:
+        raise ValueError(f"tâche pas encore envoyée à TickTick : {options.id}")
+
+    if not should_execute(plan, options):
+        return {"plan": plan.as_dict(throughput_profile())}
+
+    if not plan.execute():
+        raise ValueError("impossible de créer les répétitions")
+
+    return {"id": options.id}
+
+
+def command_task_delete(options):
+    """This function deletes tasks from the command line"""
+
+    unknown_tasks_ids = [
+        task_id
+        for task_id in options.ids
+        if storage_manager.fetch_task_data(task_id) is None
+    ]
+
+    if len(unknown_tasks_ids) > 0:
+        raise ValueError(
+            f"tâche(s) inconnue(s) : {', '.join(map(str, unknown_tasks_ids))}"
         )
 
-        # Task creation menu
-        if task_menu_answer == TaskMenuChoices.CREATE:
-            # Menu configuration and displaying
-            task_data = prompt_task_data(priority=Priority.MEDIUM.value)
-
-            # <None> means the user has skipped the prompt
-            if task_data is not None:
-                batch_create(
-                    task_data["title"],
-                    task_data["project_id"],
-                    task_data["priority"],
-                    task_data["schema_id"],
-                )
+    plan = plan_delete(options.ids)
 
-        elif task_menu_answer == TaskMenuChoices.EDIT:
-            if len(storage_manager.fetch_tasks_descriptors()) > 0:
-                edited_task_rank = prompt_task_selection()  # Selection of the task
-
-                if edited_task_rank is not None:
-                    former_task_data = storage_manager.fetch_task_data(
-                        edited_task_rank
-                    )  # Current task
-
-                    # We prompt the user for the updated information
-                    new_task_data = prompt_task_data(
-                        title=former_task_data["title"],
-                        project_id=former_task_data["project_id"],
-                        schema_id=former_task_data["schema_id"],
-                        priority=former_task_data["priority"],
-                    )
+    if not should_execute(plan, options):
+        return {"plan": plan.as_dict(throughput_profile())}
 
-                    if new_task_data is not None:
-                        # First, we have to delete the former tasks
-                        batch_delete(edited_task_rank)
+    plan.execute()
 
-                        # Then we recreate the tasks
-                        batch_create(
-                            new_task_data["title"],
-                            new_task_data["project_id"],
-                            new_task_data["priority"],
-                            new_task_data["schema_id"],
-                        )
+    return {"deleted": options.ids}
 
-            else:
-                print(Fore.RED + "Aucune tâche à éditer")
 
-        elif task_menu_answer == TaskMenuChoices.DELETE:
-            if len(storage_manager.fetch_tasks_descriptors()) > 0:
-                # We prompt the user to select an existing task
-                deleted_task_rank = prompt_task_selection()
+def command_task_import(options):
+    """This function imports tasks from a CSV or JSONL file from the command
+    line"""
 
-                # We delete the task if the process has not been cancelled by the user
-                if deleted_task_rank is not None and inquirer.confirm(
-                    config["task_deletion_message"]
-                ):
-                    batch_delete(deleted_task_rank)
+    if not os.path.isfile(options.path):
+        raise ValueError(f"fichier introuvable « {options.path} »")
+
+    plan = plan_import(options.path)
+
+    if not should_execute(plan, options):
+        return {"plan": plan.as_dict(throughput_profile())}
+
+    return plan.execute()
+
+
+def command_task_list(options):
+    """This function lists the tasks from the command line, as an iterator so
+    that they are written one at a time (see <write_result>)"""
+    return storage_manager.iter_tasks_overview()
+
+
+def command_schema_create(options):
+    """This function creates a rehearsal schema from the command line"""
+
+    try:
+        schema_id = storage_manager.save_schema(options.name, options.days)
+
+    except sqlite3.IntegrityError:
+        raise ValueError(f"le schéma « {options.name} » existe déjà")
+
+    return storage_manager.fetch_schema_data(schema_id).as_dict()
+
+
+def command_schema_edit(options):
+    """This function edits a rehearsal schema from the command line (the
+    fields which are not given are left unchanged)"""
+
+    schema_data = storage_manager.fetch_schema_data(resolve_schema(options.schema))
+    edition = (
+        schema_data.id,
+        options.name or schema_data.name,
+        options.days or list(schema_data.schema),
+    )
+
+    # Without rescheduling, the edition does not send any request
+    if options.reschedule:
+        plan = plan_reschedule(*edition)
+    else:
+        plan = Plan(
+            f"Modification du schéma « {edition[1]} »",
+            lambda: storage_manager.edit_schema(*edition),
+        )
+
+    if not should_execute(plan, options):
+        return {"plan": plan.as_dict(throughput_profile())}
+
+    try:
+        rescheduling = plan.execute()
+
+    except sqlite3.IntegrityError:
+        raise ValueError(f"le schéma « {options.name} » existe déjà")
+
+    return dict(
+        storage_manager.fetch_schema_data(schema_data.id).as_dict(),
+        rescheduling=rescheduling,
+    )
+
+
+def command_schema_list(options):
+    """This function lists the rehearsal schemas from the command line"""
+
+    return [schema_data.as_dict() for schema_data in storage_manager.iter_schemas()]
+
+
+def day_delta(text):
+    """This function parses a day of a rehearsal schema on the command line"""
+
+    if not text.isdigit():
+        raise ValueError(f"jour invalide « {text} »")
+
+    return int(text)
+
+
+def build_parser():
+    """This function returns the parser of the command line arguments. Without
+    command, the app runs its menus"""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Planificateur de répétitions")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="records the API calls and the queries, and dumps the metrics at exit",
+    )
+    parser.add_argument(
+        "--profile-format",
+        choices=("json", "prometheus"),
+        default="json",
+        help="format of the metrics (by default, json)",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="PATH",
+        help="file where the metrics are written (by default, the standard error)",
+    )
+
+    # Options of the commands sending requests to TickTick (see <Plan>)
+    planning_parser = argparse.ArgumentParser(add_help=False)
+    planning_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="returns the plan of the operation (requests, dates, duration) without executing it",
+    )
+    planning_parser.add_argument(
+        "--max-requests",
+        type=int,
+        metavar="N",
+        help="fails instead of executing the operation if it sends more than N requests",
+    )
+
+    commands = parser.add_subparsers(dest="command")
+
+    # Each command writes its result to the standard output, as JSON
+    task_parser = commands.add_parser("task", help="manages the tasks")
+    task_commands = task_parser.add_subparsers(dest="action", required=True)
+
+    task_create_parser = task_commands.add_parser(
+        "create", help="creates a task", parents=[planning_parser]
+    )
+    task_create_parser.add_argument("--title", required=True)
+    task_create_parser.add_argument(
+        "--project", required=True, help="ID or name of the project"
+    )
+    task_create_parser.add_argument(
+        "--schema", required=True, help="ID or name of the rehearsal schema"
+    )
+    task_create_parser.add_argument("--priority", choices=PRIORITIES, default="medium")
+    task_create_parser.set_defaults(handler=command_task_create)
+
+    task_edit_parser = task_commands.add_parser(
+        "edit", help="edits a task", parents=[planning_parser]
+    )
+    task_edit_parser.add_argument("id", type=int, metavar="ID")
+    task_edit_parser.add_argument("--title")
+    task_edit_parser.add_argument("--project", help="ID or name of the project")
+    task_edit_parser.add_argument("--schema", help="ID or name of the rehearsal schema")
+    task_edit_parser.add_argument("--priority", choices=PRIORITIES)
+    task_edit_parser.set_defaults(handler=command_task_edit)
+
+    task_delete_parser = task_commands.add_parser(
+        "delete", help="deletes tasks", parents=[planning_parser]
+    )
+    task_delete_parser.add_argument("ids", nargs="+", type=int, metavar="ID")
+    task_delete_parser.set_defaults(handler=command_task_delete)
+
+    task_import_parser = task_commands.add_parser(
+        "import",
+        help="imports tasks from a CSV or JSONL file",
+        parents=[planning_parser],
+    )
+    task_import_parser.add_argument(
+        "path", help="path of the file (columns title, project, priority, schema)"
+    )
+    task_import_parser.set_defaults(handler=command_task_import)
+
+    task_list_parser = task_commands.add_parser("list", help="lists the tasks")
+    task_list_parser.set_defaults(handler=command_task_list)
+
+    schema_parser = commands.add_parser("schema", help="manages the rehearsal schemas")
+    schema_commands = schema_parser.add_subparsers(dest="action", required=True)
+
+    schema_create_parser = schema_commands.add_parser(
+        "create", help="creates a rehearsal schema"
+    )
+    schema_create_parser.add_argument("name")
+    schema_create_parser.add_argument(
+        "days", nargs="+", type=day_delta, metavar="DAY", help="days of the rehearsals"
+    )
+    schema_create_parser.set_defaults(handler=command_schema_create)
+
+    schema_edit_parser = schema_commands.add_parser(
+        "edit", help="edits a rehearsal schema", parents=[planning_parser]
+    )
+    schema_edit_parser.add_argument("schema", help="ID or name of the schema")
+    schema_edit_parser.add_argument("--name")
+    schema_edit_parser.add_argument(
+        "--days",
+        nargs="+",
+        type=day_delta,
+        metavar="DAY",
+        help="days of the rehearsals",
+    )
+    schema_edit_parser.add_argument(
+        "--reschedule",
+        action="store_true",
+        help="moves the rehearsals of the tasks following the schema",
+    )
+    schema_edit_parser.set_defaults(handler=command_schema_edit)
+
+    schema_list_parser = schema_commands.add_parser(
+        "list", help="lists the rehearsal schemas"
+    )
+    schema_list_parser.set_defaults(handler=command_schema_list)
+
+    # Many commands can be run in a single process, so that the startup is
+    # only paid once
+    run_parser = commands.add_parser(
+        "run", help="runs the commands of a file, one per line"
+    )
+    run_parser.add_argument(
+        "path", help="path of the file (<-> for the standard input)"
+    )
+
+    return parser
+
+
+def run_command(options):
+    """This function runs a command, and returns a dictionary holding either its
+    result or its error"""
+
+    try:
+        return {"result": options.handler(options)}
 
+    except ValueError as error:
+        return {"error": str(error)}
+
+    # The API client exits when it cannot authenticate or fetch the projects,
+    # and the requests that are not retried raise : neither must stop the
+    # other commands
+    except SystemExit:
+        return {"error": "impossible de communiquer avec TickTick"}
+
+    except Exception as error:
+        # Those modules pull in <requests>, which is slow to import, so we
+        # only load them on failure
+        from requests import RequestException
+        from TickTickOAuth2 import AuthenticationError
+
+        if isinstance(error, AuthenticationError):
+            return {"error": str(error)}
+
+        if not isinstance(error, RequestException):
+            raise
+
+        return {"error": f"impossible de communiquer avec TickTick : {error}"}
+
+
+def write_result(result, output):
+    """This function writes the result of a command to <output>, as a line of
+    JSON. A result given as an iterator is written one item at a time, so that
+    it is never held in memory as a whole"""
+
+    items = result.get("result")
+
+    if not isinstance(items, Iterator):
+        print(json.dumps(result, ensure_ascii=False), file=output, flush=True)
+        return
+
+    # The list of items is written last, between the rest of the line and its end
+    head = {key: value for key, value in result.items() if key != "result"}
+    output.write(json.dumps({**head, "result": []}, ensure_ascii=False)[:-2])
+
+    for index, item in enumerate(items):
+        output.write((", " if index > 0 else "") + json.dumps(item, ensure_ascii=False))
+
+    print("]}", file=output, flush=True)
+
+
+def run_commands_file(path, output):
+    """This function runs the commands of a file (one per line, the empty lines
+    and those starting with <#> being skipped), even if some of them fail.
+    Returns whether they all succeeded"""
+
+    parser = build_parser()
+    succeeded = True
+
+    # The standard input must not be closed
+    if path == "-":
+        file = contextlib.nullcontext(sys.stdin)
+    else:
+        file = open(path, encoding="utf8")
+
+    with file as lines:
+        for line in lines:
+            line = line.strip()
+
+            if line == "" or line.startswith("#"):
+                continue
+
+            # The parser exits on invalid arguments, after explaining why
+            try:
+                options = parser.parse_args(shlex.split(line))
+
+            except (SystemExit, ValueError):
+                options = None
+
+            if options is None or not hasattr(options, "handler"):
+                result = {"error": "commande invalide"}
             else:
-                print(Fore.RED + "Aucune tâche à supprimer")
+                result = run_command(options)
+
+            # We tell which command each result comes from
+            write_result({"command": line, **result}, output)
+            succeeded = succeeded and "error" not in result
 
-    # Rehearsal schemas menu
-    elif main_menu_answer == MainMenuChoices.SCHEMA:
-        # Schema menu
-        schema_menu_answer = inquirer.list_input(
-            config["schema_menu"]["message"],
+    return succeeded
+
+
+# -------------------------------------------------- MAIN APP -----------------------------------------------
+
+
+def run_menus():
+    """This function runs the menus of the app, until the user quits it"""
+
+    global config
+
+    import inquirer
+
+    config = load_config()
+
+    continue_app = True  # Variable indicating whether we should stop the app or not
+
+    while continue_app:
+        # Main menu
+        main_menu_answer = inquirer.list_input(
+            config["main_menu"]["message"],
             choices=[
-                (
-                    config["schema_menu"]["creation_message"],
-                    SchemaMenuChoices.CREATE,
-                ),
-                (
-                    config["schema_menu"]["edition_message"],
-                    SchemaMenuChoices.EDIT,
-                ),
-                (
-                    config["schema_menu"]["deletion_message"],
-                    SchemaMenuChoices.DELETE,
-                ),
-                (
-                    config["schema_menu"]["quit_message"],
-                    SchemaMenuChoices.QUIT,
-                ),
+                (config["main_menu"]["task_message"], MainMenuChoices.TASK),
+                (config["main_menu"]["schema_message"], MainMenuChoices.SCHEMA),
+                (config["main_menu"]["quit_message"], MainMenuChoices.QUIT),
             ],
         )
 
-        if schema_menu_answer == SchemaMenuChoices.CREATE:
-            # Schema creation menu
-            new_schema_data = prompt_schema_data()
+        # Task menu
+        if main_menu_answer == MainMenuChoices.TASK:
+            task_menu_answer = inquirer.list_input(
+                config["task_menu"]["message"],
+                choices=[
+                    (config["task_menu"]["creation_message"], TaskMenuChoices.CREATE),
+                    (config["task_menu"]["edition_message"], TaskMenuChoices.EDIT),
+                    (config["task_menu"]["deletion_message"], TaskMenuChoices.DELETE),
+                    (config["task_menu"]["import_message"], TaskMenuChoices.IMPORT),
+                    (config["task_menu"]["sync_message"], TaskMenuChoices.SYNC),
+                    (config["task_menu"]["load_message"], TaskMenuChoices.SHOW_LOAD),
+                    (
+                        config["task_menu"]["projects_refresh_message"],
+                        TaskMenuChoices.REFRESH_PROJECTS,
+                    ),
+                    (config["task_menu"]["quit_message"], TaskMenuChoices.QUIT),
+                ],
+            )
+
+            # Task creation menu
+            if task_menu_answer == TaskMenuChoices.CREATE:
+                # Menu configuration and displaying
+                task_data = prompt_task_data(priority=Priority.MEDIUM.value)
+
+                # <None> means the user has skipped the prompt
+                if task_data is not None:
+                    plan = plan_create(
+                        task_data["title"],
+                        task_data["project_id"],
+                        task_data["priority"],
+                        task_data["schema_id"],
+                    )
 
-            if new_schema_data is not None:
-                # We add the schema to the local database
-                storage_manager.save_schema(
-                    new_schema_data["name"], new_schema_data["schema"]
-                )
+                    if confirm_plan(plan):
+                        plan.execute()
 
-                print(Fore.GREEN + "\nSchéma créé avec succès\n")
+            elif task_menu_answer == TaskMenuChoices.EDIT:
+                if storage_manager.count_tasks() > 0:
+                    edited_task_rank = prompt_task_selection()  # Selection of the task
 
-        elif schema_menu_answer == SchemaMenuChoices.EDIT:
-            schema_rank = prompt_schema_selection()  # Schema selection menu
+                    if edited_task_rank is not None:
+                        former_task_data = storage_manager.fetch_task_data(
+                            edited_task_rank
+                        )  # Current task
 
-            if schema_rank is not None:
-                former_schema_data = storage_manager.fetch_schema_data(schema_rank)
+                        # We prompt the user for the updated information
+                        new_task_data = prompt_task_data(
+                            title=former_task_data.title,
+                            project_id=former_task_data.project_id,
+                            schema_id=former_task_data.schema_id,
+                            priority=former_task_data.priority,
+                        )
+
+                        if new_task_data is not None:
+                            # Only the rehearsals that differ are sent to TickTick
+                            plan = plan_edit(
+                                edited_task_rank,
+                                new_task_data["title"],
+                                new_task_data["project_id"],
+                                new_task_data["priority"],
+                                new_task_data["schema_id"],
+                            )
+
+                            if plan is not None and confirm_plan(plan):
+                                plan.execute()
+
+                else:
+                    print(Fore.RED + "Aucune tâche à éditer")
+
+            elif task_menu_answer == TaskMenuChoices.DELETE:
+                if storage_manager.count_tasks() > 0:
+                    # We prompt the user to select existing tasks
+                    deleted_tasks_ranks = prompt_tasks_multiselection()
+
+                    # We delete the tasks if the process has not been cancelled by the user
+                    if deleted_tasks_ranks and inquirer.confirm(
+                        config["task_deletion_message"].format(
+                            count=len(deleted_tasks_ranks)
+                        )
+                    ):
+                        plan = plan_delete(deleted_tasks_ranks)
 
-                # We prompt the user to type in the new data
-                new_schema_data = prompt_schema_data(
-                    former_schema_data["name"],
-                    " ".join(
-                        [str(day_delta) for day_delta in former_schema_data["schema"]]
+                        if confirm_plan(plan):
+                            plan.execute()
+
+                else:
+                    print(Fore.RED + "Aucune tâche à supprimer")
+
+            elif task_menu_answer == TaskMenuChoices.IMPORT:
+                import_path = inquirer.text(config["task_import_message"])
+
+                if import_path and os.path.isfile(import_path):
+                    plan = plan_import(import_path)
+
+                    if confirm_plan(plan):
+                        plan.execute()
+
+                else:
+                    print(Fore.RED + "Fichier introuvable\n")
+
+            elif task_menu_answer == TaskMenuChoices.SYNC:
+                synchronize()
+
+            elif task_menu_answer == TaskMenuChoices.SHOW_LOAD:
+                display_rehearsals_load()
+
+            elif task_menu_answer == TaskMenuChoices.REFRESH_PROJECTS:
+                # The cached projects are replaced by those currently on TickTick
+                if get_api_client().refresh_projects(storage_manager):
+                    print(Fore.GREEN + "Matières actualisées avec succès\n")
+                else:
+                    print(Fore.RED + "Impossible de récupérer les projets\n")
+
+        # Rehearsal schemas menu
+        elif main_menu_answer == MainMenuChoices.SCHEMA:
+            # Schema menu
+            schema_menu_answer = inquirer.list_input(
+                config["schema_menu"]["message"],
+                choices=[
+                    (
+                        config["schema_menu"]["creation_message"],
+                        SchemaMenuChoices.CREATE,
                     ),
-                )
+                    (
+                        config["schema_menu"]["edition_message"],
+                        SchemaMenuChoices.EDIT,
+                    ),
+                    (
+                        config["schema_menu"]["deletion_message"],
+                        SchemaMenuChoices.DELETE,
+                    ),
+                    (
+                        config["schema_menu"]["quit_message"],
+                        SchemaMenuChoices.QUIT,
+                    ),
+                ],
+            )
+
+            if schema_menu_answer == SchemaMenuChoices.CREATE:
+                # Schema creation menu
+                new_schema_data = prompt_schema_data()
 
                 if new_schema_data is not None:
-                    # We change the data stored in the local database
-                    storage_manager.edit_schema(
-                        schema_rank, new_schema_data["name"], new_schema_data["schema"]
+                    # We add the schema to the local database
+                    storage_manager.save_schema(
+                        new_schema_data["name"], new_schema_data["schema"]
+                    )
+
+                    print(Fore.GREEN + "\nSchéma créé avec succès\n")
+
+            elif schema_menu_answer == SchemaMenuChoices.EDIT:
+                schema_rank = prompt_schema_selection()  # Schema selection menu
+
+                if schema_rank is not None:
+                    former_schema_data = storage_manager.fetch_schema_data(schema_rank)
+
+                    # We prompt the user to type in the new data
+                    new_schema_data = prompt_schema_data(
+                        former_schema_data.name,
+                        " ".join(
+                            [str(day_delta) for day_delta in former_schema_data.schema]
+                        ),
                     )
 
+                    if new_schema_data is not None:
+                        tasks_count = storage_manager.count_schema_tasks(schema_rank)
+
+                        # The tasks following the schema may be moved along with it
+                        if (
+                            tuple(new_schema_data["schema"])
+                            != former_schema_data.schema
+                            and tasks_count > 0
+                            and inquirer.confirm(
+                                config["schema_reschedule_message"].format(
+                                    count=tasks_count
+                                )
+                            )
+                        ):
+                            plan = plan_reschedule(
+                                schema_rank,
+                                new_schema_data["name"],
+                                new_schema_data["schema"],
+                            )
+
+                        else:
+                            # We change the data stored in the local database
+                            plan = Plan(
+                                f"Modification du schéma « {new_schema_data['name']} »",
+                                lambda: storage_manager.edit_schema(
+                                    schema_rank,
+                                    new_schema_data["name"],
+                                    new_schema_data["schema"],
+                                ),
+                            )
+
+                        if confirm_plan(plan):
+                            plan.execute()
+
+                            print(Fore.GREEN + "\nSchéma édité avec succès\n")
+
+            elif schema_menu_answer == SchemaMenuChoices.DELETE:
+                # We prompt the user to select the schema he wants to delete
+                deleted_schema_rank = prompt_schema_selection()
+
+                # We delete the schema in the local database
+                if deleted_schema_rank is not None and inquirer.confirm(
+                    config["schema_deletion_message"]
+                ):
+                    storage_manager.delete_schema(deleted_schema_rank)
+
                     print(Fore.GREEN + "\nSchéma édité avec succès\n")
 
-        elif schema_menu_answer == SchemaMenuChoices.DELETE:
-            # We prompt the user to select the schema he wants to delete
-            deleted_schema_rank = prompt_schema_selection()
+        else:
+            continue_app = False
 
-            # We delete the schema in the local database
-            if deleted_schema_rank is not None and inquirer.confirm(
-                config["schema_deletion_message"]
-            ):
-                storage_manager.delete_schema(deleted_schema_rank)
 
-                print(Fore.GREEN + "\nSchéma édité avec succès\n")
+def stop_outbox_worker():
+    """This function stops the worker sending the journaled operations, after
+    it has had some time to send them. Nothing is sent if no operation has
+    been executed (the worker has not been started then)"""
 
-    else:
-        continue_app = False
+    # The operations that could not be sent are kept for the next run
+    if _outbox_worker is not None:
+        pending_operations_count = wait_for_outbox(OUTBOX_EXIT_TIMEOUT)
+        _outbox_worker.stop()
+
+        if pending_operations_count > 0:
+            _outbox_worker.report_errors(storage_manager)
+            print(
+                Fore.RED
+                + f"{pending_operations_count} opération(s) en attente, elles seront envoyées au prochain lancement"
+            )
+
+
+def main(arguments=None):
+    """This function runs the app : either the given command (see
+    <build_parser>), or the menus until the user quits them. Returns the exit
+    status of the app"""
+
+    global storage_manager, interactive
+
+    options = build_parser().parse_args(arguments)
+
+    # Without menus, nobody may be there to authenticate (and the standard
+    # input may hold the commands)
+    interactive = options.command is None
+
+    # The metrics have to be enabled before anything is recorded
+    if options.profile:
+        import atexit
+
+        Metrics.enable()
+        atexit.register(Metrics.export, options.profile_format, options.profile_output)
+
+    init(autoreset=True)  # Initialization for colorama
+
+    # Without menus, only the results of the commands go to the standard
+    # output, so that they can be parsed : the messages go to the standard error
+    output = sys.stdout
+    messages = sys.stdout if options.command is None else sys.stderr
+    succeeded = True
+
+    with contextlib.redirect_stdout(messages):
+        storage_manager = StorageManager()
+
+        # The operations left by a former run are sent along with the first
+        # action needing the API client, so that local-only actions (and
+        # commands) never touch the network
+        if options.command is None:
+            pending_operations_count = storage_manager.count_pending_operations()
+
+            if pending_operations_count > 0:
+                print(
+                    Fore.YELLOW
+                    + f"{pending_operations_count} opération(s) en attente, elles seront envoyées à la prochaine action sur TickTick\n"
+                )
+
+            run_menus()
+
+        elif options.command == "run":
+            succeeded = run_commands_file(options.path, output)
+
+        else:
+            result = run_command(options)
+            write_result(result, output)
+            succeeded = "error" not in result
+
+        stop_outbox_worker()
+
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())